@@ -24,4 +24,10 @@ docker network create tikzit_net || true
 echo "📚 Creating Docs Volume..."
 docker volume create tikzit_docs
 
+# 5. Create the secret that signs session tokens (see scripts/vnc_gateway.py)
+if ! grep -qE '^GATEWAY_SECRET=.+' ~/tikzit_deployment/.env 2>/dev/null; then
+    echo "🔐 Generating GATEWAY_SECRET..."
+    echo "GATEWAY_SECRET=$(openssl rand -hex 32)" >> ~/tikzit_deployment/.env
+fi
+
 echo "✅ Setup Complete. You are ready to run docker compose up."
\ No newline at end of file
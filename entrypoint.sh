@@ -1,6 +1,16 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
+# startup timeline: each phase is one JSON line, read by scripts/boot_profile.py;
+# session_ready.py appends the desktop's phases under the same boot id
+TIMELINE=/var/log/session_timeline.jsonl
+SESSION_BOOT="$(hostname)-${EPOCHREALTIME%.*}"
+echo "$SESSION_BOOT" > /var/log/session_boot
+mark() {
+  printf '{"boot": "%s", "event": "%s", "at": %s}\n' "$SESSION_BOOT" "$1" "$EPOCHREALTIME" >> "$TIMELINE"
+}
+mark entrypoint
+
 # default env vars
 if [ -z "$VNC_PASSWORD" ]; then
   echo "ERROR: VNC_PASSWORD environment variable is not set!"
@@ -15,21 +25,23 @@ USER_HOME="/home/$VNC_USER"
 if ! id "$VNC_USER" >/dev/null 2>&1; then
   useradd -m -s /bin/bash "$VNC_USER"
 fi
+chown "$VNC_USER:$VNC_USER" "$TIMELINE"
 
 # create vnc password
 mkdir -p "$USER_HOME/.vnc"
 echo "$VNC_PASSWORD" | vncpasswd -f > "$USER_HOME/.vnc/passwd"
 chown -R "$VNC_USER:$VNC_USER" "$USER_HOME/.vnc"
 chmod 600 "$USER_HOME/.vnc/passwd"
+mark vnc_password
 
-# create xstartup to launch XFCE and tikzit in the X session
 # create xstartup to launch XFCE and tikzit in the X session
 cat > "$USER_HOME/.vnc/xstartup" <<'EOF'
 #!/bin/sh
 xrdb $HOME/.Xresources
 
-# 1. Start TikZiT in the BACKGROUND with a delay so XFCE loads first
-(sleep 3 && /usr/local/bin/tikzit &>/tmp/tikzit.log) &
+# 1. Start TikZiT in the BACKGROUND as soon as X, the window manager and
+# websockify are up (session_ready.py logs when each one was)
+/usr/local/bin/session_ready.py -- /usr/local/bin/tikzit >/tmp/tikzit.log 2>&1 &
 
 # 2. Start XFCE in the FOREGROUND (Do NOT use '&')
 # This keeps the container running.
@@ -38,6 +50,7 @@ EOF
 
 chown "$VNC_USER:$VNC_USER" "$USER_HOME/.vnc/xstartup"
 chmod +x "$USER_HOME/.vnc/xstartup"
+mark xstartup
 
 rm -rf /tmp/.X11-unix /tmp/.X*-lock
 mkdir -p /tmp/.X11-unix
@@ -49,6 +62,10 @@ if [ ! -d /opt/noVNC ]; then
   git clone --depth 1 --branch v1.4.0 https://github.com/novnc/noVNC.git /opt/noVNC
   git clone --depth 1 https://github.com/novnc/websockify.git /opt/noVNC/utils/websockify
 fi
+mark novnc
+
+# supervisord logs when it spawns each program and when it is RUNNING
+mark supervisord
 
 # start supervisord (will start vncserver and novnc)
 exec "$@"
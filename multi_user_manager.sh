@@ -1,4 +1,6 @@
 #!/bin/bash
+# Creates one user interactively. To onboard many users at once (concurrent
+# container starts, a single nginx reload) use scripts/provision_users.py.
 
 # CONFIGURATION
 IMAGE_NAME="registry.digitalocean.com/mgb-uml/tikzit:latest"
@@ -23,6 +25,11 @@ if [[ ! "$USERNAME" =~ ^[a-z0-9]+$ ]]; then
     echo "❌ Invalid username. Use lowercase letters and numbers only."
     exit 1
 fi
+case "$USERNAME" in
+    default|docs|proxy)
+        echo "❌ '$USERNAME' is reserved. Choose another username."
+        exit 1 ;;
+esac
 
 CONTAINER_NAME="tikzit_$USERNAME"
 
@@ -47,35 +54,15 @@ docker run -d \
   -v "tikzit_data_$USERNAME:/home/tikzituser/.local/share/tikzit" \
   $IMAGE_NAME
 
-# 4. Create Nginx Routing Config
-# This proxies domain.com/username/ -> container:8080/vnc.html
+# 4. Add the user to the Nginx routing table
+# One generated map (user_configs/tikzit.routes) routes domain.com/username/ ->
+# container:8080; it is checked with `nginx -t` before the proxy reloads it
 echo "🔗 configuring Nginx route..."
-
-cat > "$CONFIG_DIR/$USERNAME.conf" <<EOF
-# Redirect clean URL -> Magic URL
-location = /$USERNAME/ {
-    return 301 https://\$host/$USERNAME/vnc.html?path=$USERNAME/websockify;
-}
-
-# Handle the traffic
-location /$USERNAME/ {
-    proxy_pass http://$CONTAINER_NAME:8080/;
-    
-    proxy_http_version 1.1;
-    proxy_set_header Upgrade \$http_upgrade;
-    proxy_set_header Connection "Upgrade";
-    proxy_set_header Host \$host;
-    
-    proxy_cookie_path / /$USERNAME/;
-}
-EOF
-
-# 5. Reload Nginx
-echo "🔄 Reloading Proxy..."
-docker exec tikzit_proxy nginx -s reload
+python3 "$(dirname "$0")/scripts/nginx_routes.py" --add "$USERNAME" --config-dir "$CONFIG_DIR" --reload || exit 1
 
 echo "------------------------------------------------"
 echo "✅ SUCCESS!"
-# We add the ?path=... parameter to ensure the websocket routes correctly
-echo "Access URL: https://mgb-uml.me/$USERNAME/vnc.html?path=$USERNAME/websockify"
+# We add the ?path=... parameter to ensure the websocket routes correctly;
+# it carries the token the websocket gateway (scripts/vnc_gateway.py) checks
+echo "Access URL: $(python3 "$(dirname "$0")/scripts/vnc_gateway.py" url "$USERNAME")"
 echo "------------------------------------------------"
\ No newline at end of file
@@ -14,14 +14,31 @@ echo "----------------------------------------------------"
 
 # 1. RUN TESTS FIRST
 echo "🧪 Running Python Unit Tests..."
-if command -v pytest &> /dev/null; then
-    pytest tests/deployment/ || { echo "❌ Tests Failed!"; exit 1; }
+# test classes run in parallel (one worker per CPU); the report lands in test-report.xml,
+# which is git-ignored: a partial run must not replace the checked-in test-results.xml
+# only classes affected by changes since the last release run, slowest first. The times
+# are merged into test-durations.xml, which keeps those of the classes a run skipped.
+TEST_CMD="python3 tests/deployment/run_tests.py --jobs 0 --durations test-durations.xml --junit-xml test-report.xml"
+LAST_RELEASE=$(git describe --tags --abbrev=0 --match 'v*' 2>/dev/null || true)
+if [ -n "$LAST_RELEASE" ]; then TEST_CMD="$TEST_CMD --changed-since $LAST_RELEASE"; fi
+if command -v python3 &> /dev/null && python3 -c "import yaml" &> /dev/null; then
+    $TEST_CMD || { echo "❌ Tests Failed!"; exit 1; }
 else
     docker run --rm -v "$PWD":/app -w /app python:3.9 \
-        /bin/bash -c "pip install -r tests/requirements.txt && pip install pytest && pytest tests/deployment/" \
+        /bin/bash -c "pip install -r tests/requirements.txt && $TEST_CMD" \
         || { echo "❌ Tests Failed!"; exit 1; }
 fi
 echo "✅ Tests Passed."
+# keep the timings of every run; a test far slower than its own history blocks the release
+if command -v python3 &> /dev/null; then
+    python3 scripts/junit_history.py ingest test-report.xml
+    if ! python3 scripts/junit_history.py check; then
+        if [ -z "$ALLOW_SLOW_TESTS" ]; then
+            echo "❌ Test durations regressed! (ALLOW_SLOW_TESTS=1 releases anyway)"; exit 1
+        fi
+        echo "⚠️  Test durations regressed; releasing anyway (ALLOW_SLOW_TESTS is set)"
+    fi
+fi
 
 # 2. AUTO-INCREMENT VERSION
 if [ -f VERSION ]; then CURRENT_VERSION=$(cat VERSION); else CURRENT_VERSION="0.0.0"; fi
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""Benchmark the nginx user routing layouts at growing user counts.
+
+Two layouts are compared:
+
+- legacy: one user_configs/<user>.conf per user, holding a `location = /<user>/`
+  redirect and a `location /<user>/` proxy;
+- map: the one generated tikzit.routes table (scripts/nginx_routes.py) behind
+  two `map` blocks and a single generic location, as in nginx.conf.
+
+For each count, the configuration is written to a temporary prefix. The
+reload cost is the time of `nginx -t` on it when an nginx binary is
+available. Without one, the stand-in is the time to read and tokenize the
+configuration with its includes, which is the part of a reload that grows with
+the user count. Request matching is always measured on a stand-in. The legacy
+stand-in does a longest-prefix search over sorted prefixes, as nginx's static
+location tree does. The map stand-in does one regex match and one hash lookup.
+Both stand-ins must route every sample URI to the same place.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import json
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import nginx_routes
+from provision_users import container_name, write_atomic
+
+
+SIZES = (10, 100, 1000)
+SAMPLE_REQUESTS = 2000
+
+MAIN_CONFIG = """events {{ worker_connections 1024; }}
+
+http {{
+    upstream tikzit_backend {{ server 127.0.0.1:8080; }}
+{maps}
+    server {{
+        listen 127.0.0.1:8443;
+        resolver 127.0.0.11 valid=10s ipv6=off;
+
+        include conf.d/*.conf;
+
+        location @tikzit_wake {{
+            proxy_pass http://127.0.0.1:8090;
+            proxy_set_header X-Original-URI $request_uri;
+        }}
+{generic}
+        location / {{
+{dispatch}            proxy_pass http://tikzit_backend/;
+        }}
+    }}
+}}
+"""
+
+MAPS = """
+    map $uri $tikzit_route_user {
+        ~^/(?<user>[a-z0-9]+)/ $user;
+        default "";
+    }
+    map $tikzit_route_user $tikzit_upstream {
+        default "";
+        include conf.d/*.routes;
+    }
+"""
+
+GENERIC_LOCATION = """
+        location @tikzit_user {
+            if ($uri ~ ^/[a-z0-9]+/$) {
+                return 301 https://$host/$tikzit_route_user/vnc.html?path=$tikzit_route_user/websockify;
+            }
+            rewrite ^/[a-z0-9]+/(.*)$ /$1 break;
+            proxy_pass http://$tikzit_upstream:8080;
+            proxy_http_version 1.1;
+            proxy_set_header Upgrade $http_upgrade;
+            proxy_set_header Connection "Upgrade";
+            proxy_cookie_path / /$tikzit_route_user/;
+            recursive_error_pages on;
+            error_page 502 504 = @tikzit_wake;
+        }
+"""
+
+DISPATCH = """            error_page 418 = @tikzit_user;
+            if ($tikzit_upstream) {
+                return 418;
+            }
+"""
+
+TOKEN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|#[^\n]*|[{};]|[^\s{};"\'#]+')
+
+
+def usernames(count: int) -> list[str]:
+    return [f"student{i:04d}" for i in range(count)]
+
+
+def legacy_location(username: str) -> str:
+    """The per-user route file multi_user_manager.sh wrote before the routing table."""
+    return f"""{nginx_routes.LEGACY_MARKER}
+location = /{username}/ {{
+    return 301 https://$host/{username}/vnc.html?path={username}/websockify;
+}}
+
+# Handle the traffic
+location /{username}/ {{
+    set $tikzit_user {container_name(username)};
+    rewrite ^/{username}/(.*)$ /$1 break;
+    proxy_pass http://$tikzit_user:8080;
+
+    proxy_http_version 1.1;
+    proxy_set_header Upgrade $http_upgrade;
+    proxy_set_header Connection "Upgrade";
+    proxy_set_header Host $host;
+
+    proxy_cookie_path / /{username}/;
+
+    error_page 502 504 = @tikzit_wake;
+}}
+"""
+
+
+def write_layout(prefix: Path, layout: str, users: list[str]) -> Path:
+    """Write a complete configuration under `prefix`; returns the main file."""
+    conf_d = prefix / "conf.d"
+    conf_d.mkdir(parents=True)
+    if layout == "legacy":
+        for username in users:
+            (conf_d / f"{username}.conf").write_text(legacy_location(username), encoding="utf-8")
+        text = MAIN_CONFIG.format(maps="", generic="", dispatch="")
+    else:
+        (conf_d / nginx_routes.ROUTES_FILE).write_text(nginx_routes.render_routes(users), encoding="utf-8")
+        text = MAIN_CONFIG.format(maps=MAPS, generic=GENERIC_LOCATION, dispatch=DISPATCH)
+    main = prefix / "nginx.conf"
+    main.write_text(text, encoding="utf-8")
+    return main
+
+
+def load_config(path: Path, prefix: Path) -> int:
+    """Read `path` and its includes the way nginx does; returns the tokens parsed."""
+    tokens = 0
+    words = []
+    for match in TOKEN.finditer(path.read_text(encoding="utf-8")):
+        token = match.group()
+        if token.startswith("#"):
+            continue
+        tokens += 1
+        if token == ";" and words[:1] == ["include"]:
+            for included in sorted(prefix.glob(words[1])):
+                tokens += load_config(included, prefix)
+        if token in "{};":
+            words = []
+        else:
+            words.append(token)
+    return tokens
+
+
+def nginx_test(nginx: str, main: Path) -> None:
+    result = subprocess.run([nginx, "-t", "-q", "-p", str(main.parent), "-c", main.name, "-e", "stderr"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"nginx -t: {result.stderr.strip()}")
+
+
+def best_of(fn, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+class LegacyMatcher:
+    """Exact locations, then the longest matching prefix location."""
+
+    def __init__(self, users: list[str]):
+        self.exact = {f"/{u}/": "redirect" for u in users}
+        self.prefixes = sorted(f"/{u}/" for u in users)
+        self.upstreams = {f"/{u}/": container_name(u) for u in users}
+
+    def route(self, uri: str) -> str:
+        if uri in self.exact:
+            return self.exact[uri]
+        # no user prefix contains another, so the only candidate sorts just before `uri`
+        i = bisect.bisect_right(self.prefixes, uri)
+        if i and uri.startswith(self.prefixes[i - 1]):
+            return self.upstreams[self.prefixes[i - 1]]
+        return "tikzit_backend"
+
+
+class MapMatcher:
+    """`map $uri $tikzit_route_user` followed by the hash table of the routes file."""
+
+    SEGMENT = re.compile(r"^/(?P<user>[a-z0-9]+)/")
+
+    def __init__(self, routes_text: str):
+        self.table = nginx_routes.parse_routes(routes_text)
+
+    def route(self, uri: str) -> str:
+        match = self.SEGMENT.match(uri)
+        upstream = self.table.get(match.group("user")) if match else None
+        if upstream is None:
+            return "tikzit_backend"
+        return "redirect" if uri == f"/{match.group('user')}/" else upstream
+
+
+def sample_uris(users: list[str], count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    paths = ("", "vnc.html", "websockify", "app/ui.js")
+    uris = [f"/{rng.choice(users)}/{rng.choice(paths)}" for _ in range(count * 3 // 4)]
+    uris += [rng.choice(("/", "/vnc.html", "/docs/index.html", "/nobody/websockify"))
+             for _ in range(count - len(uris))]
+    rng.shuffle(uris)
+    return uris
+
+
+def bench_size(count: int, work: Path, repeat: int, nginx: str | None) -> dict[str, dict]:
+    users = usernames(count)
+    uris = sample_uris(users, SAMPLE_REQUESTS)
+    matchers = {"legacy": LegacyMatcher(users), "map": MapMatcher(nginx_routes.render_routes(users))}
+    expected = [matchers["legacy"].route(uri) for uri in uris]
+    if [matchers["map"].route(uri) for uri in uris] != expected:
+        raise RuntimeError(f"{count} users: the layouts route requests differently")
+
+    results = {}
+    for layout, matcher in matchers.items():
+        prefix = work / f"{count}-{layout}"
+        main = write_layout(prefix, layout, users)
+        files = sorted(p for p in prefix.rglob("*") if p.is_file())
+        if nginx:
+            reload = best_of(lambda: nginx_test(nginx, main), repeat)
+        else:
+            reload = best_of(lambda: load_config(main, prefix), repeat)
+        match = best_of(lambda: [matcher.route(uri) for uri in uris], repeat)
+        results[f"{count}/{layout}"] = {
+            "users": count,
+            "files": len(files),
+            "config_bytes": sum(p.stat().st_size for p in files),
+            "reload_seconds": reload,
+            "match_ns": match / len(uris) * 1e9,
+        }
+    return results
+
+
+def run_benchmarks(sizes, repeat: int, nginx: str | None) -> dict[str, dict]:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sizes:
+            results.update(bench_size(count, Path(tmp), repeat, nginx))
+    return results
+
+
+def format_results(results: dict[str, dict], reload_method: str) -> str:
+    lines = [f"{'layout':14} {'files':>6} {'config KB':>10} {'reload ms':>10} {'match ns':>9}",
+             f"(reload: {reload_method}; match: stand-in)"]
+    for name, r in sorted(results.items(), key=lambda item: (item[1]["users"], item[0])):
+        lines.append(f"{name:14} {r['files']:6d} {r['config_bytes'] / 1e3:10.1f} "
+                     f"{r['reload_seconds'] * 1e3:10.2f} {r['match_ns']:9.0f}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark per-user nginx locations against the routing map")
+    parser.add_argument("--users", type=int, nargs="+", default=list(SIZES), help="User counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the fastest is kept")
+    parser.add_argument("--nginx", default=shutil.which("nginx"),
+                        help="nginx binary for `nginx -t` (default: from PATH)")
+    parser.add_argument("--no-nginx", action="store_true", help="Use the parsing stand-in even if nginx exists")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    nginx = None if args.no_nginx else args.nginx
+    try:
+        results = run_benchmarks(args.users, max(1, args.repeat), nginx)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    print(format_results(results, "nginx -t" if nginx else "config parse stand-in"))
+    if args.json:
+        write_atomic(args.json, json.dumps(results, indent=2, sort_keys=True) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""Benchmark SDK packaging against the real tree and a scaled synthetic one.
+
+Each stage (staging the tree, the staged zip/tar.gz writers and the streaming
+writers) is timed separately together with the bytes the process read and
+wrote and the size of what it produced. Results are appended to a JSON history
+file and compared with the median of the previous runs, so a slowdown or
+archive growth beyond the threshold is flagged.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import package_sdk
+
+
+# Compare against the median of this many previous runs of the same benchmark.
+BASELINE_RUNS = 5
+
+
+def process_io() -> tuple[int, int] | None:
+    """Bytes read and written by this process so far (Linux only)."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return None
+    return int(fields["rchar"]), int(fields["wchar"])
+
+
+def tree_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def measure(fn, repeat: int) -> dict:
+    """Run `fn` `repeat` times and keep the fastest sample; `fn` returns what it produced."""
+    best = None
+    for _ in range(repeat):
+        before = process_io()
+        start = time.perf_counter()
+        produced = fn()
+        seconds = time.perf_counter() - start
+        after = process_io()
+        sample = {
+            "seconds": seconds,
+            "bytes_read": after[0] - before[0] if before else None,
+            "bytes_written": after[1] - before[1] if before else None,
+            "output_bytes": tree_size(produced) if produced.is_dir() else produced.stat().st_size,
+        }
+        if best is None or sample["seconds"] < best["seconds"]:
+            best = sample
+    return best
+
+
+def make_synthetic_tree(root: Path, headers: int) -> None:
+    """A tree shaped like the repository, with `headers` plugin headers that include each other."""
+    data = root / "src" / "data"
+    data.mkdir(parents=True)
+    body = "".join(f"    virtual int method{i}(const QString &name, qreal scale) = 0;\n" for i in range(40))
+    for i in range(headers):
+        include = f'#include "h{i // 2}.h"\n' if i else ""
+        (data / f"h{i}.h").write_text(
+            f"#ifndef H{i}_H\n#define H{i}_H\n{include}#include <QString>\n\n"
+            f"class Synthetic{i}\n{{\npublic:\n{body}}};\n\n#endif\n")
+    for name in ("docs", "templates"):
+        (root / "sdk" / name).mkdir(parents=True)
+    for i in range(20):
+        (root / "sdk" / "docs" / f"page{i}.md").write_text(f"# Page {i}\n\n" + "Plugin documentation. " * 200)
+    (root / "sdk" / "README.md").write_text("# Synthetic SDK\n")
+    (root / "COPYING").write_bytes((package_sdk.ROOT / "COPYING").read_bytes())
+    (root / "VERSION.txt").write_text("0.0.0\n")
+
+
+@contextlib.contextmanager
+def sdk_inputs(root: Path, headers: list[Path]):
+    """Point package_sdk at another tree for the duration of the block."""
+    names = ("ROOT", "SDK_SOURCE_DIRS", "SDK_SOURCE_FILES", "PLUGIN_HEADER_FILES")
+    saved = {name: getattr(package_sdk, name) for name in names}
+    package_sdk.ROOT = root
+    package_sdk.SDK_SOURCE_DIRS = [root / "sdk" / "docs", root / "sdk" / "templates"]
+    package_sdk.SDK_SOURCE_FILES = [root / "sdk" / "README.md", root / "COPYING", root / "VERSION.txt"]
+    package_sdk.PLUGIN_HEADER_FILES = headers
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(package_sdk, name, value)
+
+
+def bench_tree(name: str, work: Path, repeat: int, jobs: int) -> dict[str, dict]:
+    results = {}
+    stage = work / "stage"
+    platform_name = "bench"
+
+    def build_tree():
+        shutil.rmtree(stage, ignore_errors=True)
+        return package_sdk.build_sdk_tree(stage, platform_name)
+
+    results[f"{name}/build_sdk_tree"] = measure(build_tree, repeat)
+    sdk_root = stage / package_sdk.sdk_root_name(platform_name)
+
+    def staged(writer, output):
+        def run():
+            writer(sdk_root, output)
+            return output
+        return run
+
+    results[f"{name}/make_zip"] = measure(staged(package_sdk.make_zip, work / "staged.zip"), repeat)
+    results[f"{name}/make_tar_gz"] = measure(staged(package_sdk.make_tar_gz, work / "staged.tar.gz"), repeat)
+
+    hashes = package_sdk.input_hashes(platform_name)
+    with ThreadPoolExecutor(max(1, jobs)) as pool:
+        def stream_zip():
+            output = work / "streamed.zip"
+            package_sdk.make_sdk_zip(platform_name, output, hashes, None, pool)
+            return output
+        results[f"{name}/stream_zip"] = measure(stream_zip, repeat)
+
+    for fmt in ("tar.gz", "tar.xz"):
+        def stream_tar(fmt=fmt):
+            output = work / f"streamed.{fmt}"
+            package_sdk.write_sdk_tar(platform_name, output, fmt)
+            return output
+        results[f"{name}/stream_{fmt.replace('.', '_')}"] = measure(stream_tar, repeat)
+    return results
+
+
+def run_benchmarks(headers: int, repeat: int, jobs: int, real: bool = True) -> dict[str, dict]:
+    results = {}
+    saved_cache = os.environ.get("MGB_UML_SDK_CACHE")
+    with tempfile.TemporaryDirectory() as tmp, contextlib.ExitStack() as restore:
+        tmp = Path(tmp)
+        # keep the include index out of the user's cache, but warm it first
+        os.environ["MGB_UML_SDK_CACHE"] = str(tmp / "cache")
+        if saved_cache is None:
+            restore.callback(os.environ.pop, "MGB_UML_SDK_CACHE", None)
+        else:
+            restore.callback(os.environ.__setitem__, "MGB_UML_SDK_CACHE", saved_cache)
+        if real:
+            (tmp / "real").mkdir()
+            package_sdk.plugin_headers()
+            results.update(bench_tree("real", tmp / "real", repeat, jobs))
+        if headers:
+            synthetic = tmp / "synthetic"
+            make_synthetic_tree(synthetic, headers)
+            (tmp / "work").mkdir()
+            with sdk_inputs(synthetic, sorted((synthetic / "src" / "data").glob("*.h"))):
+                package_sdk.plugin_headers()
+                results.update(bench_tree(f"synthetic-{headers}", tmp / "work", repeat, jobs))
+    return results
+
+
+def load_history(path: Path) -> list[dict]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))["runs"]
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def save_history(path: Path, runs: list[dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({"runs": runs}, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=package_sdk.ROOT,
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def find_regressions(history: list[dict], results: dict[str, dict],
+                     time_threshold: float, size_threshold: float) -> list[str]:
+    """Compare `results` with the median of the last BASELINE_RUNS runs in `history`."""
+    regressions = []
+    for name, sample in sorted(results.items()):
+        previous = [run["results"][name] for run in history if name in run["results"]][-BASELINE_RUNS:]
+        if not previous:
+            continue
+        for metric, threshold in (("seconds", time_threshold), ("output_bytes", size_threshold)):
+            baseline = statistics.median(p[metric] for p in previous)
+            if baseline and sample[metric] > baseline * (1 + threshold):
+                regressions.append(f"{name}: {metric} {sample[metric]:.4g} vs baseline {baseline:.4g} "
+                                   f"(+{(sample[metric] / baseline - 1) * 100:.0f}%)")
+    return regressions
+
+
+def format_results(results: dict[str, dict]) -> str:
+    lines = [f"{'benchmark':40} {'seconds':>9} {'read MB':>9} {'written MB':>10} {'output KB':>10}"]
+    for name, r in sorted(results.items()):
+        read = "-" if r["bytes_read"] is None else f"{r['bytes_read'] / 1e6:.2f}"
+        written = "-" if r["bytes_written"] is None else f"{r['bytes_written'] / 1e6:.2f}"
+        lines.append(f"{name:40} {r['seconds']:9.4f} {read:>9} {written:>10} {r['output_bytes'] / 1e3:10.1f}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark MGB-UML SDK packaging")
+    parser.add_argument("--headers", type=int, default=2000,
+                        help="Headers in the synthetic tree; 0 benchmarks only the real tree")
+    parser.add_argument("--no-real", action="store_true", help="Skip the real repository tree")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the fastest is kept")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Compression threads for the streaming zip writer")
+    parser.add_argument("--history", type=Path, default=Path("bench_package_sdk.json"),
+                        help="JSON file the results are appended to")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Flag benchmarks this fraction slower than the baseline")
+    parser.add_argument("--size-threshold", type=float, default=0.05,
+                        help="Flag outputs this fraction larger than the baseline")
+    parser.add_argument("--no-record", action="store_true", help="Compare only; do not append to the history")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on a regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.headers, max(1, args.repeat), args.jobs, real=not args.no_real)
+    print(format_results(results))
+
+    history = load_history(args.history)
+    regressions = find_regressions(history, results, args.threshold, args.size_threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    if not args.no_record:
+        history.append({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        })
+        save_history(args.history, history)
+        print(f"Recorded run {len(history)} in {args.history}")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Profile where the boot time of TikZiT session containers goes.
+
+Each boot of a session container leaves a timeline in its /var/log:
+
+- session_timeline.jsonl: the phases entrypoint.sh marks (entrypoint,
+  vnc_password, xstartup, novnc, supervisord), followed by those of
+  session_ready.py (x11, wm, websockify, launch and, if a signal never came,
+  timeout);
+- supervisord.log: <program>_spawned and <program>_running for every program
+  in supervisord.conf;
+- vncserver.*.log: vnc_listening, when Xvnc accepts VNC connections;
+- novnc.*.log: first_viewer, when websockify proxies its first connection.
+
+The log files only have second resolution. Each of their events is assigned
+to the boot that was running at that time, and is kept only the first time
+it occurs in that boot. Every event is reported as seconds since the boot's
+entrypoint started.
+
+`collect` copies the logs out of containers. `timeline` prints the boots one
+by one. `report` aggregates them into percentiles per event, slowest last.
+With --baseline, `report` fails when an event's median grew by more than
+--factor.
+"""
+
+from __future__ import annotations
+
+import argparse
+import calendar
+import json
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from provision_users import DockerCli, DockerError, write_atomic
+from stats import percentile
+
+
+LOG_DIR = "/var/log"
+TIMELINE_FILE = "session_timeline.jsonl"
+LOG_FILES = (TIMELINE_FILE, "supervisord.log", "vncserver.stdout.log", "vncserver.stderr.log",
+             "novnc.stdout.log", "novnc.stderr.log")
+
+SUPERVISORD_LINE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) \w+ "
+                              r"(?:spawned: '(?P<spawned>[^']+)'|success: (?P<running>\S+) entered RUNNING state)")
+XVNC_DATE = re.compile(r"^\s*(\w{3} \w{3} +\d+ \d\d:\d\d:\d\d \d{4})\s*$")
+WEBSOCKIFY_LINE = re.compile(r"\[(\d\d/\w{3}/\d{4} \d\d:\d\d:\d\d)\] .*connecting to")
+
+# a second-resolution log time can fall up to a second before the boot it belongs to
+CLOCK_SLACK = 1.0
+
+
+def _utc(value: str, fmt: str) -> float:
+    # containers log in UTC unless TZ is set
+    return float(calendar.timegm(time.strptime(value, fmt)))
+
+
+def parse_timeline(text: str) -> list[dict]:
+    entries = []
+    for line in text.splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry, dict) and {"boot", "event", "at"} <= entry.keys():
+            entries.append(entry)
+    return entries
+
+
+def parse_supervisord_log(text: str) -> list[tuple[float, str]]:
+    events = []
+    for line in text.splitlines():
+        match = SUPERVISORD_LINE.match(line)
+        if match:
+            at = _utc(match.group(1), "%Y-%m-%d %H:%M:%S") + int(match.group(2)) / 1000
+            if match.group("spawned"):
+                events.append((at, f"{match.group('spawned')}_spawned"))
+            else:
+                events.append((at, f"{match.group('running')}_running"))
+    return events
+
+
+def parse_vnc_log(text: str) -> list[tuple[float, str]]:
+    """Xvnc prints a date line before each group of messages."""
+    events, at = [], None
+    for line in text.splitlines():
+        date = XVNC_DATE.match(line)
+        if date:
+            at = _utc(" ".join(date.group(1).split()), "%a %b %d %H:%M:%S %Y")
+        elif at is not None and "Listening for VNC connections" in line:
+            events.append((at, "vnc_listening"))
+    return events
+
+
+def parse_websockify_log(text: str) -> list[tuple[float, str]]:
+    events = []
+    for line in text.splitlines():
+        match = WEBSOCKIFY_LINE.search(line)
+        if match:
+            events.append((_utc(match.group(1), "%d/%b/%Y %H:%M:%S"), "first_viewer"))
+    return events
+
+
+def _read(path: Path) -> str:
+    try:
+        return path.read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return ""
+
+
+def load_boots(directory: Path, container: str | None = None) -> list[dict]:
+    """The boots recorded in one container's collected logs, oldest first:
+    {container, boot, start, events: {event: seconds since start}}."""
+    container = container or directory.name
+    boots = {}
+    for entry in parse_timeline(_read(directory / TIMELINE_FILE)):
+        boot = boots.setdefault(entry["boot"], {"container": container, "boot": entry["boot"], "marks": []})
+        boot["marks"].append((float(entry["at"]), entry["event"]))
+    ordered = []
+    for boot in boots.values():
+        starts = [at for at, event in boot["marks"] if event == "entrypoint"]
+        boot["start"] = min(starts or [at for at, _ in boot["marks"]])
+        ordered.append(boot)
+    ordered.sort(key=lambda b: b["start"])
+
+    logged = parse_supervisord_log(_read(directory / "supervisord.log"))
+    for name in ("vncserver.stdout.log", "vncserver.stderr.log"):
+        logged += parse_vnc_log(_read(directory / name))
+    for name in ("novnc.stdout.log", "novnc.stderr.log"):
+        logged += parse_websockify_log(_read(directory / name))
+    for at, event in logged:
+        owner = None
+        for boot in ordered:
+            if boot["start"] <= at + CLOCK_SLACK:
+                owner = boot
+        if owner is not None:
+            owner["marks"].append((at, event))
+
+    for boot in ordered:
+        events = {}
+        for at, event in sorted(boot.pop("marks")):
+            events.setdefault(event, round(max(0.0, at - boot["start"]), 3))
+        boot["events"] = events
+    return ordered
+
+
+def load_all(paths: list[Path]) -> list[dict]:
+    """Boots from collected container directories, or from directories of them."""
+    boots = []
+    for path in paths:
+        if (path / TIMELINE_FILE).exists():
+            boots.extend(load_boots(path))
+        else:
+            for child in sorted(p for p in path.iterdir() if p.is_dir()):
+                boots.extend(load_boots(child))
+    return boots
+
+
+def collect(docker: DockerCli, containers: list[str], output: Path, jobs: int = 8) -> dict[str, int]:
+    """Copy each container's logs to output/<container>/; returns the files copied per container."""
+    def fetch(container):
+        copied = 0
+        for name in LOG_FILES:
+            try:
+                text = docker.run("exec", container, "cat", f"{LOG_DIR}/{name}")
+            except DockerError:
+                continue
+            write_atomic(output / container / name, text)
+            copied += 1
+        return copied
+
+    with ThreadPoolExecutor(max(1, min(jobs, len(containers)))) as pool:
+        return dict(zip(containers, pool.map(fetch, containers)))
+
+
+def aggregate(boots: list[dict]) -> dict[str, dict]:
+    """Percentiles of each event's seconds since boot, over the boots that reached it."""
+    samples = {}
+    for boot in boots:
+        for event, seconds in boot["events"].items():
+            samples.setdefault(event, []).append(seconds)
+    return {event: {"boots": len(values), "p50": percentile(values, 50), "p90": percentile(values, 90),
+                    "p99": percentile(values, 99), "max": max(values)}
+            for event, values in samples.items()}
+
+
+def find_regressions(stats: dict[str, dict], baseline: dict[str, dict], factor: float,
+                     min_seconds: float) -> list[str]:
+    regressions = []
+    for event, current in sorted(stats.items()):
+        before = baseline.get(event)
+        if not before:
+            continue
+        if current["p50"] > before["p50"] * factor and current["p50"] - before["p50"] >= min_seconds:
+            regressions.append(f"{event}: p50 {current['p50']:.2f}s vs baseline {before['p50']:.2f}s")
+    return regressions
+
+
+def format_stats(stats: dict[str, dict], total_boots: int) -> str:
+    lines = [f"{total_boots} boots; seconds since the entrypoint started",
+             f"{'event':24} {'boots':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"]
+    for event, s in sorted(stats.items(), key=lambda item: (item[1]["p50"], item[0])):
+        lines.append(f"{event:24} {s['boots']:6d} {s['p50']:8.2f} {s['p90']:8.2f} {s['p99']:8.2f} {s['max']:8.2f}")
+    return "\n".join(lines)
+
+
+def format_boot(boot: dict) -> str:
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(boot["start"]))
+    lines = [f"{boot['container']} boot {boot['boot']} at {started}Z"]
+    previous = 0.0
+    for event, seconds in sorted(boot["events"].items(), key=lambda item: (item[1], item[0])):
+        lines.append(f"  {seconds:8.2f}s  (+{seconds - previous:.2f}s)  {event}")
+        previous = seconds
+    return "\n".join(lines)
+
+
+def main(argv: list[str], docker: DockerCli | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile the boot phases of TikZiT session containers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    collect_cmd = commands.add_parser("collect", help="Copy the boot logs out of containers")
+    collect_cmd.add_argument("containers", nargs="+")
+    collect_cmd.add_argument("-o", "--output", type=Path, default=Path("boot_profiles"))
+    collect_cmd.add_argument("-j", "--jobs", type=int, default=8)
+    timeline_cmd = commands.add_parser("timeline", help="Print each boot's phases")
+    timeline_cmd.add_argument("paths", nargs="+", type=Path, help="Collected container directories")
+    report_cmd = commands.add_parser("report", help="Percentiles of each phase across boots")
+    report_cmd.add_argument("paths", nargs="+", type=Path, help="Collected container directories")
+    report_cmd.add_argument("--json", type=Path, help="Write the statistics here (usable as a baseline)")
+    report_cmd.add_argument("--baseline", type=Path, help="Statistics of a previous report to compare with")
+    report_cmd.add_argument("--factor", type=float, default=1.5, help="Flag medians this many times the baseline")
+    report_cmd.add_argument("--min-seconds", type=float, default=0.5, help="Ignore growth smaller than this")
+    args = parser.parse_args(argv)
+
+    if args.command == "collect":
+        copied = collect(docker or DockerCli(), args.containers, args.output, args.jobs)
+        for container, files in copied.items():
+            print(f"{'✅' if files else '❌'} {container}: {files} log files")
+        return 0 if all(copied.values()) else 1
+
+    boots = load_all(args.paths)
+    if not boots:
+        print("❌ No boot timelines found")
+        return 1
+    if args.command == "timeline":
+        print("\n\n".join(format_boot(boot) for boot in boots))
+        return 0
+
+    stats = aggregate(boots)
+    print(format_stats(stats, len(boots)))
+    if args.json:
+        write_atomic(args.json, json.dumps(stats, indent=2, sort_keys=True) + "\n")
+    if args.baseline:
+        try:
+            baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"❌ Cannot read baseline {args.baseline}: {e}")
+            return 1
+        regressions = find_regressions(stats, baseline, args.factor, args.min_seconds)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
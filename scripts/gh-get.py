@@ -1,22 +1,106 @@
 #!/usr/bin/env python
 
-from gh import gh, pr
-import sys, os
-
-filter = None
-if len(sys.argv) == 2:
-	filter = sys.argv[1]
-
-tok = os.getenv('GITHUB_TOKEN')
-
-draft = [r for r in gh('releases') if r['draft']][0]
-
-for a in draft['assets']:
-	if filter == None or filter in a['name']:
-		print('Downloading ' + a['name'])
-		b = gh('releases/assets/%s?access_token=%s' % (a['id'], tok),
-			   ['-L', '-H', 'Accept: application/octet-stream'],
-			   parse=False, quiet=False, auth=False)
-		f = open(a['name'], 'w')
-		f.write(b)
-		f.close()
+import sys, os, time, argparse, http.client
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from gh import gh_open, get_draft, get_sums, asset_digest, sha256sum, SUMS_ASSET
+
+# a download error that retrying will not fix
+class Fatal(Exception): pass
+
+# stream one asset to `dest` through `dest.part`, resuming with a Range request when an
+# earlier attempt left a partial file, and rename it into place once complete
+def download(asset, dest, retries=3, backoff=2.0):
+    part = dest + '.part'
+    start = time.monotonic()
+    for attempt in range(retries + 1):
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        if have > asset['size']:
+            os.remove(part)
+            have = 0
+        args = ['-L', '-H', 'Accept: application/octet-stream']
+        if 0 < have: args += ['-H', 'Range: bytes=%d-' % have]
+        try:
+            with gh_open('releases/assets/%s' % asset['id'], args) as r:
+                if r.status == 206:
+                    mode = 'ab'
+                elif r.status == 200:
+                    mode = 'wb'
+                elif r.status == 416 and have == asset['size']:
+                    mode = None
+                else:
+                    error = 'HTTP %d' % r.status
+                    if 400 <= r.status < 500 and r.status not in (408, 416, 429):
+                        raise Fatal(error)
+                    if r.status == 416: os.remove(part)
+                    raise IOError(error)
+                if mode is not None:
+                    with open(part, mode) as f:
+                        for chunk in r.iter_content():
+                            f.write(chunk)
+            if os.path.getsize(part) != asset['size']:
+                raise IOError('incomplete download (%d of %d bytes)' % (os.path.getsize(part), asset['size']))
+            os.replace(part, dest)
+            return asset['size'], time.monotonic() - start
+        except (OSError, http.client.HTTPException) as e:
+            error = str(e)
+        if attempt == retries: raise IOError(error)
+        delay = backoff * 2 ** attempt
+        print('Download of %s failed (%s), resuming in %.0fs.' % (asset['name'], error, delay))
+        time.sleep(delay)
+
+def get(asset, dest, sums, retries):
+    digest = asset_digest(asset, sums)
+    if digest and os.path.exists(dest) and sha256sum(dest) == digest:
+        print('%s is up to date, skipping.' % asset['name'])
+        return 0, 0.0
+    print('Downloading ' + asset['name'])
+    size, secs = download(asset, dest, retries)
+    if digest:
+        actual = sha256sum(dest)
+        if actual != digest:
+            os.remove(dest)
+            raise Fatal('SHA-256 mismatch: expected %s, got %s' % (digest, actual))
+    return size, secs
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Download assets of the draft GitHub release')
+    parser.add_argument('filter', nargs='?', help='only download assets whose name contains this')
+    parser.add_argument('-j', '--jobs', type=int, default=4, help='concurrent downloads')
+    parser.add_argument('-o', '--output-dir', default='.', help='directory to write assets to')
+    parser.add_argument('--retries', type=int, default=3, help='attempts per asset after the first')
+    parser.add_argument('--manifest', default=SUMS_ASSET,
+                        help='release asset listing SHA-256 digests in sha256sum format')
+    args = parser.parse_args(argv)
+
+    draft = get_draft()
+    if draft is None:
+        print('No draft release found.')
+        return 1
+
+    sums = get_sums(draft, args.manifest)
+
+    assets = [a for a in draft['assets'] if args.filter is None or args.filter in a['name']]
+    os.makedirs(args.output_dir, exist_ok=True)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        jobs = dict((pool.submit(get, a, os.path.join(args.output_dir, a['name']), sums, args.retries), a)
+                    for a in assets)
+        for job in as_completed(jobs):
+            name = jobs[job]['name']
+            try:
+                size, secs = job.result()
+            except Exception as e:
+                print('FAILED %s: %s' % (name, e))
+                failed.append(name)
+                continue
+            if size:
+                print('Downloaded %s: %.1f MB in %.1fs (%.2f MB/s)' % (
+                    name, size / 1e6, secs, size / 1e6 / max(secs, 1e-6)))
+
+    if failed:
+        print('%d of %d downloads failed; rerun to resume them.' % (len(failed), len(assets)))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
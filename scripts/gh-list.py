@@ -1,11 +1,14 @@
 #!/usr/bin/env python
 
-from gh import gh, pr
-import os
+from gh import gh, get_draft, pr
+import sys, os
 
 tok = os.getenv('GITHUB_TOKEN')
 
-draft = [r for r in gh('releases') if r['draft']][0]
+draft = get_draft()
+if draft is None:
+	print('No draft release found.')
+	sys.exit(1)
 
 for a in draft['assets']:
 	print(a['browser_download_url'])
@@ -1,34 +1,122 @@
 #!/usr/bin/env python
 
-import sys, os, re
-from gh import gh
+import sys, os, re, time, argparse, tempfile, http.client
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from gh import gh, gh_iter, fetch, get_draft, get_sums, asset_digest, sha256sum, SUMS_ASSET
 
-if len(sys.argv) != 2:
-    print("Usage: python gh-push.py FILENAME")
-    sys.exit(1)
+# an upload error that retrying will not fix
+class Fatal(Exception): pass
 
-f = sys.argv[1]
-fname = os.path.basename(f)
+# GitHub reports a half-finished upload as an asset in state "starter"
+def uploaded(asset, path):
+    return asset['state'] == 'uploaded' and asset['size'] == os.path.getsize(path)
 
-print('Pulling info on draft release...')
-draft = [r for r in gh('releases') if r['draft']][0]
-print('Found: ' + draft['name'])
+def release_assets(draft):
+    return dict((a['name'], a) for a in gh_iter('releases/%s/assets' % draft['id'], cache=False))
 
-existing = [a for a in draft['assets'] if a['name'] == fname]
-if (len(existing) > 0):
-    print('Asset %s exists, deleting.' % fname)
-    gh('releases/assets/' + str(existing[0]['id']),
-        ['-X', 'DELETE'])
+# upload one file, replacing any asset of the same name; retried with exponential backoff
+def push(draft, f, existing, retries=3, backoff=2.0):
+    fname = os.path.basename(f)
+    upload_url = re.sub('\\{.*\\}', '?name=' + fname, draft['upload_url'])
+    for attempt in range(retries + 1):
+        try:
+            if fname in existing:
+                print('Asset %s exists, deleting.' % fname)
+                gh('releases/assets/' + str(existing[fname]['id']), ['-X', 'DELETE'])
+            print('Uploading %s...' % f)
+            start = time.monotonic()
+            status, _, resp = fetch(upload_url, [
+                '-H', 'Content-type: application/octet-stream',
+                '--data-binary', '@' + f
+                ])
+            if status == 201:
+                return os.path.getsize(f), time.monotonic() - start
+            error = 'HTTP %d: %s' % (status, resp[:200])
+            if 400 <= status < 500 and status not in (408, 422, 429):
+                raise Fatal(error)
+        except (OSError, http.client.HTTPException) as e:
+            error = str(e)
+        if attempt == retries: raise IOError(error)
+        delay = backoff * 2 ** attempt
+        print('Upload of %s failed (%s), retrying in %.0fs.' % (fname, error, delay))
+        time.sleep(delay)
+        # a failed attempt may have left a partial asset behind
+        existing = release_assets(draft)
 
-print('Uploading %s...' % f)
+# rewrite the release's digest manifest with `digests`, keeping entries for other
+# assets still on the release; re-read first so concurrent pushes lose less
+def update_sums(draft, digests, retries):
+    draft = get_draft()
+    assets = dict((a['name'], a) for a in draft['assets'])
+    old = get_sums(draft)
+    sums = dict((n, d) for n, d in old.items() if n in assets)
+    sums.update(digests)
+    if sums == old: return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, SUMS_ASSET)
+        with open(path, 'w') as f:
+            for n in sorted(sums): f.write('%s  %s\n' % (sums[n], n))
+        push(draft, path, assets, retries)
 
-upload_url = re.sub(
-    '\\{.*\\}', '?name=' + fname,
-    draft['upload_url'])
+def main(argv):
+    parser = argparse.ArgumentParser(description='Upload files to the draft GitHub release')
+    parser.add_argument('files', nargs='+', metavar='FILENAME')
+    parser.add_argument('-j', '--jobs', type=int, default=4, help='concurrent uploads')
+    parser.add_argument('--retries', type=int, default=3, help='attempts per asset after the first')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip assets that are already fully uploaded with the same size')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='upload even when the remote asset has the same SHA-256')
+    args = parser.parse_args(argv)
 
-resp = gh(upload_url, [
-    '-H', 'Content-type: application/octet-stream',
-    '--data-binary', '@' + f
-    ])
+    print('Pulling info on draft release...')
+    draft = get_draft()
+    if draft is None:
+        print('No draft release found.')
+        return 1
+    print('Found: ' + draft['name'])
 
-print('Done.')
+    existing = dict((a['name'], a) for a in draft['assets'])
+    sums = {} if args.no_dedup else get_sums(draft)
+    digests, todo, saved = {}, [], 0
+    for f in args.files:
+        fname = os.path.basename(f)
+        digests[fname] = sha256sum(f)
+        a = existing.get(fname)
+        if a is not None and a['state'] == 'uploaded' and not args.no_dedup \
+                and asset_digest(a, sums) == digests[fname]:
+            print('Asset %s is unchanged (sha256 %s), skipping.' % (fname, digests[fname][:12]))
+            saved += os.path.getsize(f)
+        elif args.resume and a is not None and uploaded(a, f):
+            print('Asset %s already uploaded, skipping.' % fname)
+        else:
+            todo.append(f)
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        jobs = dict((pool.submit(push, draft, f, existing, args.retries), f) for f in todo)
+        for job in as_completed(jobs):
+            f = jobs[job]
+            try:
+                size, secs = job.result()
+            except Exception as e:
+                print('FAILED %s: %s' % (f, e))
+                failed.append(f)
+                continue
+            print('Uploaded %s: %.1f MB in %.1fs (%.2f MB/s)' % (
+                os.path.basename(f), size / 1e6, secs, size / 1e6 / max(secs, 1e-6)))
+
+    if saved:
+        print('Skipped %d unchanged assets, saved %.1f MB of upload.' % (
+            len(args.files) - len(todo), saved / 1e6))
+    for f in failed: digests.pop(os.path.basename(f))
+    if digests and SUMS_ASSET not in digests:
+        update_sums(draft, digests, args.retries)
+    if failed:
+        print('%d of %d uploads failed; rerun with --resume to retry them.' % (len(failed), len(todo)))
+        return 1
+    print('Done.')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,11 @@
-import sys, os, json
-from subprocess import Popen, PIPE
+import sys, os, re, json, time, atexit, threading, hashlib
+import http.client
+import datetime
+import email.utils
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urljoin
 
-api_url = 'https://api.github.com/repos/tikzit/tikzit'
+api_url = os.getenv('GH_API_URL', 'https://api.github.com/repos/tikzit/tikzit')
 
 tok = os.getenv('GITHUB_TOKEN', '')
 
@@ -12,21 +16,468 @@ if tok == '':
 # pretty-print JSON responses
 def pr(j): print(json.dumps(j, indent=2))
 
-# call GitHub API with curl
-def gh(s, args=[], quiet=True, parse=True, auth=True):
-    cmd = (["curl"] +
-           (["-s"] if quiet else []) +
-           args +
-           (["-H", "Authorization: token " + tok] if auth else []) +
-           [s if 'https://' in s else api_url + '/' + s])
-    # ONLY UN-COMMENT FOR TESTING:
-    # print(' '.join(cmd))
-    p = Popen(cmd, stdout=PIPE)
-    resp = p.stdout.read()
+# request counters; set GH_STATS=1 to print them when the script exits
+stats = {'requests': 0, 'connections': 0, 'reused': 0, 'cached': 0, 'coalesced': 0,
+         'delayed': 0, 'delay_seconds': 0.0, 'seconds': 0.0}
+stats_lock = threading.Lock()
+
+def count(name, n=1):
+    with stats_lock: stats[name] += n
+
+def print_stats():
+    print('gh: %(requests)d requests, %(connections)d connections opened, '
+          '%(reused)d reused, %(cached)d served from cache, %(coalesced)d coalesced, '
+          '%(delayed)d delayed by %(delay_seconds).1fs, %(seconds).3fs in HTTP' % stats, file=sys.stderr)
+
+if os.getenv('GH_STATS'): atexit.register(print_stats)
+
+REDIRECTS = (301, 302, 303, 307, 308)
+
+# A response whose connection goes back to the pool once the body is consumed.
+class Response:
+    def __init__(self, client, key, conn, resp, started):
+        self.client, self.key, self.conn, self.resp = client, key, conn, resp
+        self.started = started
+        self.status = resp.status
+        self.headers = resp.headers
+        self.done = False
+
+    def getheader(self, name, default=None):
+        return self.resp.getheader(name, default)
+
+    def read(self):
+        try: return self.resp.read()
+        finally: self.close()
+
+    def iter_content(self, size=1 << 16):
+        try:
+            while True:
+                chunk = self.resp.read(size)
+                if not chunk: break
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if self.done: return
+        self.done = True
+        count('seconds', time.monotonic() - self.started)
+        # only a fully read response leaves the connection reusable
+        if self.resp.isclosed() and not self.resp.will_close:
+            self.client.release(self.key, self.conn)
+        else:
+            self.resp.close()
+            self.conn.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+# Keep-alive HTTP client with a pool of idle connections per (scheme, host, port).
+class Client:
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key):
+        with self.lock:
+            conns = self.idle.get(key)
+            conn = conns.pop() if conns else None
+        if conn is not None:
+            count('reused')
+            return conn, True
+        return self.connect(key), False
+
+    def connect(self, key):
+        count('connections')
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, blocksize=1 << 16)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout, blocksize=1 << 16)
+
+    def release(self, key, conn):
+        with self.lock:
+            self.idle.setdefault(key, []).append(conn)
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns: conn.close()
+            self.idle.clear()
+
+    def send(self, key, method, path, headers, body):
+        conn, reused = self.acquire(key)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            # the server may drop an idle keep-alive connection; retry once on a fresh one
+            if not reused: raise
+            if hasattr(body, 'seek'): body.seek(0)
+            conn = self.connect(key)
+            conn.request(method, path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def request(self, method, url, headers={}, body=None, follow=False):
+        headers = dict(headers)
+        for _ in range(10):
+            parts = urlsplit(url)
+            key = (parts.scheme, parts.hostname,
+                   parts.port or (443 if parts.scheme == 'https' else 80))
+            path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+            count('requests')
+            started = time.monotonic()
+            conn, resp = self.send(key, method, path, headers, body)
+            r = Response(self, key, conn, resp, started)
+            if not (follow and r.status in REDIRECTS): return r
+            r.read()
+            url = urljoin(url, r.getheader('Location'))
+            # like curl -L: never forward credentials to another host
+            if urlsplit(url).hostname != parts.hostname:
+                headers.pop('Authorization', None)
+            if r.status == 303 or (r.status in (301, 302) and method == 'POST'):
+                method, body = 'GET', None
+                headers.pop('Content-Length', None)
+                headers.pop('Content-Type', None)
+        raise IOError('too many redirects: ' + url)
+
+client = Client()
+
+# On-disk cache of GET responses, revalidated with If-None-Match/If-Modified-Since.
+# Every read still reaches the API, but a 304 does not count against the rate limit.
+class ResponseCache:
+    def __init__(self, path, max_age=7 * 24 * 3600, max_bytes=64 << 20):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.total = None  # size of the cached bodies, counted by the first evict()
+
+    # the credentials are part of the key: another token may see a different response
+    def key(self, url, headers):
+        return hashlib.sha256('\n'.join((url, headers.get('Accept', ''), headers.get('Authorization', '')))
+                              .encode('utf-8')).hexdigest()
+
+    def files(self, key):
+        return os.path.join(self.path, key + '.json'), os.path.join(self.path, key + '.body')
+
+    def lookup(self, key):
+        meta, body = self.files(key)
+        try:
+            with open(meta) as f: entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry['stored'] > self.max_age or not os.path.exists(body):
+            return None
+        return entry
+
+    def load(self, key):
+        meta, body = self.files(key)
+        with open(body, 'rb') as f: data = f.read()
+        os.utime(meta)  # mark as recently used for size eviction
+        return data
+
+    def store(self, key, url, resp, data):
+        entry = {'url': url, 'stored': time.time(),
+                 'etag': resp.getheader('ETag'),
+                 'last_modified': resp.getheader('Last-Modified'),
+                 'link': resp.getheader('Link')}
+        if not (entry['etag'] or entry['last_modified']): return
+        os.makedirs(self.path, exist_ok=True)
+        meta, body = self.files(key)
+        try: replaced = os.path.getsize(body)
+        except OSError: replaced = 0
+        for name, content in ((body, data), (meta, json.dumps(entry).encode('utf-8'))):
+            tmp = '%s.%d.tmp' % (name, threading.get_ident())
+            with open(tmp, 'wb') as f: f.write(content)
+            os.replace(tmp, name)
+        # the directory is only scanned once per process and whenever the running total crosses max_bytes
+        if self.total is None or self.total + len(data) - replaced > self.max_bytes: self.evict()
+        else: self.total += len(data) - replaced
+
+    # drop entries older than max_age, then least recently used ones until under max_bytes
+    def evict(self):
+        entries, total, now = [], 0, time.time()
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'): continue
+            key = name[:-len('.json')]
+            meta, body = self.files(key)
+            try:
+                used = os.path.getmtime(meta)
+                with open(meta) as f: stored = json.load(f)['stored']
+                size = os.path.getsize(body)
+            except (OSError, ValueError, KeyError):
+                self.remove(key); continue
+            if now - stored > self.max_age:
+                self.remove(key); continue
+            entries.append((used, size, key))
+            total += size
+        for used, size, key in sorted(entries):
+            if total <= self.max_bytes: break
+            self.remove(key)
+            total -= size
+        self.total = total
+
+    def remove(self, key):
+        for name in self.files(key):
+            try: os.remove(name)
+            except OSError: pass
+
+# GH_NO_CACHE=1 disables the cache entirely
+response_cache = None if os.getenv('GH_NO_CACHE') else ResponseCache(
+    os.getenv('GH_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'tikzit-gh')))
+
+# seconds to wait from a Retry-After header, which holds either seconds or an HTTP date;
+# None when it is missing or neither
+def retry_after(value):
+    if value is None: return None
+    try: return max(float(value), 0)
+    except ValueError: pass
+    try: when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError): return None
+    if when.tzinfo is None: when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(when.timestamp() - time.time(), 0)
+
+# Keeps API use within GitHub's rate limits. The remaining budget is read from the
+# X-RateLimit-* headers of every response; once it runs low the remaining requests are
+# spread evenly until the reset, and when it is spent they wait for the reset. Responses
+# rejected by a primary or secondary limit are retried after Retry-After. Identical
+# GETs in flight at the same time share a single request.
+class Scheduler:
+    def __init__(self, pace_below=50, max_wait=900, concurrency=8):
+        self.pace_below = pace_below
+        self.max_wait = max_wait
+        self.slots = threading.Semaphore(concurrency)
+        self.remaining = None
+        self.reset = None
+        self.next_slot = 0.0
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    # seconds the next request has to wait; reserves one request of the budget
+    def delay(self):
+        with self.lock:
+            now = time.time()
+            if self.remaining is None or self.reset is None or self.reset <= now:
+                return 0.0
+            if self.remaining <= 0:
+                return self.reset - now + 1
+            wait = 0.0
+            if self.remaining < self.pace_below:
+                start = max(now, self.next_slot)
+                self.next_slot = start + (self.reset - now) / self.remaining
+                wait = start - now
+            self.remaining -= 1
+            return wait
+
+    def wait(self):
+        d = self.delay()
+        if d > self.max_wait:
+            raise IOError('GitHub rate limit exhausted; it resets in %d seconds' % d)
+        if d > 0:
+            count('delayed')
+            count('delay_seconds', d)
+            time.sleep(d)
+
+    # record the budget reported by a response; returns how long to wait before
+    # retrying it, or None if it was not rate limited
+    def update(self, status, headers):
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        with self.lock:
+            if remaining is not None: self.remaining = int(remaining)
+            if reset is not None: self.reset = float(reset)
+        if status not in (403, 429): return None
+        delay = retry_after(headers.get('Retry-After'))
+        if delay is not None: return delay
+        if remaining == '0' and reset is not None: return max(float(reset) - time.time(), 0) + 1
+        return None
+
+    # run fn() once for all callers asking for the same key at the same time
+    def coalesce(self, key, fn):
+        with self.lock:
+            call = self.inflight.get(key)
+            leader = call is None
+            if leader: call = self.inflight[key] = {'done': threading.Event()}
+        if not leader:
+            count('coalesced')
+            call['done'].wait()
+            if 'error' in call: raise call['error']
+            return call['result']
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock: del self.inflight[key]
+            call['done'].set()
+
+scheduler = Scheduler()
+
+# issue a request through the scheduler, retrying once a rate limit has passed
+def send(method, url, headers, body, follow, retries=3):
+    for attempt in range(retries + 1):
+        scheduler.wait()
+        with scheduler.slots:
+            r = client.request(method, url, headers, body, follow)
+        retry = scheduler.update(r.status, r.headers)
+        if retry is None or attempt == retries or retry > scheduler.max_wait: return r
+        r.read()
+        if hasattr(body, 'seek'): body.seek(0)
+        count('delayed')
+        count('delay_seconds', retry)
+        time.sleep(retry)
+
+# translate the curl options used by the gh-* scripts into request parameters
+def curl_args(args):
+    method, headers, body, follow = None, {}, None, False
+    i = 0
+    while i < len(args):
+        a = args[i]
+        if a == '-X':
+            i += 1; method = args[i]
+        elif a == '-H':
+            i += 1; k, v = args[i].split(':', 1); headers[k.strip()] = v.strip()
+        elif a in ('--data-binary', '--data', '-d'):
+            i += 1
+            if args[i].startswith('@'):
+                body = open(args[i][1:], 'rb')
+                headers['Content-Length'] = str(os.fstat(body.fileno()).st_size)
+            else:
+                body = args[i].encode('utf-8')
+        elif a == '-L':
+            follow = True
+        else:
+            raise ValueError('unsupported curl option: ' + a)
+        i += 1
+    if method is None: method = 'GET' if body is None else 'POST'
+    return method, headers, body, follow
+
+# build (method, url, headers, body, follow) for an API call with curl-style options
+def prepare(s, args=[], auth=True):
+    method, headers, body, follow = curl_args(args)
+    headers.setdefault('User-Agent', 'tikzit-gh')
+    if auth: headers['Authorization'] = 'token ' + tok
+    url = s if '://' in s else api_url + '/' + s
+    return method, url, headers, body, follow
+
+# send one API request and return (status, headers, body). Plain GETs are revalidated
+# against the response cache unless `cache` is False; writes and redirected downloads
+# always bypass it. A 304 is reported as the cached 200 with its stored Link header.
+def fetch(s, args=[], quiet=True, auth=True, cache=True):
+    if args: return fetch_once(s, args, quiet, auth, cache)
+    return scheduler.coalesce((s, auth, cache), lambda: fetch_once(s, args, quiet, auth, cache))
+
+def fetch_once(s, args, quiet, auth, cache):
+    method, url, headers, body, follow = prepare(s, args, auth)
+    rc = response_cache if cache and method == 'GET' and not follow else None
+    key = entry = None
+    if rc is not None:
+        key = rc.key(url, headers)
+        entry = rc.lookup(key)
+    if entry is not None:
+        if entry['etag']: headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']: headers['If-Modified-Since'] = entry['last_modified']
+    try:
+        r = send(method, url, headers, body, follow)
+        resp = r.read()
+    finally:
+        if hasattr(body, 'close'): body.close()
+    status, resp_headers = r.status, r.headers
+    if entry is not None and status == 304:
+        try: resp = rc.load(key)
+        except OSError: return fetch_once(s, args, quiet, auth, False)
+        count('cached')
+        status = 200
+        if entry.get('link') and 'Link' not in resp_headers: resp_headers['Link'] = entry['link']
+    elif rc is not None and status == 200 and 'json' in r.getheader('Content-Type', ''):
+        rc.store(key, url, r, resp)
+    if not quiet:
+        print('%s %s -> %d (%d bytes)' % (method, url, r.status, len(resp)), file=sys.stderr)
+    return status, resp_headers, resp
+
+# open a streaming GET response; read it with iter_content() and close() it when done
+def gh_open(s, args=[], auth=True):
+    method, url, headers, body, follow = prepare(s, args, auth)
+    return send(method, url, headers, body, follow)
+
+# call GitHub API over a pooled keep-alive connection; `args` takes curl-style options
+def gh(s, args=[], quiet=True, parse=True, auth=True, cache=True):
+    resp = fetch(s, args, quiet, auth, cache)[2]
     if parse: return json.loads(resp if resp else '{}')
     else: return resp
 
+# URL of the rel="next" page in a Link header, if any
+def next_link(link):
+    for part in (link or '').split(','):
+        m = re.match(r'\s*<([^>]*)>\s*;.*\brel="?next"?', part)
+        if m: return m.group(1)
+    return None
+
+# iterate over every item of a paginated list endpoint, following Link: rel=next.
+# The next page is fetched in the background while the current one is consumed, so
+# stopping the iteration early fetches at most one page beyond the last one consumed.
+def gh_iter(s, args=[], auth=True, cache=True, per_page=None):
+    if per_page: s += ('&' if '?' in s else '?') + 'per_page=%d' % per_page
+    pool = ThreadPoolExecutor(max_workers=1)
+    page = None
+    try:
+        page = pool.submit(fetch, s, args, True, auth, cache)
+        while page is not None:
+            status, headers, resp = page.result()
+            if status != 200:
+                raise IOError('GitHub API returned %d for %s: %s' % (status, s, resp[:200]))
+            url = next_link(headers.get('Link'))
+            page = pool.submit(fetch, url, args, True, auth, cache) if url else None
+            for item in json.loads(resp if resp else '[]'):
+                yield item
+    finally:
+        if page is not None: page.cancel()  # only helps if the request has not started
+        pool.shutdown(wait=False)
+
+# first item of a list endpoint matching `pred`, or None
+def gh_find(s, pred, **kw):
+    return next((x for x in gh_iter(s, **kw) if pred(x)), None)
+
+# hex SHA-256 of a file, read in chunks
+def sha256sum(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''): h.update(chunk)
+    return h.hexdigest()
+
+# parse `sha256sum` output ("<hex>  <name>" per line) into {name: hex}
+def parse_sums(text):
+    sums = {}
+    for line in text.splitlines():
+        parts = line.strip().split(None, 1)
+        if len(parts) == 2: sums[parts[1].lstrip('*')] = parts[0].lower()
+    return sums
+
+# release asset listing the SHA-256 of every other asset, maintained by gh-push.py
+SUMS_ASSET = 'SHA256SUMS'
+
+# {asset name: hex digest} from a release's digest manifest, empty if it has none
+def get_sums(release, name=SUMS_ASSET):
+    for a in release['assets']:
+        if a['name'] == name:
+            with gh_open('releases/assets/%s' % a['id'], ['-L', '-H', 'Accept: application/octet-stream']) as r:
+                return parse_sums(r.read().decode('utf-8'))
+    return {}
+
+# expected SHA-256 of an asset: our manifest entry, else GitHub's own asset digest
+def asset_digest(asset, sums):
+    if asset['name'] in sums: return sums[asset['name']]
+    digest = asset.get('digest') or ''
+    return digest[len('sha256:'):] if digest.startswith('sha256:') else None
+
 def get_release(n):
-  rs = [r for r in gh('releases') if r['name'] == n]
-  if len(rs) > 0: return rs[0]
-  else: return None
+  return gh_find('releases', lambda r: r['name'] == n)
+
+def get_draft():
+  return gh_find('releases', lambda r: r['draft'])
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Compute the transitive `#include "..."` closure of MGB-UML headers.
+
+Quoted includes are resolved the way the build resolves them: next to the
+including file first, then along INCLUDE_DIRS (the INCLUDEPATH of tikzit.pro
+plus the repository root, which the SDK exposes as include/mgb-uml). Angle
+bracket includes are system or Qt headers and are ignored.
+
+Parsed include lists are kept in a persistent index keyed by path, mtime and
+size, so a re-scan only reads headers that changed since the last run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+INCLUDE_DIRS = [
+    ROOT,
+    ROOT / "src",
+    ROOT / "src" / "gui",
+    ROOT / "src" / "data",
+]
+
+INCLUDE_RE = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*"([^"]+)"', re.MULTILINE)
+
+INDEX_VERSION = 1
+
+
+def default_index_path() -> Path:
+    cache_dir = os.environ.get("MGB_UML_SDK_CACHE", Path.home() / ".cache" / "mgb-uml-sdk")
+    return Path(cache_dir) / "include-index.json"
+
+
+class IncludeIndex:
+    """Per-file cache of parsed includes, persisted as JSON."""
+
+    def __init__(self, path: Path | None):
+        self.path = path
+        self.files = {}
+        self.scanned = self.reused = 0
+        self.dirty = False
+        if path is None:
+            return
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION:
+            self.files = data.get("files", {})
+
+    def includes(self, path: Path) -> list[str]:
+        """The quoted include names in `path`, re-reading it only if it changed."""
+        key = path.as_posix()
+        st = path.stat()
+        entry = self.files.get(key)
+        if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            self.reused += 1
+            return entry["includes"]
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        if entry is not None and entry["sha256"] == digest:
+            # touched but not edited
+            self.reused += 1
+            includes = entry["includes"]
+        else:
+            self.scanned += 1
+            includes = [name.decode("utf-8") for name in INCLUDE_RE.findall(data)]
+        self.files[key] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size,
+                           "sha256": digest, "includes": includes}
+        self.dirty = True
+        return includes
+
+    def save(self) -> None:
+        files = {k: v for k, v in self.files.items() if os.path.exists(k)}
+        if self.path is None or not (self.dirty or len(files) < len(self.files)):
+            return
+        self.files = files
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # unique per writer: concurrent package_sdk.py runs share the index
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({"version": INDEX_VERSION, "files": self.files}, sort_keys=True),
+                       encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+def resolve_include(name: str, including: Path, include_dirs: list[Path]) -> Path | None:
+    for directory in [including.parent] + include_dirs:
+        candidate = directory / name
+        if candidate.is_file():
+            return Path(os.path.normpath(candidate))
+    return None
+
+
+def include_graph(roots: list[Path], index: IncludeIndex, include_dirs: list[Path] = INCLUDE_DIRS,
+                  missing: dict[Path, list[str]] | None = None) -> dict[Path, list[Path]]:
+    """Map every header reachable from `roots` to the headers it includes.
+
+    A quoted include that cannot be resolved raises FileNotFoundError naming
+    the including file, unless a `missing` dict is passed to collect them in.
+    """
+    graph = {}
+    pending = [Path(os.path.normpath(root)) for root in roots]
+    while pending:
+        path = pending.pop()
+        if path in graph:
+            continue
+        if not path.is_file():
+            raise FileNotFoundError(f"Required SDK header is missing: {path}")
+        edges = []
+        for name in index.includes(path):
+            target = resolve_include(name, path, include_dirs)
+            if target is None:
+                if missing is not None:
+                    missing.setdefault(path, []).append(name)
+                    continue
+                raise FileNotFoundError(f'{path}: cannot resolve #include "{name}"')
+            edges.append(target)
+            pending.append(target)
+        graph[path] = edges
+    return graph
+
+
+def include_closure(roots: list[Path], index: IncludeIndex | None = None) -> list[Path]:
+    """`roots` plus every header they transitively include, sorted by path."""
+    if index is None:
+        index = IncludeIndex(None)
+    return sorted(include_graph(roots, index))
+
+
+def format_graph(graph: dict[Path, list[Path]], fmt: str) -> str:
+    def rel(path: Path) -> str:
+        try:
+            return path.relative_to(ROOT).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    if fmt == "dot":
+        lines = ["digraph includes {"]
+        for path in sorted(graph):
+            lines.append(f'  "{rel(path)}";')
+            lines.extend(f'  "{rel(path)}" -> "{rel(target)}";' for target in graph[path])
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+    return json.dumps({rel(path): [rel(t) for t in graph[path]] for path in sorted(graph)}, indent=2) + "\n"
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Dump the include graph of MGB-UML headers")
+    parser.add_argument("headers", nargs="*", type=Path,
+                        help="Root headers (default: the plugin-facing headers packaged in the SDK)")
+    parser.add_argument("--all", action="store_true", help="Graph every header and source under src/")
+    parser.add_argument("--format", choices=["json", "dot"], default="json")
+    parser.add_argument("--index", type=Path, default=default_index_path(), help="Include index to reuse")
+    parser.add_argument("--no-index", action="store_true", help="Scan every file without reading or updating the index")
+    args = parser.parse_args(argv)
+
+    if args.all:
+        roots = sorted(p for ext in ("*.h", "*.cpp") for p in (ROOT / "src").rglob(ext))
+    elif args.headers:
+        roots = [p.resolve() for p in args.headers]
+    else:
+        from package_sdk import PLUGIN_HEADER_FILES
+        roots = PLUGIN_HEADER_FILES
+
+    index = IncludeIndex(None if args.no_index else args.index)
+    # generated headers such as ui_mainwindow.h only exist in a build tree
+    missing = {} if args.all else None
+    graph = include_graph(roots, index, missing=missing)
+    index.save()
+    sys.stdout.write(format_graph(graph, args.format))
+    for path, names in sorted((missing or {}).items()):
+        print(f"{path}: unresolved " + ", ".join(f'"{name}"' for name in names), file=sys.stderr)
+    print(f"Scanned {index.scanned} files, reused {index.reused} from the index", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Keep the timing history of JUnit test reports in SQLite.
+
+`ingest` stores every testcase of a report (test-results.xml is overwritten
+on every run) keyed by classname, name and the git commit it ran on. `stats`
+prints rolling percentiles of each test's duration over its recent runs, and
+`check` reports the tests of the latest run whose duration exceeds a rolling
+percentile of their earlier runs by more than a factor, exiting with status 1
+so it can gate a release.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from stats import percentile
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    commit_hash TEXT,
+    timestamp TEXT NOT NULL,
+    hostname TEXT,
+    tests INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    skipped INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    UNIQUE (timestamp, hostname)
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    classname TEXT NOT NULL,
+    name TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    outcome TEXT NOT NULL,
+    PRIMARY KEY (run_id, classname, name)
+);
+CREATE INDEX IF NOT EXISTS results_by_test ON results (classname, name, run_id);
+"""
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(str(path))
+    db.execute("PRAGMA foreign_keys = ON")
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, SCHEMA_VERSION):
+        db.close()
+        raise ValueError(f"{path}: unsupported history schema version {version}")
+    db.executescript(SCHEMA)
+    db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return db
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def parse_junit(path: Path) -> tuple[dict, list[dict]]:
+    """The suite attributes and the testcases of a JUnit report (pytest or run_tests.py)."""
+    root = ET.parse(path).getroot()
+    suite = root if root.tag == "testsuite" else root.find("testsuite")
+    if suite is None:
+        raise ValueError(f"{path}: no <testsuite> element")
+    cases = []
+    for case in suite.iter("testcase"):
+        outcome = "passed"
+        for tag in ("failure", "error", "skipped"):
+            if case.find(tag) is not None:
+                outcome = tag
+                break
+        cases.append({"classname": case.get("classname", ""), "name": case.get("name", ""),
+                      "seconds": float(case.get("time") or 0), "outcome": outcome})
+    return dict(suite.attrib), cases
+
+
+def ingest(db: sqlite3.Connection, path: Path, commit: str | None) -> int | None:
+    """Store the report at `path`; returns the new run id, or None if it was already stored."""
+    suite, cases = parse_junit(path)
+    outcomes = [c["outcome"] for c in cases]
+    with db:
+        try:
+            cursor = db.execute(
+                "INSERT INTO runs (commit_hash, timestamp, hostname, tests, failures, errors, skipped, seconds)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (commit, suite.get("timestamp") or "", suite.get("hostname"), len(cases),
+                 outcomes.count("failure"), outcomes.count("error"), outcomes.count("skipped"),
+                 float(suite.get("time") or 0)))
+        except sqlite3.IntegrityError:
+            return None
+        run_id = cursor.lastrowid
+        # a name reported twice (e.g. a setUpClass error) keeps its last result
+        db.executemany("INSERT OR REPLACE INTO results (run_id, classname, name, seconds, outcome)"
+                       " VALUES (?, ?, ?, ?, ?)",
+                       [(run_id, c["classname"], c["name"], c["seconds"], c["outcome"]) for c in cases])
+    return run_id
+
+
+def latest_run(db: sqlite3.Connection) -> int | None:
+    row = db.execute("SELECT MAX(id) FROM runs").fetchone()
+    return row[0]
+
+
+def history(db: sqlite3.Connection, before: int | None, window: int) -> dict[tuple[str, str], list[float]]:
+    """Durations of each passing test over its last `window` runs before run `before`, oldest first."""
+    rows = db.execute(
+        "SELECT classname, name, seconds FROM ("
+        "  SELECT classname, name, seconds, run_id,"
+        "         ROW_NUMBER() OVER (PARTITION BY classname, name ORDER BY run_id DESC) AS age"
+        "  FROM results WHERE outcome = 'passed' AND run_id < ?"
+        ") WHERE age <= ? ORDER BY classname, name, run_id",
+        (before if before is not None else sys.maxsize, window))
+    durations = {}
+    for classname, name, seconds in rows:
+        durations.setdefault((classname, name), []).append(seconds)
+    return durations
+
+
+def stats(db: sqlite3.Connection, window: int, quantiles: list[float]) -> list[dict]:
+    """Rolling percentiles of every test over its last `window` passing runs."""
+    return [{"classname": classname, "name": name, "runs": len(durations),
+             "percentiles": {q: percentile(durations, q) for q in quantiles}}
+            for (classname, name), durations in sorted(history(db, None, window).items())]
+
+
+def find_regressions(db: sqlite3.Connection, run_id: int, window: int, q: float, factor: float,
+                     min_runs: int, min_seconds: float) -> list[str]:
+    """Tests of run `run_id` slower than `factor` times the `q`-th percentile of
+    their previous `window` passing runs. Tests with fewer than `min_runs` of
+    history, or that slowed down by less than `min_seconds`, are not reported."""
+    baselines = history(db, run_id, window)
+    regressions = []
+    rows = db.execute("SELECT classname, name, seconds FROM results WHERE run_id = ? AND outcome = 'passed'"
+                      " ORDER BY classname, name", (run_id,))
+    for classname, name, seconds in rows:
+        previous = baselines.get((classname, name), [])
+        if len(previous) < min_runs:
+            continue
+        baseline = percentile(previous, q)
+        if seconds > baseline * factor and seconds - baseline >= min_seconds:
+            regressions.append(f"{classname}.{name}: {seconds:.3f}s vs p{q:g} {baseline:.3f}s "
+                               f"over {len(previous)} runs (x{seconds / baseline if baseline else float('inf'):.1f})")
+    return regressions
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Keep and check the timing history of JUnit reports")
+    parser.add_argument("--db", type=Path, default=ROOT / "test-history.sqlite", help="History database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_cmd = commands.add_parser("ingest", help="Store JUnit reports in the history")
+    ingest_cmd.add_argument("reports", nargs="+", type=Path)
+    ingest_cmd.add_argument("--commit", help="Git commit the reports ran on (default: HEAD)")
+
+    stats_cmd = commands.add_parser("stats", help="Print rolling duration percentiles per test")
+    stats_cmd.add_argument("--window", type=int, default=20, help="Runs per test to consider")
+    stats_cmd.add_argument("--top", type=int, default=20, help="Show this many slowest tests; 0 for all")
+
+    check_cmd = commands.add_parser("check", help="Report tests of the latest run that got slower")
+    check_cmd.add_argument("--window", type=int, default=20, help="Previous runs per test to compare with")
+    check_cmd.add_argument("--percentile", type=float, default=90, help="Baseline percentile of previous runs")
+    check_cmd.add_argument("--factor", type=float, default=2.0,
+                           help="Flag tests slower than this multiple of the baseline")
+    check_cmd.add_argument("--min-runs", type=int, default=5, help="History a test needs before it is checked")
+    check_cmd.add_argument("--min-seconds", type=float, default=0.05,
+                           help="Ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args(argv)
+
+    db = connect(args.db)
+    try:
+        if args.command == "ingest":
+            commit = args.commit or git_commit()
+            for report in args.reports:
+                run_id = ingest(db, report, commit)
+                if run_id is None:
+                    print(f"Already recorded: {report}")
+                else:
+                    print(f"Recorded {report} as run {run_id} ({commit or 'unknown commit'})")
+            return 0
+
+        if args.command == "stats":
+            rows = stats(db, args.window, [50, 90, 99])
+            rows.sort(key=lambda r: r["percentiles"][90], reverse=True)
+            print(f"{'runs':>5} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}  test")
+            for r in rows[:args.top or None]:
+                p = r["percentiles"]
+                print(f"{r['runs']:5} {p[50] * 1e3:8.1f} {p[90] * 1e3:8.1f} {p[99] * 1e3:8.1f}  "
+                      f"{r['classname']}.{r['name']}")
+            return 0
+
+        run_id = latest_run(db)
+        if run_id is None:
+            print("No runs recorded")
+            return 0
+        regressions = find_regressions(db, run_id, args.window, args.percentile, args.factor,
+                                       args.min_runs, args.min_seconds)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if not regressions:
+            print(f"No duration regressions in run {run_id}")
+        return 1 if regressions else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
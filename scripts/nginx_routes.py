@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Generate the nginx routing table of the per-user TikZiT sessions.
+
+Instead of two `location` blocks per user, nginx.conf extracts the first
+path segment of the URI once (`map $uri $tikzit_route_user`) and looks it up
+in one hash table (`map $tikzit_route_user $tikzit_upstream`). That table's
+entries are included from user_configs/tikzit.routes, which this script
+writes from the user registry. A request for a registered user's prefix is
+handed from `location /` to the single generic @tikzit_user location.
+Matching and reloading therefore no longer grow with one location per user.
+
+The table is written atomically and checked before nginx sees it. With
+--reload, `nginx -t` runs in the proxy container. If that fails, the
+previous table is restored before the error is reported.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+from provision_users import (CONFIG_DIR, PROXY_CONTAINER, REGISTRY_PATH, RESERVED_USERNAMES, USERNAME_RE,
+                             DockerCli, DockerError, UserRegistry, container_name, reload_proxy, write_atomic)
+
+
+ROUTES_FILE = "tikzit.routes"
+
+HEADER = ("# Generated by scripts/nginx_routes.py from the user registry; do not edit.\n"
+          "# Entries of the `map $tikzit_route_user $tikzit_upstream` table in nginx.conf.\n")
+
+# first line of the per-user location files multi_user_manager.sh used to write
+LEGACY_MARKER = "# Redirect clean URL -> Magic URL"
+
+
+def check_usernames(usernames) -> list[str]:
+    """The usernames sorted, or ValueError naming those that cannot be routed."""
+    usernames = sorted(set(usernames))
+    bad = [u for u in usernames if not USERNAME_RE.match(u) or u in RESERVED_USERNAMES]
+    if bad:
+        raise ValueError("cannot route usernames (lowercase letters and digits only, not "
+                         f"{', '.join(sorted(RESERVED_USERNAMES))}): {', '.join(bad)}")
+    return usernames
+
+
+def render_routes(usernames) -> str:
+    return HEADER + "".join(f"{u} {container_name(u)};\n" for u in check_usernames(usernames))
+
+
+def parse_routes(text: str) -> dict[str, str]:
+    """The username -> container entries of a routes file; ValueError if malformed."""
+    routes = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        fields = line.rstrip(";").split()
+        if not line.endswith(";") or len(fields) != 2 or fields[0] in routes:
+            raise ValueError(f"{ROUTES_FILE}:{number}: bad entry {line!r}")
+        routes[fields[0]] = fields[1]
+    return routes
+
+
+def legacy_files(config_dir: Path, usernames) -> list[Path]:
+    """Per-user location files of `usernames`, which would shadow the table."""
+    found = []
+    for username in usernames:
+        path = config_dir / f"{username}.conf"
+        try:
+            with open(path, encoding="utf-8") as f:
+                if f.readline().rstrip("\n") == LEGACY_MARKER:
+                    found.append(path)
+        except OSError:
+            continue
+    return found
+
+
+def update_routes(registry: UserRegistry, config_dir: Path, docker: DockerCli | None = None,
+                  proxy: str = PROXY_CONTAINER) -> bool:
+    """Regenerate the table from `registry`; returns whether anything changed.
+
+    With `docker`, a change is tested with `nginx -t` and reloaded, and a
+    table nginx rejects is rolled back.
+    """
+    path = config_dir / ROUTES_FILE
+    text = render_routes(registry.users)
+    if parse_routes(text) != {u: container_name(u) for u in registry.users}:
+        raise ValueError(f"{ROUTES_FILE}: generated table does not round-trip")
+    try:
+        previous = path.read_text(encoding="utf-8")
+    except OSError:
+        previous = None
+    legacy = legacy_files(config_dir, registry.users)
+    if text == previous and not legacy:
+        return False
+
+    write_atomic(path, text)
+    # the table supersedes these; parked rather than deleted so a rollback can restore them
+    parked = []
+    for legacy_path in legacy:
+        parked_path = legacy_path.with_name(legacy_path.name + ".migrated")
+        legacy_path.replace(parked_path)
+        parked.append((legacy_path, parked_path))
+    if docker is None:
+        return True
+    try:
+        reload_proxy(docker, proxy)
+    except DockerError:
+        if previous is None:
+            path.unlink()
+        else:
+            write_atomic(path, previous)
+        for legacy_path, parked_path in parked:
+            parked_path.replace(legacy_path)
+        raise
+    return True
+
+
+def main(argv: list[str], docker: DockerCli | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Regenerate the nginx routing table of the user sessions")
+    parser.add_argument("--add", nargs="+", default=[], metavar="USER", help="Register users first")
+    parser.add_argument("--registry", type=Path, default=REGISTRY_PATH, help="User registry file")
+    parser.add_argument("--config-dir", type=Path, default=CONFIG_DIR, help="Directory mounted at /etc/nginx/conf.d")
+    parser.add_argument("--reload", action="store_true", help="Test and reload nginx if the table changed")
+    parser.add_argument("--proxy", default=PROXY_CONTAINER, help="nginx container to reload")
+    args = parser.parse_args(argv)
+
+    registry = UserRegistry(args.registry)
+    try:
+        check_usernames(args.add)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    if args.add:
+        for username in args.add:
+            registry.add(username)
+        registry.save()
+    try:
+        changed = update_routes(registry, args.config_dir, (docker or DockerCli()) if args.reload else None,
+                                args.proxy)
+    except (ValueError, DockerError) as e:
+        print(f"❌ {e}")
+        return 1
+    state = "Updated" if changed else "Unchanged"
+    print(f"{state}: {args.config_dir / ROUTES_FILE} ({len(registry.users)} users)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -10,12 +10,29 @@ headers such as `src/data/mgbPluginInterface.h`.
 from __future__ import annotations
 
 import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import lzma
 import os
 import shutil
+import struct
 import tarfile
 import tempfile
+import time
 import zipfile
-from pathlib import Path
+import zlib
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from include_closure import IncludeIndex, default_index_path, include_closure
+
+try:
+    import zstandard
+except ImportError:  # only needed for .tar.zst output
+    zstandard = None
 
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -31,15 +48,22 @@ SDK_SOURCE_FILES = [
     ROOT / "VERSION.txt",
 ]
 
+# Bump when the archive layout changes so cached builds are not reused.
+BUILD_CACHE_VERSION = 2
+
+ZIP_COMPRESSLEVEL = 6
+
+# Every member gets this timestamp (1980-01-01, the earliest a zip can hold) so
+# identical inputs produce byte-identical archives. SOURCE_DATE_EPOCH overrides it.
+DEFAULT_SOURCE_DATE_EPOCH = 315532800
+
+# Plugin-facing entry points. Everything they #include is packaged with them,
+# see plugin_headers().
 PLUGIN_HEADER_FILES = [
-    ROOT / "src" / "mgb_api.h",
     ROOT / "src" / "util.h",
     ROOT / "src" / "data" / "mgbPluginInterface.h",
-    ROOT / "src" / "data" / "mgbPluginManager.h",
     ROOT / "src" / "data" / "node.h",
     ROOT / "src" / "data" / "style.h",
-    ROOT / "src" / "data" / "graphelementdata.h",
-    ROOT / "src" / "data" / "graphelementproperty.h",
     ROOT / "src" / "gui" / "nodeitem.h",
 ]
 
@@ -49,46 +73,154 @@ def copy_file(src: Path, dst: Path) -> None:
     shutil.copy2(src, dst)
 
 
-def build_sdk_tree(stage: Path, platform_name: str) -> Path:
-    sdk_root = stage / f"mgb-uml-plugin-sdk-{platform_name}"
-    sdk_root.mkdir(parents=True)
+def sdk_root_name(platform_name: str) -> str:
+    return f"mgb-uml-plugin-sdk-{platform_name}"
+
+
+def plugin_headers() -> list[Path]:
+    """PLUGIN_HEADER_FILES and their transitive include closure."""
+    index = IncludeIndex(default_index_path())
+    headers = include_closure(PLUGIN_HEADER_FILES, index)
+    index.save()
+    return headers
+
+
+def sdk_members(platform_name: str) -> list[tuple[str, Path]]:
+    """Map every SDK input file to its path relative to the SDK root."""
+    members = []
 
     for src in SDK_SOURCE_FILES:
         if src.exists():
-            copy_file(src, sdk_root / src.name)
+            members.append((src.name, src))
 
     for src_dir in SDK_SOURCE_DIRS:
         if src_dir.exists():
-            shutil.copytree(src_dir, sdk_root / src_dir.name)
+            for path in sorted(src_dir.rglob("*")):
+                if path.is_file():
+                    members.append((f"{src_dir.name}/{path.relative_to(src_dir).as_posix()}", path))
 
-    for header in PLUGIN_HEADER_FILES:
-        if not header.exists():
-            raise FileNotFoundError(f"Required SDK header is missing: {header}")
-        rel = header.relative_to(ROOT)
-        copy_file(header, sdk_root / "include" / "mgb-uml" / rel)
+    for header in plugin_headers():
+        members.append((f"include/mgb-uml/{header.relative_to(ROOT).as_posix()}", header))
 
-    manifest = sdk_root / "SDK_MANIFEST.txt"
-    manifest.write_text(
-        "\n".join(
-            [
-                "MGB-UML Plugin SDK",
-                f"Platform package: {platform_name}",
-                "",
-                "Contents:",
-                "- include/mgb-uml: plugin-facing MGB-UML headers",
-                "- docs: plugin development guide",
-                "- templates/basic-node-plugin: working compiled plugin template",
-                "",
-                "Set MGB_UML_SDK to this directory before building the template.",
-                "",
-            ]
-        ),
-        encoding="utf-8",
+    return members
+
+
+def sdk_manifest_text(platform_name: str) -> str:
+    return "\n".join(
+        [
+            "MGB-UML Plugin SDK",
+            f"Platform package: {platform_name}",
+            "",
+            "Contents:",
+            "- include/mgb-uml: plugin-facing MGB-UML headers",
+            "- docs: plugin development guide",
+            "- templates/basic-node-plugin: working compiled plugin template",
+            "",
+            "Set MGB_UML_SDK to this directory before building the template.",
+            "",
+        ]
     )
 
+
+def build_sdk_tree(stage: Path, platform_name: str, members: list[tuple[str, Path]] | None = None) -> Path:
+    sdk_root = stage / sdk_root_name(platform_name)
+    sdk_root.mkdir(parents=True)
+
+    for arcname, src in members if members is not None else sdk_members(platform_name):
+        copy_file(src, sdk_root / arcname)
+
+    manifest = sdk_root / "SDK_MANIFEST.txt"
+    manifest.write_text(sdk_manifest_text(platform_name), encoding="utf-8")
+
     return sdk_root
 
 
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive_format(output: Path) -> str:
+    if output.name.endswith(".tar.gz") or output.name.endswith(".tgz"):
+        return "tar.gz"
+    if output.name.endswith(".tar.xz") or output.name.endswith(".txz"):
+        return "tar.xz"
+    if output.name.endswith(".tar.zst") or output.name.endswith(".tzst"):
+        if zstandard is None:
+            raise ValueError("Writing .tar.zst requires the zstandard package")
+        return "tar.zst"
+    if output.suffix == ".zip":
+        return "zip"
+    raise ValueError("Output must end with .zip, .tar.gz, .tgz, .tar.xz, .txz, .tar.zst or .tzst")
+
+
+def source_date_epoch() -> int:
+    return int(os.environ.get("SOURCE_DATE_EPOCH", DEFAULT_SOURCE_DATE_EPOCH))
+
+
+def member_mode(src: Path | None) -> int:
+    """Normalised permission bits, so the umask of the checkout does not leak in."""
+    if src is not None and os.access(src, os.X_OK):
+        return 0o755
+    return 0o644
+
+
+def archive_entries(platform_name: str, members: list[tuple[str, Path]] | None = None) -> list[tuple[str, Path | None]]:
+    """All archive members in arcname order; the generated manifest has no source path."""
+    members = members if members is not None else sdk_members(platform_name)
+    return sorted(members + [("SDK_MANIFEST.txt", None)], key=lambda entry: entry[0])
+
+
+def build_info_path(output: Path) -> Path:
+    return output.with_name(output.name + ".inputs.json")
+
+
+def input_hashes(platform_name: str, members: list[tuple[str, Path]] | None = None) -> dict[str, str]:
+    """SHA-256 of every archive member, keyed by its arcname under the SDK root."""
+    members = members if members is not None else sdk_members(platform_name)
+    hashes = {arcname: file_digest(src) for arcname, src in members}
+    hashes["SDK_MANIFEST.txt"] = hashlib.sha256(sdk_manifest_text(platform_name).encode("utf-8")).hexdigest()
+    return hashes
+
+
+def load_build_info(output: Path) -> dict | None:
+    try:
+        info = json.loads(build_info_path(output).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if info.get("version") != BUILD_CACHE_VERSION or not output.exists():
+        return None
+    if info.get("archive_sha256") != file_digest(output):
+        return None
+    return info
+
+
+def build_is_current(info: dict | None, platform_name: str, fmt: str, members: dict[str, str]) -> bool:
+    return (
+        info is not None
+        and info.get("platform") == platform_name
+        and info.get("format") == fmt
+        and info.get("source_date_epoch") == source_date_epoch()
+        and info.get("members") == members
+    )
+
+
+def write_build_info(output: Path, platform_name: str, fmt: str, members: dict[str, str]) -> None:
+    info = {
+        "version": BUILD_CACHE_VERSION,
+        "platform": platform_name,
+        "format": fmt,
+        "compresslevel": ZIP_COMPRESSLEVEL,
+        "source_date_epoch": source_date_epoch(),
+        "members": members,
+        "archive_sha256": file_digest(output),
+    }
+    build_info_path(output).write_text(json.dumps(info, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+
 def make_zip(src_dir: Path, output: Path) -> None:
     with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
         for path in src_dir.rglob("*"):
@@ -100,25 +232,240 @@ def make_tar_gz(src_dir: Path, output: Path) -> None:
         archive.add(src_dir, arcname=src_dir.name)
 
 
+def dos_datetime(date_time: tuple) -> tuple[int, int]:
+    year, month, day, hour, minute, second = date_time[:6]
+    if year < 1980:  # zip timestamps start in 1980
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    return (hour << 11 | minute << 5 | second // 2,
+            (year - 1980) << 9 | month << 5 | day)
+
+
+def deflate(data: bytes, level: int = ZIP_COMPRESSLEVEL) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def deflate_file(path: Path, level: int = ZIP_COMPRESSLEVEL) -> tuple[bytes, int, int]:
+    """Deflate a file in chunks; returns the raw stream, its CRC-32 and size."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    chunks, crc, size = [], 0, 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            chunks.append(compressor.compress(chunk))
+    chunks.append(compressor.flush())
+    return b"".join(chunks), crc, size
+
+
+class RawZipWriter:
+    """Minimal zip writer for members that are already deflated.
+
+    zipfile can only add members by compressing them itself; writing the
+    container directly lets unchanged members be copied byte-for-byte from the
+    previous archive.
+    """
+
+    def __init__(self, output: Path):
+        self.fp = open(output, "wb")
+        self.entries = []
+
+    def add(self, arcname: str, raw: bytes, crc: int, size: int,
+            dos_time: tuple[int, int], mode: int) -> None:
+        name = arcname.encode("utf-8")
+        flags = 0 if name.isascii() else 0x800
+        offset = self.fp.tell()
+        if max(offset, len(raw), size) > 0xFFFFFFFF:
+            raise ValueError("SDK archives larger than 4 GiB are not supported")
+        self.fp.write(struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, flags, zipfile.ZIP_DEFLATED,
+                                  dos_time[0], dos_time[1], crc, len(raw), size, len(name), 0))
+        self.fp.write(name)
+        self.fp.write(raw)
+        self.entries.append((name, flags, dos_time, crc, len(raw), size, mode, offset))
+
+    def close(self) -> None:
+        start = self.fp.tell()
+        for name, flags, dos_time, crc, compressed, size, mode, offset in self.entries:
+            self.fp.write(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, 3 << 8 | 20, 20, flags,
+                                      zipfile.ZIP_DEFLATED, dos_time[0], dos_time[1], crc, compressed,
+                                      size, len(name), 0, 0, 0, 0, (mode & 0xFFFF) << 16, offset))
+            self.fp.write(name)
+        end = self.fp.tell()
+        count = len(self.entries)
+        self.fp.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, end - start, start, 0))
+        self.fp.close()
+
+
+def read_raw_member(fp, info: zipfile.ZipInfo) -> bytes:
+    fp.seek(info.header_offset + 26)
+    name_len, extra_len = struct.unpack("<HH", fp.read(4))
+    fp.seek(info.header_offset + 30 + name_len + extra_len)
+    return fp.read(info.compress_size)
+
+
+def compress_member(platform_name: str, src: Path | None) -> tuple[bytes, int, int]:
+    if src is None:
+        data = sdk_manifest_text(platform_name).encode("utf-8")
+        return deflate(data), zlib.crc32(data), len(data)
+    return deflate_file(src)
+
+
+def make_sdk_zip(platform_name: str, output: Path, hashes: dict[str, str], previous: dict | None,
+                 pool: Executor, members: list[tuple[str, Path]] | None = None) -> tuple[int, int]:
+    """Write the SDK zip, reusing compressed members whose inputs did not change.
+
+    Changed members are deflated concurrently on `pool`. Returns the number of
+    reused and repacked members. `members` defaults to sdk_members().
+    """
+    root = sdk_root_name(platform_name)
+    dos_time = dos_datetime(time.gmtime(source_date_epoch()))
+    old_members = {}
+    if (previous is not None and previous.get("format") == "zip"
+            and previous.get("platform") == platform_name
+            and previous.get("compresslevel") == ZIP_COMPRESSLEVEL
+            and previous.get("source_date_epoch") == source_date_epoch()):
+        old_members = previous["members"]
+
+    tmp = output.with_name(output.name + ".tmp")
+    reused = repacked = 0
+    with contextlib.ExitStack() as stack:
+        old = old_fp = None
+        if old_members:
+            old = stack.enter_context(zipfile.ZipFile(output))
+            old_fp = stack.enter_context(open(output, "rb"))
+        entries = []
+        for arcname, src in archive_entries(platform_name, members):
+            full = f"{root}/{arcname}"
+            info = old.NameToInfo.get(full) if old is not None else None
+            if (info is not None and old_members.get(arcname) == hashes[arcname]
+                    and info.compress_type == zipfile.ZIP_DEFLATED):
+                entries.append((full, src, info))
+            else:
+                entries.append((full, src, pool.submit(compress_member, platform_name, src)))
+        writer = RawZipWriter(tmp)
+        try:
+            for full, src, member in entries:
+                if isinstance(member, zipfile.ZipInfo):
+                    raw, crc, size = read_raw_member(old_fp, member), member.CRC, member.file_size
+                    reused += 1
+                else:
+                    raw, crc, size = member.result()
+                    repacked += 1
+                writer.add(full, raw, crc, size, dos_time, 0o100000 | member_mode(src))
+        finally:
+            writer.close()
+    os.replace(tmp, output)
+    return reused, repacked
+
+
+def tar_info(name: str, mode: int, size: int = 0, directory: bool = False) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.DIRTYPE if directory else tarfile.REGTYPE
+    info.mode, info.size, info.mtime = mode, size, source_date_epoch()
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    return info
+
+
+@contextlib.contextmanager
+def compressed_writer(fileobj, fmt: str):
+    if fmt == "tar.gz":
+        # mtime=0 and no file name keep the gzip header reproducible
+        stream = gzip.GzipFile(filename="", mode="wb", fileobj=fileobj, compresslevel=9, mtime=0)
+    elif fmt == "tar.xz":
+        stream = lzma.LZMAFile(fileobj, "wb", preset=6)
+    else:
+        stream = zstandard.ZstdCompressor(level=19).stream_writer(fileobj, closefd=False)
+    with stream:
+        yield stream
+
+
+def write_sdk_tar(platform_name: str, output: Path, fmt: str, members: list[tuple[str, Path]] | None = None) -> None:
+    """Write the SDK as a compressed tar straight from the source files, without a staging tree."""
+    root = sdk_root_name(platform_name)
+    tmp = output.with_name(output.name + ".tmp")
+    with open(tmp, "wb") as raw, compressed_writer(raw, fmt) as stream, \
+            tarfile.open(fileobj=stream, mode="w", format=tarfile.PAX_FORMAT) as archive:
+        dirs = set()
+        for arcname, src in archive_entries(platform_name, members):
+            full = PurePosixPath(root, arcname)
+            # tarfile.add() would have emitted the parent directories too
+            for parent in reversed(full.parents[:-1]):
+                if parent not in dirs:
+                    dirs.add(parent)
+                    archive.addfile(tar_info(parent.as_posix(), 0o755, directory=True))
+            if src is None:
+                data = sdk_manifest_text(platform_name).encode("utf-8")
+                archive.addfile(tar_info(full.as_posix(), 0o644, len(data)), io.BytesIO(data))
+                continue
+            with open(src, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                archive.addfile(tar_info(full.as_posix(), member_mode(src), size), f)
+    os.replace(tmp, output)
+
+
+def build_archive(platform_name: str, output: Path, fmt: str, hashes: dict[str, str],
+                  previous: dict | None, pool: Executor, members: list[tuple[str, Path]]) -> str:
+    if fmt == "zip":
+        reused, repacked = make_sdk_zip(platform_name, output, hashes, previous, pool, members)
+        return f"Repacked {repacked} members, reused {reused} unchanged"
+    write_sdk_tar(platform_name, output, fmt, members)
+    return f"Compressed {len(hashes)} members"
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(description="Package the MGB-UML plugin SDK")
     parser.add_argument("--platform", required=True, help="Platform label, e.g. linux, windows, macos")
-    parser.add_argument("--output", required=True, type=Path, help="Output .zip or .tar.gz path")
+    parser.add_argument("--output", required=True, type=Path, action="append",
+                        help="Output .zip, .tar.gz, .tar.xz or .tar.zst path; repeat to write several formats")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Members to compress in parallel (default: number of CPUs)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Rebuild even if the inputs match the existing archive")
+    parser.add_argument("--stage", action="store_true",
+                        help="Copy the SDK into a temporary directory before archiving instead of "
+                             "streaming the source files into the archive")
     args = parser.parse_args()
 
-    output = args.output.resolve()
-    output.parent.mkdir(parents=True, exist_ok=True)
+    outputs = {output.resolve(): archive_format(output) for output in args.output}
+    if args.stage and any(fmt not in ("zip", "tar.gz") for fmt in outputs.values()):
+        raise ValueError("--stage only supports .zip and .tar.gz output")
 
-    with tempfile.TemporaryDirectory() as tmp:
-        sdk_root = build_sdk_tree(Path(tmp), args.platform)
-        if output.name.endswith(".tar.gz") or output.name.endswith(".tgz"):
-            make_tar_gz(sdk_root, output)
-        elif output.suffix == ".zip":
-            make_zip(sdk_root, output)
+    # the include closure is scanned once here, not once per output thread
+    members = sdk_members(args.platform)
+    hashes = input_hashes(args.platform, members)
+    todo = []
+    for output, fmt in outputs.items():
+        output.parent.mkdir(parents=True, exist_ok=True)
+        previous = None if args.no_cache else load_build_info(output)
+        if build_is_current(previous, args.platform, fmt, hashes):
+            print(f"Up to date: {output}")
         else:
-            raise ValueError("Output must end with .zip, .tar.gz, or .tgz")
+            todo.append((output, fmt, previous))
 
-    print(f"Created {output}")
+    if args.stage and todo:
+        with tempfile.TemporaryDirectory() as tmp:
+            sdk_root = build_sdk_tree(Path(tmp), args.platform, members)
+            for output, fmt, _ in todo:
+                if fmt == "zip":
+                    make_zip(sdk_root, output)
+                else:
+                    make_tar_gz(sdk_root, output)
+    elif todo:
+        # each output is written by its own thread; zip members are deflated on `pool`
+        with ThreadPoolExecutor(max(1, args.jobs)) as pool, ThreadPoolExecutor(len(todo)) as builds:
+            jobs = [builds.submit(build_archive, args.platform, output, fmt, hashes, previous, pool, members)
+                    for output, fmt, previous in todo]
+            for job in jobs:
+                print(job.result())
+
+    for output, fmt, _ in todo:
+        if args.stage:
+            # staged archives keep the files' real mtimes: never report them as reproducible builds
+            build_info_path(output).unlink(missing_ok=True)
+        else:
+            write_build_info(output, args.platform, fmt, hashes)
+        print(f"Created {output}")
     return 0
 
 
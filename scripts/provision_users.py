@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""Provision TikZiT user sessions in bulk.
+
+The batch counterpart of multi_user_manager.sh. Instead of a `docker ps -a |
+grep`, a `docker run` and an nginx reload per user, the existing containers
+are listed once. The user containers are then started concurrently on a
+bounded pool. The nginx routing table is regenerated from the registry
+(scripts/nginx_routes.py), and the proxy is tested and reloaded once at the end.
+
+Provisioned users are recorded in a registry (user_registry.json by default),
+which the other session tools read. With --warm-pool, new users are handed
+pre-booted containers (scripts/warm_pool.py) when one is ready.
+
+All docker calls go through `DockerCli.run`, so tests can pass a stand-in.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+IMAGE_NAME = "registry.digitalocean.com/mgb-uml/tikzit:latest"
+NETWORK_NAME = "tikzit_net"
+PROXY_CONTAINER = "tikzit_proxy"
+CONFIG_DIR = Path("user_configs")
+REGISTRY_PATH = Path("user_registry.json")
+DOMAIN = "mgb-uml.me"
+
+USERNAME_RE = re.compile(r"^[a-z0-9]+$")
+# first path segments nginx serves itself, and the shared session's container
+RESERVED_USERNAMES = frozenset({"default", "docs", "proxy"})
+
+REGISTRY_VERSION = 1
+
+
+class DockerError(RuntimeError):
+    pass
+
+
+class DockerCli:
+    """Runs the docker command line client."""
+
+    def __init__(self, docker: str = "docker"):
+        self.docker = docker
+
+    def run(self, *args: str, env: dict[str, str] | None = None) -> str:
+        """Run `docker ARGS...` and return its stdout; raises DockerError on failure.
+
+        `env` adds variables to the client's environment, so that `-e NAME`
+        can pass a secret without it appearing on the command line.
+        """
+        result = subprocess.run([self.docker, *args], capture_output=True, text=True,
+                                env={**os.environ, **env} if env else None)
+        if result.returncode != 0:
+            raise DockerError(f"docker {args[0]}: {result.stderr.strip() or f'exit status {result.returncode}'}")
+        return result.stdout
+
+
+def container_name(username: str) -> str:
+    return f"tikzit_{username}"
+
+
+def volume_name(username: str) -> str:
+    return f"tikzit_data_{username}"
+
+
+def session_url(username: str, domain: str = DOMAIN, token: str | None = None) -> str:
+    # the ?path=... parameter makes noVNC open the websocket under the user's prefix;
+    # a token for the gateway (scripts/vnc_gateway.py) rides along, escaped, in that path
+    path = f"{username}/websockify" + (f"%3Ftoken%3D{token}" if token else "")
+    return f"https://{domain}/{username}/vnc.html?path={path}"
+
+
+def read_env_file(path: Path) -> dict[str, str]:
+    """KEY=VALUE lines of a .env file; blank lines and # comments are skipped."""
+    env = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        env[key.strip()] = value
+    return env
+
+
+def read_user_list(path: Path) -> list[str]:
+    """One username per line; blank lines and # comments are skipped. '-' reads stdin."""
+    text = sys.stdin.read() if str(path) == "-" else path.read_text(encoding="utf-8")
+    return [line.split("#", 1)[0].strip() for line in text.splitlines() if line.split("#", 1)[0].strip()]
+
+
+def write_atomic(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def read_json_lines(path: Path) -> list[dict]:
+    """One JSON object per line, as the session logs append them; unparseable lines are skipped."""
+    entries = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+class UserRegistry:
+    """The provisioned users, persisted as JSON: {username: {container, volume, created}}."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.users = {}
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("version") == REGISTRY_VERSION:
+            self.users = data.get("users", {})
+
+    def add(self, username: str, volume: str | None = None) -> None:
+        self.users.setdefault(username, {
+            "container": container_name(username),
+            "volume": volume or volume_name(username),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        })
+
+    def volume(self, username: str) -> str:
+        """The user's data volume; one claimed from the warm pool keeps its slot name."""
+        return self.users.get(username, {}).get("volume") or volume_name(username)
+
+    def save(self) -> None:
+        write_atomic(self.path, json.dumps({"version": REGISTRY_VERSION, "users": self.users},
+                                           indent=2, sort_keys=True) + "\n")
+
+
+def existing_containers(docker: DockerCli) -> set[str]:
+    return set(docker.run("ps", "-a", "--format", "{{.Names}}").split())
+
+
+def start_container(docker: DockerCli, username: str, vnc_password: str, image: str = IMAGE_NAME,
+                    network: str = NETWORK_NAME, volume: str | None = None) -> None:
+    # each user gets their own data volume so they don't overwrite others
+    docker.run("run", "-d",
+               "--name", container_name(username),
+               "--network", network,
+               "--restart", "always",
+               "-e", "VNC_PASSWORD",
+               "-v", f"{volume or volume_name(username)}:/home/tikzituser/.local/share/tikzit",
+               image,
+               env={"VNC_PASSWORD": vnc_password})
+
+
+def provision_user(docker: DockerCli, username: str, vnc_password: str, existing: set[str],
+                   recreate: bool, image: str, network: str, volume: str | None = None,
+                   pool=None) -> tuple[str, str | None]:
+    """Start one user's container; returns its outcome ('created', 'recreated',
+    'exists' or 'claimed') and the data volume of a claimed pool container.
+
+    A user without a data volume of their own is given a ready container of
+    the warm `pool` (scripts/warm_pool.py) if there is one.
+    """
+    name = container_name(username)
+    if name in existing:
+        if not recreate:
+            return "exists", None
+        docker.run("rm", "-f", name)
+    elif pool is not None and volume is None:
+        claimed = pool.claim(name)
+        if claimed is not None:
+            return "claimed", claimed
+    start_container(docker, username, vnc_password, image, network, volume)
+    return "recreated" if name in existing else "created", None
+
+
+def reload_proxy(docker: DockerCli, proxy: str = PROXY_CONTAINER) -> None:
+    """Test the proxy configuration, then reload it; a bad config is never loaded."""
+    docker.run("exec", proxy, "nginx", "-t")
+    docker.run("exec", proxy, "nginx", "-s", "reload")
+
+
+def existing_volumes(docker: DockerCli) -> set[str]:
+    return set(docker.run("volume", "ls", "--format", "{{.Name}}").split())
+
+
+def provision(docker: DockerCli, usernames: list[str], vnc_password: str, config_dir: Path,
+              registry: UserRegistry, jobs: int = 4, recreate: bool = False, image: str = IMAGE_NAME,
+              network: str = NETWORK_NAME, proxy: str = PROXY_CONTAINER, warm_pool=None) -> dict[str, str]:
+    """Provision `usernames` and reload the proxy once; maps each user to its outcome.
+
+    Outcomes are 'created', 'recreated', 'exists', 'claimed' (from
+    `warm_pool`) or 'failed: <reason>'. Only users whose container is running
+    are registered and get a route. Claimed pool containers are replaced in
+    the background; wait on `warm_pool.refill_in_background()` before exiting.
+    """
+    from nginx_routes import update_routes  # nginx_routes imports this module
+
+    existing = existing_containers(docker)
+    volumes = existing_volumes(docker) if warm_pool is not None else set()
+    outcomes, claimed = {}, {}
+    with ThreadPoolExecutor(max(1, min(jobs, len(usernames)))) as pool:
+        starts = {}
+        for username in usernames:
+            volume = registry.volume(username)
+            # only users without data of their own may take a pool container
+            own = volume if username in registry.users or volume in volumes else None
+            starts[username] = pool.submit(provision_user, docker, username, vnc_password, existing,
+                                           recreate, image, network, own, warm_pool)
+        for username, start in starts.items():
+            try:
+                outcomes[username], claimed[username] = start.result()
+            except DockerError as e:
+                outcomes[username] = f"failed: {e}"
+
+    ready = [u for u in usernames if not outcomes[u].startswith("failed")]
+    for username in ready:
+        registry.add(username, claimed.get(username))
+    registry.save()
+    if warm_pool is not None and any(claimed.values()):
+        warm_pool.refill_in_background()
+    update_routes(registry, config_dir, docker, proxy)
+    return outcomes
+
+
+def main(argv: list[str], docker: DockerCli | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Create TikZiT user sessions in bulk")
+    parser.add_argument("users", nargs="*", help="Usernames (lowercase letters and digits)")
+    parser.add_argument("-f", "--file", type=Path, action="append", default=[],
+                        help="File with one username per line ('-' for stdin); may be repeated")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="Containers to start at once")
+    parser.add_argument("--recreate", action="store_true",
+                        help="Delete and recreate containers of users that already exist")
+    parser.add_argument("--env-file", type=Path, default=Path(".env"), help="File that sets VNC_PASSWORD")
+    parser.add_argument("--config-dir", type=Path, default=CONFIG_DIR, help="nginx route directory")
+    parser.add_argument("--registry", type=Path, default=REGISTRY_PATH, help="User registry file")
+    parser.add_argument("--image", default=IMAGE_NAME)
+    parser.add_argument("--network", default=NETWORK_NAME)
+    parser.add_argument("--proxy", default=PROXY_CONTAINER, help="nginx container to reload")
+    parser.add_argument("--domain", default=DOMAIN, help="Domain used in the printed session URLs")
+    parser.add_argument("--warm-pool", type=int, metavar="SIZE",
+                        help="Give new users pre-booted containers and keep SIZE of them booted")
+    args = parser.parse_args(argv)
+
+    usernames = list(args.users)
+    for path in args.file:
+        usernames.extend(read_user_list(path))
+    usernames = list(dict.fromkeys(usernames))
+    if not usernames:
+        parser.error("no usernames given")
+    invalid = [u for u in usernames if not USERNAME_RE.match(u) or u in RESERVED_USERNAMES]
+    if invalid:
+        print(f"❌ Invalid usernames (use lowercase letters and numbers only, not "
+              f"{', '.join(sorted(RESERVED_USERNAMES))}): {', '.join(invalid)}")
+        return 1
+
+    try:
+        vnc_password = read_env_file(args.env_file)["VNC_PASSWORD"]
+    except (OSError, KeyError):
+        print(f"❌ Error: {args.env_file} does not set VNC_PASSWORD. Cannot start containers without a password.")
+        return 1
+
+    docker = docker or DockerCli()
+    warm_pool = None
+    if args.warm_pool is not None:
+        from warm_pool import WarmPool  # warm_pool imports this module
+        warm_pool = WarmPool(docker, vnc_password, args.warm_pool, args.image, args.network)
+
+    from vnc_gateway import gateway_secret, token_url  # vnc_gateway imports this module
+    secret = gateway_secret(args.env_file)
+
+    def url(username):
+        # the gateway only lets viewers with a token in
+        return token_url(secret, username, domain=args.domain) if secret else session_url(username, args.domain)
+
+    start = time.perf_counter()
+    try:
+        outcomes = provision(docker, usernames, vnc_password, args.config_dir,
+                             UserRegistry(args.registry), args.jobs, args.recreate, args.image,
+                             args.network, args.proxy, warm_pool)
+    except DockerError as e:
+        print(f"❌ {e}")
+        return 1
+    failed = 0
+    for username, outcome in outcomes.items():
+        if outcome.startswith("failed"):
+            failed += 1
+            print(f"❌ {username}: {outcome}")
+        else:
+            print(f"✅ {username} ({outcome}): {url(username)}")
+    print(f"Provisioned {len(outcomes) - failed} of {len(outcomes)} users in {time.perf_counter() - start:.1f}s")
+    if warm_pool is not None:
+        # the users above can already connect; only the pool waits for this
+        try:
+            booted = warm_pool.refill_in_background().result()
+        except DockerError as e:
+            print(f"❌ Refilling the warm pool failed: {e}")
+            return 1
+        print(f"Warm pool: booted {len(booted)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
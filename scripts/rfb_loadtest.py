@@ -0,0 +1,788 @@
+#!/usr/bin/env python3
+"""Record a noVNC session and replay it from many simulated viewers.
+
+`record` is a websocket proxy between one noVNC viewer and a session, e.g.
+vnc.html?host=localhost&port=6080&path=websockify&encrypt=0 in front of
+wss://mgb-uml.me/<user>/websockify?token=.... It relays the RFB handshake
+untouched (VNC authentication included) and then records every message
+with its time: framebuffer updates from the server, and key, pointer and
+clipboard events from the viewer. The viewer's encodings are narrowed to
+those this tool can parse (ZRLE, CopyRect, Raw and the DesktopSize and
+LastRect pseudo-encodings), which noVNC all supports.
+
+`replay` runs N viewers against /<user>/websockify routes, through nginx
+and the gateway (scripts/vnc_gateway.py) or straight to a stand-in. Each
+viewer authenticates and asks for the whole screen. It then sends the
+recorded input events at their recorded times and asks for the next
+incremental update whenever one arrives, like noVNC. The frame latency of
+an update is measured from the request it answers. For an incremental
+request, which the server only answers once the screen changes, it is
+measured from the first input event sent after that request. Updates
+nobody asked for by input are counted but not timed. The report gives
+latency percentiles, bandwidth per session, the viewers' own CPU and,
+with --docker, the CPU each session's container used.
+
+`stub` is a stand-in RFB server for running all of this without
+containers. It serves websockets on /<user>/websockify and, with
+--rfb-listen, raw RFB as the gateway expects of Xvnc. It replays the
+recorded updates at their recorded times, or without a recording answers
+each input event with a small raw update.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hmac
+import json
+import os
+import ssl
+import struct
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from provision_users import DockerCli, DockerError, container_name, read_env_file, write_atomic
+from stats import percentile
+from vnc_gateway import (OP_BINARY, OP_CLOSE, OP_CONTINUATION, OP_PING, OP_PONG, SESSION_PATH, ProtocolError,
+                         accept_key, encode_frame, gateway_secret, read_frame, read_request, session_token)
+
+
+RECORDING_VERSION = 1
+DEFAULT_URL = "wss://mgb-uml.me/{user}/websockify?token={token}"
+RFB_VERSION = b"RFB 003.008\n"
+SEC_NONE, SEC_VNC_AUTH = 1, 2
+
+# client to server
+SET_PIXEL_FORMAT, SET_ENCODINGS, FB_UPDATE_REQUEST, KEY_EVENT, POINTER_EVENT, CLIENT_CUT_TEXT = 0, 2, 3, 4, 5, 6
+INPUT_MESSAGES = (KEY_EVENT, POINTER_EVENT, CLIENT_CUT_TEXT)
+# server to client
+FB_UPDATE, SET_COLOUR_MAP, BELL, SERVER_CUT_TEXT = 0, 1, 2, 3
+
+ENC_RAW, ENC_COPYRECT, ENC_ZRLE, ENC_DESKTOP_SIZE, ENC_LAST_RECT = 0, 1, 16, -223, -224
+REPLAY_ENCODINGS = (ENC_ZRLE, ENC_COPYRECT, ENC_RAW, ENC_DESKTOP_SIZE, ENC_LAST_RECT)
+
+# 32 bits per pixel, depth 24, little-endian true colour 0xRRGGBB
+DEFAULT_PIXEL_FORMAT = struct.pack("!BBBBHHHBBB3x", 32, 24, 0, 1, 255, 255, 255, 16, 8, 0)
+
+
+# --- VNC authentication -----------------------------------------------------------
+# DES is not in the standard library; one block per connection is cheap enough in Python
+
+_PC1 = (57, 49, 41, 33, 25, 17, 9, 1, 58, 50, 42, 34, 26, 18, 10, 2, 59, 51, 43, 35, 27, 19, 11, 3, 60, 52, 44,
+        36, 63, 55, 47, 39, 31, 23, 15, 7, 62, 54, 46, 38, 30, 22, 14, 6, 61, 53, 45, 37, 29, 21, 13, 5, 28, 20,
+        12, 4)
+_PC2 = (14, 17, 11, 24, 1, 5, 3, 28, 15, 6, 21, 10, 23, 19, 12, 4, 26, 8, 16, 7, 27, 20, 13, 2, 41, 52, 31, 37,
+        47, 55, 30, 40, 51, 45, 33, 48, 44, 49, 39, 56, 34, 53, 46, 42, 50, 36, 29, 32)
+_SHIFTS = (1, 1, 2, 2, 2, 2, 2, 2, 1, 2, 2, 2, 2, 2, 2, 1)
+_IP = (58, 50, 42, 34, 26, 18, 10, 2, 60, 52, 44, 36, 28, 20, 12, 4, 62, 54, 46, 38, 30, 22, 14, 6, 64, 56, 48,
+       40, 32, 24, 16, 8, 57, 49, 41, 33, 25, 17, 9, 1, 59, 51, 43, 35, 27, 19, 11, 3, 61, 53, 45, 37, 29, 21, 13,
+       5, 63, 55, 47, 39, 31, 23, 15, 7)
+_FP = (40, 8, 48, 16, 56, 24, 64, 32, 39, 7, 47, 15, 55, 23, 63, 31, 38, 6, 46, 14, 54, 22, 62, 30, 37, 5, 45,
+       13, 53, 21, 61, 29, 36, 4, 44, 12, 52, 20, 60, 28, 35, 3, 43, 11, 51, 19, 59, 27, 34, 2, 42, 10, 50, 18, 58,
+       26, 33, 1, 41, 9, 49, 17, 57, 25)
+_E = (32, 1, 2, 3, 4, 5, 4, 5, 6, 7, 8, 9, 8, 9, 10, 11, 12, 13, 12, 13, 14, 15, 16, 17, 16, 17, 18, 19, 20, 21,
+      20, 21, 22, 23, 24, 25, 24, 25, 26, 27, 28, 29, 28, 29, 30, 31, 32, 1)
+_P = (16, 7, 20, 21, 29, 12, 28, 17, 1, 15, 23, 26, 5, 18, 31, 10, 2, 8, 24, 14, 32, 27, 3, 9, 19, 13, 30, 6, 22,
+      11, 4, 25)
+# one hex digit per entry, rows of 16 one after the other
+_SBOXES = tuple(tuple(int(digit, 16) for digit in box) for box in (
+    "e4d12fb83a6c59070f74e2d1a6cb953841e8d62bfc973a50fc8249175b3ea06d",
+    "f18e6b34972dc05a3d47f28ec01a69b50e7ba4d158c6932fd8a13f42b67c05e9",
+    "a09e63f51dc7b428d709346a285ecbf1d6498f30b12c5ae71ad069874fe3b52c",
+    "7de3069a1285bc4fd8b56f03472c1ae9a690cb7df13e52843f06a1d8945bc72e",
+    "2c417ab6853fd0e9eb2c47d150fa3986421bad78f9c5630eb8c71e2d6f09a453",
+    "c1af92680d34e75baf427c9561de0b389ef528c3704a1db6432c95fabe17608d",
+    "4b2ef08d3c975a61d0b7491ae35c2f8614bdc37eaf6805926bd814a7950fe23c",
+    "d2846fb1a93e50c71fd8a374c56b0e927b419ce206adf35821e74a8dfc90356b",
+))
+
+
+def _permute(value: int, table: tuple, width: int) -> int:
+    out = 0
+    for position in table:
+        out = (out << 1) | ((value >> (width - position)) & 1)
+    return out
+
+
+def des_encrypt(key: bytes, block: bytes) -> bytes:
+    """DES (ECB) of one 8-byte block."""
+    cd = _permute(int.from_bytes(key, "big"), _PC1, 64)
+    c, d = cd >> 28, cd & 0xFFFFFFF
+    subkeys = []
+    for shift in _SHIFTS:
+        c = ((c << shift) | (c >> (28 - shift))) & 0xFFFFFFF
+        d = ((d << shift) | (d >> (28 - shift))) & 0xFFFFFFF
+        subkeys.append(_permute((c << 28) | d, _PC2, 56))
+    block = _permute(int.from_bytes(block, "big"), _IP, 64)
+    left, right = block >> 32, block & 0xFFFFFFFF
+    for subkey in subkeys:
+        mixed = _permute(right, _E, 32) ^ subkey
+        out = 0
+        for i, box in enumerate(_SBOXES):
+            six = (mixed >> (42 - 6 * i)) & 0x3F
+            out = (out << 4) | box[((six >> 4) & 2 | six & 1) * 16 + ((six >> 1) & 0xF)]
+        left, right = right, left ^ _permute(out, _P, 32)
+    return _permute((right << 32) | left, _FP, 64).to_bytes(8, "big")
+
+
+def vnc_auth_response(password: str, challenge: bytes) -> bytes:
+    """The answer to a VNC authentication challenge: DES with the password's bits mirrored per byte."""
+    key = bytes(int(f"{b:08b}"[::-1], 2) for b in password.encode("latin-1")[:8].ljust(8, b"\0"))
+    return des_encrypt(key, challenge[:8]) + des_encrypt(key, challenge[8:16])
+
+
+# --- RFB messages -----------------------------------------------------------------
+
+def set_encodings(encodings) -> bytes:
+    encodings = list(encodings)
+    return struct.pack(f"!BxH{len(encodings)}i", SET_ENCODINGS, len(encodings), *encodings)
+
+
+def update_request(incremental: bool, width: int, height: int) -> bytes:
+    return struct.pack("!BBHHHH", FB_UPDATE_REQUEST, int(incremental), 0, 0, width, height)
+
+
+async def read_client_message(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    """The next viewer-to-server message: (type, the whole message)."""
+    kind = await reader.readexactly(1)
+    fixed = {SET_PIXEL_FORMAT: 19, FB_UPDATE_REQUEST: 9, KEY_EVENT: 7, POINTER_EVENT: 5}
+    if kind[0] in fixed:
+        return kind[0], kind + await reader.readexactly(fixed[kind[0]])
+    if kind[0] == SET_ENCODINGS:
+        head = await reader.readexactly(3)
+        return kind[0], kind + head + await reader.readexactly(4 * struct.unpack("!xH", head)[0])
+    if kind[0] == CLIENT_CUT_TEXT:
+        head = await reader.readexactly(7)
+        return kind[0], kind + head + await reader.readexactly(struct.unpack("!3xI", head)[0])
+    raise ProtocolError(f"unsupported viewer message {kind[0]}")
+
+
+async def read_server_message(reader: asyncio.StreamReader, bytes_per_pixel: int) -> tuple[int, bytes]:
+    """The next server-to-viewer message: (type, the whole message). Framebuffer
+    updates must only use the encodings of REPLAY_ENCODINGS."""
+    kind = await reader.readexactly(1)
+    parts = [kind]
+    if kind[0] == FB_UPDATE:
+        parts.append(await reader.readexactly(3))
+        count, = struct.unpack("!xH", parts[-1])
+        for _ in range(count):
+            parts.append(await reader.readexactly(12))
+            _, _, width, height, encoding = struct.unpack("!HHHHi", parts[-1])
+            if encoding == ENC_RAW:
+                parts.append(await reader.readexactly(width * height * bytes_per_pixel))
+            elif encoding == ENC_COPYRECT:
+                parts.append(await reader.readexactly(4))
+            elif encoding == ENC_ZRLE:
+                parts.append(await reader.readexactly(4))
+                parts.append(await reader.readexactly(struct.unpack("!I", parts[-1])[0]))
+            elif encoding == ENC_LAST_RECT:
+                break
+            elif encoding != ENC_DESKTOP_SIZE:
+                raise ProtocolError(f"cannot parse encoding {encoding}")
+    elif kind[0] == SET_COLOUR_MAP:
+        parts.append(await reader.readexactly(5))
+        parts.append(await reader.readexactly(6 * struct.unpack("!3xH", parts[-1])[0]))
+    elif kind[0] == SERVER_CUT_TEXT:
+        parts.append(await reader.readexactly(7))
+        parts.append(await reader.readexactly(struct.unpack("!3xI", parts[-1])[0]))
+    elif kind[0] != BELL:
+        raise ProtocolError(f"unsupported server message {kind[0]}")
+    return kind[0], b"".join(parts)
+
+
+async def _read_reason(reader: asyncio.StreamReader) -> str:
+    length, = struct.unpack("!I", await reader.readexactly(4))
+    return (await reader.readexactly(length)).decode("utf-8", "replace")
+
+
+async def read_server_init(reader: asyncio.StreamReader) -> tuple[dict, bytes]:
+    head = await reader.readexactly(24)
+    width, height = struct.unpack("!HH", head[:4])
+    name = await reader.readexactly(struct.unpack("!I", head[20:])[0])
+    info = {"width": width, "height": height, "pixel_format": base64.b64encode(head[4:20]).decode("ascii"),
+            "name": name.decode("utf-8", "replace")}
+    return info, head + name
+
+
+# --- websocket streams ------------------------------------------------------------
+
+class WebSocketStream:
+    """An RFB byte stream carried in binary websocket frames; read from `reader`."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, client: bool):
+        self.writer = writer
+        self.client = client
+        self.reader = asyncio.StreamReader()
+        self._pump = asyncio.ensure_future(self._read_frames(reader))
+
+    async def _read_frames(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                _, opcode, payload = await read_frame(reader)
+                if opcode in (OP_BINARY, OP_CONTINUATION):
+                    self.reader.feed_data(payload)
+                elif opcode == OP_PING:
+                    self.send(payload, OP_PONG)
+                elif opcode == OP_CLOSE:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ProtocolError):
+            pass
+        finally:
+            self.reader.feed_eof()
+
+    def send(self, data: bytes, opcode: int = OP_BINARY) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(encode_frame(opcode, data, os.urandom(4) if self.client else None))
+
+    async def drain(self) -> None:
+        await self.writer.drain()
+
+    async def close(self) -> None:
+        self.send(struct.pack("!H", 1000), OP_CLOSE)
+        self._pump.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, ssl.SSLError):
+            pass
+
+
+async def open_websocket(url: str, ssl_context: ssl.SSLContext | None = None,
+                         timeout: float = 10.0) -> WebSocketStream:
+    parts = urlsplit(url)
+    secure = parts.scheme == "wss"
+    port = parts.port or (443 if secure else 80)
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    if secure and ssl_context is None:
+        ssl_context = ssl.create_default_context()
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, port, ssl=ssl_context if secure else None), timeout)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+    writer.write((f"GET {target} HTTP/1.1\r\nHost: {host}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n"
+                  "Sec-WebSocket-Protocol: binary\r\n\r\n").encode("ascii"))
+    head = (await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)).decode("latin-1")
+    status = head.split("\r\n", 1)[0]
+    if status.split()[1:2] != ["101"] or f"sec-websocket-accept: {accept_key(key)}".lower() not in head.lower():
+        writer.close()
+        raise ProtocolError(f"{parts.path}: {status}")
+    return WebSocketStream(reader, writer, client=True)
+
+
+async def accept_websocket(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> tuple[str, WebSocketStream]:
+    """Answer a websocket upgrade on /<user>/websockify; returns the user and the stream."""
+    method, target, headers = await read_request(reader)
+    match = SESSION_PATH.match(target.partition("?")[0])
+    if not match or method != "GET" or "sec-websocket-key" not in headers:
+        writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        raise ProtocolError(f"not a session websocket: {target}")
+    response = ("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept_key(headers['sec-websocket-key'])}\r\n")
+    if "binary" in headers.get("sec-websocket-protocol", ""):
+        response += "Sec-WebSocket-Protocol: binary\r\n"
+    writer.write((response + "\r\n").encode("ascii"))
+    return match.group(1), WebSocketStream(reader, writer, client=False)
+
+
+# --- recordings ---------------------------------------------------------------------
+
+def write_recording(path: Path, header: dict, events: list[dict]) -> None:
+    lines = [json.dumps({"version": RECORDING_VERSION, **header})]
+    lines += [json.dumps(event) for event in events]
+    write_atomic(path, "\n".join(lines) + "\n")
+
+
+def read_recording(path: Path) -> tuple[dict, list[dict]]:
+    lines = path.read_text(encoding="utf-8").splitlines()
+    header = json.loads(lines[0])
+    if header.get("version") != RECORDING_VERSION:
+        raise ValueError(f"{path}: not a recording of version {RECORDING_VERSION}")
+    return header, [json.loads(line) for line in lines[1:] if line.strip()]
+
+
+def _event(start: float, source: str, kind: int, message: bytes) -> dict:
+    return {"t": round(time.perf_counter() - start, 4), "from": source, "type": kind,
+            "data": base64.b64encode(message).decode("ascii")}
+
+
+async def record_session(viewer: WebSocketStream, server: WebSocketStream) -> tuple[dict, list[dict]]:
+    """Relay one session until either side closes; returns the recording."""
+
+    async def relay(source, destination, size):
+        data = await source.reader.readexactly(size)
+        destination.send(data)
+        return data
+
+    await relay(server, viewer, 12)
+    await relay(viewer, server, 12)
+    count = (await relay(server, viewer, 1))[0]
+    if count == 0:
+        length = await relay(server, viewer, 4)
+        await relay(server, viewer, struct.unpack("!I", length)[0])
+        raise ProtocolError("the server refused the connection")
+    await relay(server, viewer, count)
+    if (await relay(viewer, server, 1))[0] == SEC_VNC_AUTH:
+        await relay(server, viewer, 16)
+        await relay(viewer, server, 16)
+    if struct.unpack("!I", await relay(server, viewer, 4))[0]:
+        length = await relay(server, viewer, 4)
+        await relay(server, viewer, struct.unpack("!I", length)[0])
+        raise ProtocolError("VNC authentication failed")
+    await relay(viewer, server, 1)
+    info, init = await read_server_init(server.reader)
+    viewer.send(init)
+
+    start = time.perf_counter()
+    events = []
+    pixel = {"bytes": init[4] // 8}
+
+    async def from_viewer():
+        while True:
+            kind, message = await read_client_message(viewer.reader)
+            if kind == SET_ENCODINGS:
+                offered = struct.unpack(f"!{(len(message) - 4) // 4}i", message[4:])
+                message = set_encodings([e for e in offered if e in REPLAY_ENCODINGS] or REPLAY_ENCODINGS)
+            elif kind == SET_PIXEL_FORMAT:
+                pixel["bytes"] = message[4] // 8
+            events.append(_event(start, "viewer", kind, message))
+            server.send(message)
+
+    async def from_server():
+        while True:
+            kind, message = await read_server_message(server.reader, pixel["bytes"])
+            events.append(_event(start, "server", kind, message))
+            viewer.send(message)
+
+    tasks = [asyncio.ensure_future(from_viewer()), asyncio.ensure_future(from_server())]
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    error = done.pop().exception()
+    if isinstance(error, ProtocolError):
+        raise error
+    info["seconds"] = round(time.perf_counter() - start, 3)
+    return info, events
+
+
+# --- the stand-in server ------------------------------------------------------------
+
+class RfbStub:
+    """A VNC server that replays recorded updates, or answers input with small raw updates."""
+
+    def __init__(self, recording: tuple[dict, list[dict]] | None = None, password: str | None = None,
+                 speed: float = 1.0):
+        header, events = recording or ({"width": 320, "height": 200, "name": "TikZiT stand-in"}, [])
+        self.width, self.height, self.name = header["width"], header["height"], header["name"]
+        self.pixel_format = (base64.b64decode(header["pixel_format"]) if "pixel_format" in header
+                             else DEFAULT_PIXEL_FORMAT)
+        self.updates = [(e["t"], base64.b64decode(e["data"])) for e in events
+                        if e["from"] == "server" and e["type"] == FB_UPDATE]
+        self.password = password
+        self.speed = speed
+        self.sessions = 0
+
+    def raw_update(self, x: int, y: int, width: int, height: int, bytes_per_pixel: int) -> bytes:
+        x, y = min(x, self.width - width), min(y, self.height - height)
+        return (struct.pack("!BxHHHHHi", FB_UPDATE, 1, max(x, 0), max(y, 0), width, height, ENC_RAW)
+                + bytes([0x5A]) * (width * height * bytes_per_pixel))
+
+    async def serve_rfb(self, reader: asyncio.StreamReader, write, drain) -> None:
+        """One viewer's session; `write` sends bytes to it and `drain` waits for them to go."""
+        write(RFB_VERSION)
+        await reader.readexactly(12)
+        security = SEC_VNC_AUTH if self.password else SEC_NONE
+        write(bytes([1, security]))
+        if (await reader.readexactly(1))[0] != security:
+            raise ProtocolError("the viewer chose another security type")
+        if security == SEC_VNC_AUTH:
+            challenge = os.urandom(16)
+            write(challenge)
+            if not hmac.compare_digest(await reader.readexactly(16), vnc_auth_response(self.password, challenge)):
+                reason = b"Authentication failed"
+                write(struct.pack("!II", 1, len(reason)) + reason)
+                raise ProtocolError("VNC authentication failed")
+        write(struct.pack("!I", 0))
+        await reader.readexactly(1)
+        name = self.name.encode("utf-8")
+        write(struct.pack("!HH", self.width, self.height) + self.pixel_format + struct.pack("!I", len(name)) + name)
+        self.sessions += 1
+
+        start = time.perf_counter()
+        bytes_per_pixel = self.pixel_format[0] // 8
+        next_update, waiting, timer = 0, False, None
+
+        async def send_at(due: float, message: bytes) -> None:
+            await asyncio.sleep(max(0.0, start + due / self.speed - time.perf_counter()))
+            write(message)
+            await drain()
+
+        try:
+            while True:
+                kind, message = await read_client_message(reader)
+                if kind == SET_PIXEL_FORMAT:
+                    bytes_per_pixel = message[4] // 8
+                elif kind == FB_UPDATE_REQUEST and not message[1]:
+                    if self.updates:
+                        write(self.updates[0][1])
+                        next_update = 1
+                    else:
+                        write(self.raw_update(0, 0, self.width, self.height, bytes_per_pixel))
+                elif kind == FB_UPDATE_REQUEST:
+                    if next_update < len(self.updates) and (timer is None or timer.done()):
+                        timer = asyncio.ensure_future(send_at(*self.updates[next_update]))
+                        next_update += 1
+                    waiting = not self.updates
+                elif kind == POINTER_EVENT and waiting:
+                    _, _, x, y = struct.unpack("!BBHH", message)
+                    write(self.raw_update(x, y, 32, 32, bytes_per_pixel))
+                    waiting = False
+                elif kind in INPUT_MESSAGES and waiting:
+                    write(self.raw_update(0, 0, 32, 32, bytes_per_pixel))
+                    waiting = False
+                await drain()
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    async def handle_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            _, stream = await accept_websocket(reader, writer)
+            try:
+                await self.serve_rfb(stream.reader, stream.send, stream.drain)
+            finally:
+                await stream.close()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ProtocolError):
+            writer.close()
+
+    async def handle_rfb(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await self.serve_rfb(reader, writer.write, writer.drain)
+        except (ConnectionError, asyncio.IncompleteReadError, ProtocolError):
+            pass
+        finally:
+            writer.close()
+
+
+# --- replay -------------------------------------------------------------------------
+
+async def client_handshake(stream: WebSocketStream, password: str | None = None) -> dict:
+    """Authenticate as a shared viewer; returns the ServerInit."""
+    reader = stream.reader
+    if not (await reader.readexactly(12)).startswith(b"RFB 003."):
+        raise ProtocolError("not an RFB server")
+    stream.send(RFB_VERSION)
+    count = (await reader.readexactly(1))[0]
+    if count == 0:
+        raise ProtocolError(f"the server refused the connection: {await _read_reason(reader)}")
+    offered = await reader.readexactly(count)
+    if SEC_VNC_AUTH in offered and password is not None:
+        security = SEC_VNC_AUTH
+    elif SEC_NONE in offered:
+        security = SEC_NONE
+    else:
+        raise ProtocolError("the server asks for a VNC password" if SEC_VNC_AUTH in offered
+                            else f"unsupported security types {list(offered)}")
+    stream.send(bytes([security]))
+    if security == SEC_VNC_AUTH:
+        stream.send(vnc_auth_response(password, await reader.readexactly(16)))
+    if struct.unpack("!I", await reader.readexactly(4))[0]:
+        raise ProtocolError(f"VNC authentication failed: {await _read_reason(reader)}")
+    # shared, so the viewers do not disconnect each other
+    stream.send(b"\x01")
+    return (await read_server_init(reader))[0]
+
+
+class SimulatedViewer:
+    """Replays the input events of a recording against one session."""
+
+    def __init__(self, user: str, url: str, header: dict, events: list[dict], password: str | None = None,
+                 speed: float = 1.0, settle: float = 1.0, ssl_context: ssl.SSLContext | None = None):
+        self.user = user
+        self.url = url
+        self.pixel_formats = [base64.b64decode(e["data"]) for e in events
+                              if e["from"] == "viewer" and e["type"] == SET_PIXEL_FORMAT][:1]
+        self.inputs = [(e["t"], base64.b64decode(e["data"])) for e in events
+                       if e["from"] == "viewer" and e["type"] in INPUT_MESSAGES]
+        self.password = password
+        self.speed = speed
+        self.settle = settle
+        self.ssl_context = ssl_context
+        self.stats = {"user": user, "seconds": 0.0, "updates": 0, "spontaneous": 0, "latencies_ms": [],
+                      "bytes_in": 0, "bytes_out": 0, "error": None}
+        # the outstanding update requests: [sent at, incremental, first input after it]
+        self.pending = []
+
+    def send(self, stream: WebSocketStream, message: bytes) -> None:
+        stream.send(message)
+        self.stats["bytes_out"] += len(message)
+
+    def request(self, stream: WebSocketStream, incremental: bool) -> None:
+        self.send(stream, update_request(incremental, self.width, self.height))
+        self.pending.append([time.perf_counter(), incremental, None])
+
+    async def run(self) -> dict:
+        start = time.perf_counter()
+        stream = None
+        try:
+            stream = await open_websocket(self.url, self.ssl_context)
+            server = await client_handshake(stream, self.password)
+            self.width, self.height = server["width"], server["height"]
+            bytes_per_pixel = base64.b64decode(server["pixel_format"])[0] // 8
+            for message in self.pixel_formats:
+                self.send(stream, message)
+                bytes_per_pixel = message[4] // 8
+            self.send(stream, set_encodings(REPLAY_ENCODINGS))
+            self.request(stream, incremental=False)
+            updates = asyncio.ensure_future(self.read_updates(stream, bytes_per_pixel))
+            try:
+                begun = time.perf_counter()
+                for at, message in self.inputs:
+                    await asyncio.sleep(max(0.0, begun + at / self.speed - time.perf_counter()))
+                    if updates.done():
+                        break
+                    self.send(stream, message)
+                    for request in self.pending:
+                        if request[1] and request[2] is None:
+                            request[2] = time.perf_counter()
+                            break
+                    await stream.drain()
+                await asyncio.wait([updates], timeout=self.settle)
+                if updates.done():
+                    updates.result()
+            finally:
+                updates.cancel()
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ProtocolError) as e:
+            self.stats["error"] = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        finally:
+            if stream is not None:
+                await stream.close()
+            self.stats["seconds"] = round(time.perf_counter() - start, 3)
+        return self.stats
+
+    async def read_updates(self, stream: WebSocketStream, bytes_per_pixel: int) -> None:
+        while True:
+            kind, message = await read_server_message(stream.reader, bytes_per_pixel)
+            self.stats["bytes_in"] += len(message)
+            if kind != FB_UPDATE:
+                continue
+            self.stats["updates"] += 1
+            done = time.perf_counter()
+            if self.pending:
+                sent, incremental, first_input = self.pending.pop(0)
+                if not incremental or first_input is not None:
+                    self.stats["latencies_ms"].append(round((done - (first_input or sent)) * 1000, 3))
+                else:
+                    self.stats["spontaneous"] += 1
+            self.request(stream, incremental=True)
+
+
+async def run_load(viewers: list[SimulatedViewer], ramp: float = 0.0) -> list[dict]:
+    async def start(index, viewer):
+        await asyncio.sleep(index * ramp)
+        return await viewer.run()
+
+    return list(await asyncio.gather(*(start(i, v) for i, v in enumerate(viewers))))
+
+
+def container_cpu_seconds(docker: DockerCli, container: str) -> float | None:
+    """CPU time the container's cgroup has used, from cgroup v2 or v1."""
+    try:
+        out = docker.run("exec", container, "cat", "/sys/fs/cgroup/cpu.stat")
+    except DockerError:
+        try:
+            return int(docker.run("exec", container, "cat", "/sys/fs/cgroup/cpuacct/cpuacct.usage")) / 1e9
+        except (DockerError, ValueError):
+            return None
+    for line in out.splitlines():
+        if line.startswith("usage_usec "):
+            return int(line.split()[1]) / 1e6
+    return None
+
+
+def format_report(sessions: list[dict], wall: float, client_cpu: float,
+                  server_cpu: dict[str, float] | None = None) -> str:
+    ok = [s for s in sessions if not s["error"]]
+    lines = [f"{len(sessions)} sessions, {len(sessions) - len(ok)} failed, in {wall:.1f}s"]
+    for error in sorted({s["error"] for s in sessions if s["error"]}):
+        lines.append(f"  failed: {error}")
+    latencies = [ms for s in ok for ms in s["latencies_ms"]]
+    if latencies:
+        lines.append("frame latency: p50 %.1fms  p90 %.1fms  p99 %.1fms  max %.1fms  (%d timed, %d spontaneous)" % (
+            percentile(latencies, 50), percentile(latencies, 90), percentile(latencies, 99), max(latencies),
+            len(latencies), sum(s["spontaneous"] for s in ok)))
+    if ok:
+        down = [s["bytes_in"] / s["seconds"] / 1000 for s in ok if s["seconds"]]
+        up = [s["bytes_out"] / s["seconds"] / 1000 for s in ok if s["seconds"]]
+        rates = [s["updates"] / s["seconds"] for s in ok if s["seconds"]]
+        lines.append("per session: p50 %.1f kB/s down (max %.1f), %.2f kB/s up, %.1f updates/s" % (
+            percentile(down, 50), max(down), percentile(up, 50), percentile(rates, 50)))
+    if server_cpu:
+        per_session = sorted(server_cpu.values())
+        lines.append("server CPU per session: p50 %.1f%%  max %.1f%% of a core" % (
+            percentile(per_session, 50), max(per_session)))
+    if sessions:
+        lines.append(f"viewer CPU per session: {100 * client_cpu / wall / len(sessions):.2f}% of a core")
+    return "\n".join(lines)
+
+
+# --- command line ---------------------------------------------------------------------
+
+def _address(value: str) -> tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+async def _record(listen: tuple[str, int], target: str, output: Path, ssl_context) -> int:
+    finished = asyncio.get_running_loop().create_future()
+
+    async def handle(reader, writer):
+        if finished.done():
+            writer.close()
+            return
+        try:
+            _, viewer = await accept_websocket(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ProtocolError):
+            writer.close()
+            return
+        try:
+            server = await open_websocket(target, ssl_context)
+        except (OSError, asyncio.TimeoutError, ProtocolError) as e:
+            await viewer.close()
+            if not finished.done():
+                finished.set_exception(e)
+            return
+        try:
+            result = await record_session(viewer, server)
+            if not finished.done():
+                finished.set_result(result)
+        except (ConnectionError, asyncio.IncompleteReadError, ProtocolError) as e:
+            if not finished.done():
+                finished.set_exception(e)
+        finally:
+            await viewer.close()
+            await server.close()
+
+    server = await asyncio.start_server(handle, *listen)
+    print(f"Recording the first viewer on ws://{listen[0]}:{listen[1]}/<user>/websockify -> {target}", flush=True)
+    async with server:
+        try:
+            header, events = await finished
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ProtocolError) as e:
+            print(f"❌ {e}")
+            return 1
+    write_recording(output, header, events)
+    viewer = sum(1 for e in events if e["from"] == "viewer")
+    print(f"Recorded {viewer} viewer and {len(events) - viewer} server messages over {header['seconds']:.1f}s "
+          f"to {output}")
+    return 0
+
+
+async def _stub(stub: RfbStub, listen: tuple[str, int], rfb_listen: tuple[str, int] | None) -> None:
+    servers = [await asyncio.start_server(stub.handle_websocket, *listen)]
+    print(f"Stand-in sessions on ws://{listen[0]}:{listen[1]}/<user>/websockify", flush=True)
+    if rfb_listen:
+        servers.append(await asyncio.start_server(stub.handle_rfb, *rfb_listen))
+        print(f"Raw RFB on {rfb_listen[0]}:{rfb_listen[1]}", flush=True)
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def main(argv: list[str], docker: DockerCli | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Record noVNC sessions and replay them as a load test")
+    parser.add_argument("--insecure", action="store_true", help="Do not verify TLS certificates")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_cmd = commands.add_parser("record", help="Record one viewer's session through a local proxy")
+    record_cmd.add_argument("target", help="Session websocket, e.g. wss://mgb-uml.me/alice/websockify?token=...")
+    record_cmd.add_argument("-o", "--output", type=Path, default=Path("session.rfb.jsonl"))
+    record_cmd.add_argument("--listen", type=_address, default=("127.0.0.1", 6080), metavar="HOST:PORT")
+
+    replay_cmd = commands.add_parser("replay", help="Replay a recording from many viewers")
+    replay_cmd.add_argument("recording", type=Path)
+    replay_cmd.add_argument("--url", default=DEFAULT_URL, help="Websocket URL; {user} and {token} are filled in")
+    replay_cmd.add_argument("--users", nargs="+", required=True, help="Sessions to spread the viewers over")
+    replay_cmd.add_argument("-n", "--clients", type=int, default=1, help="Simulated viewers")
+    replay_cmd.add_argument("--speed", type=float, default=1.0, help="Replay this many times faster")
+    replay_cmd.add_argument("--ramp", type=float, default=0.0, help="Seconds between viewer starts")
+    replay_cmd.add_argument("--settle", type=float, default=1.0, help="Seconds to wait after the last input")
+    replay_cmd.add_argument("--env-file", type=Path, default=Path(".env"),
+                            help="File that sets VNC_PASSWORD and GATEWAY_SECRET")
+    replay_cmd.add_argument("--docker", action="store_true", help="Measure the CPU of the tikzit_<user> containers")
+    replay_cmd.add_argument("--json", type=Path, help="Write the per-session results here")
+
+    stub_cmd = commands.add_parser("stub", help="Run a stand-in RFB server")
+    stub_cmd.add_argument("recording", type=Path, nargs="?", help="Replay the updates of this recording")
+    stub_cmd.add_argument("--listen", type=_address, default=("127.0.0.1", 6080), metavar="HOST:PORT")
+    stub_cmd.add_argument("--rfb-listen", type=_address, metavar="HOST:PORT", help="Also serve raw RFB here")
+    stub_cmd.add_argument("--password", help="Require VNC authentication with this password")
+    stub_cmd.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    ssl_context = None
+    if args.insecure:
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+
+    if args.command == "record":
+        try:
+            return asyncio.run(_record(args.listen, args.target, args.output, ssl_context))
+        except KeyboardInterrupt:
+            return 1
+
+    try:
+        recording = read_recording(args.recording) if args.recording else None
+    except (OSError, ValueError, IndexError) as e:
+        print(f"❌ Cannot read recording {args.recording}: {e}")
+        return 1
+
+    if args.command == "stub":
+        try:
+            asyncio.run(_stub(RfbStub(recording, args.password, args.speed), args.listen, args.rfb_listen))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    try:
+        env = read_env_file(args.env_file)
+    except OSError:
+        env = {}
+    password = os.environ.get("VNC_PASSWORD") or env.get("VNC_PASSWORD")
+    secret = gateway_secret(args.env_file)
+    if "{token}" in args.url and not secret:
+        print(f"❌ Error: {args.url} needs a token, but neither the environment nor {args.env_file} "
+              "sets GATEWAY_SECRET.")
+        return 1
+    viewers = []
+    for i in range(args.clients):
+        user = args.users[i % len(args.users)]
+        token = session_token(secret, user, int(time.time()) + 86400) if secret else ""
+        viewers.append(SimulatedViewer(user, args.url.format(user=user, token=token), *recording, password,
+                                       args.speed, args.settle, ssl_context))
+
+    docker = (docker or DockerCli()) if args.docker else None
+    containers = sorted({container_name(u) for u in args.users})
+    cpu_before = {c: container_cpu_seconds(docker, c) for c in containers} if docker else {}
+    wall, cpu = time.perf_counter(), time.process_time()
+    sessions = asyncio.run(run_load(viewers, args.ramp))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    server_cpu = {}
+    for c in containers if docker else ():
+        after = container_cpu_seconds(docker, c)
+        viewers_of_c = sum(1 for v in viewers if container_name(v.user) == c)
+        if after is not None and cpu_before[c] is not None:
+            server_cpu[c] = 100 * (after - cpu_before[c]) / wall / viewers_of_c
+
+    print(format_report(sessions, wall, cpu, server_cpu))
+    if args.json:
+        results = {"seconds": wall, "viewer_cpu_seconds": cpu, "server_cpu_percent": server_cpu, "sessions": sessions}
+        write_atomic(args.json, json.dumps(results, indent=2) + "\n")
+    return 1 if any(s["error"] for s in sessions) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""Scale idle TikZiT user sessions to zero and wake them on demand.
+
+`sweep` (run it from cron every few minutes) counts the established
+connections to websockify (:8080) and, from the gateway
+(scripts/vnc_gateway.py), to the VNC server (:5901) inside every registered
+user's running container. A session with no connection for --idle-minutes is stopped, and
+its restart policy is relaxed to unless-stopped so a daemon restart does not
+bring it back; waking it restores `always`.
+
+`serve` is the wake endpoint. A user route whose container is stopped fails
+with 502, and nginx hands the request to the @tikzit_wake location, which
+proxies to this server. It starts the container, holds the request until
+websockify accepts connections, and redirects the browser back to the URL
+it asked for. Concurrent requests for the same user share one wake-up.
+Every wake-up is appended to a JSON lines log, and `report` summarizes the
+cold-start latency.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from provision_users import (NETWORK_NAME, REGISTRY_PATH, USERNAME_RE, DockerCli, DockerError, UserRegistry,
+                             container_name, read_json_lines, write_atomic)
+from stats import percentile
+
+
+WEBSOCKIFY_PORT = 8080
+RFB_PORT = 5901
+STATE_PATH = Path("session_state.json")
+WAKE_LOG_PATH = Path("session_wakes.jsonl")
+STATE_VERSION = 1
+
+# /proc/net/tcp socket states
+TCP_ESTABLISHED = "01"
+TCP_LISTEN = "0A"
+
+
+def count_connections(proc_net_tcp: str, port: int = WEBSOCKIFY_PORT, state: str = TCP_ESTABLISHED) -> int:
+    """Sockets on local `port` in `state`, from /proc/net/tcp and /proc/net/tcp6 text."""
+    count = 0
+    for line in proc_net_tcp.splitlines():
+        fields = line.split()
+        if len(fields) < 4 or ":" not in fields[1] or fields[0] == "sl":
+            continue
+        if int(fields[1].rsplit(":", 1)[1], 16) == port and fields[3] == state:
+            count += 1
+    return count
+
+
+def parse_docker_time(value: str) -> float:
+    """Seconds since the epoch of a docker timestamp such as 2026-01-02T03:04:05.123456789Z."""
+    value = value.strip()
+    if "." in value:
+        whole, fraction = value.split(".", 1)
+        value = whole + "." + fraction.rstrip("Z")[:6] + "+00:00"
+    else:
+        value = value.rstrip("Z") + "+00:00"
+    return datetime.fromisoformat(value).timestamp()
+
+
+def tcp_probe(host: str, port: int, timeout: float = 0.5) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class SessionState:
+    """When each user's session last had a connection, persisted as JSON."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.last_active = {}
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("version") == STATE_VERSION:
+            self.last_active = data.get("last_active", {})
+
+    def save(self) -> None:
+        write_atomic(self.path, json.dumps({"version": STATE_VERSION, "last_active": self.last_active},
+                                           indent=2, sort_keys=True) + "\n")
+
+
+class SessionController:
+
+    def __init__(self, docker: DockerCli, registry: UserRegistry, wake_log: Path = WAKE_LOG_PATH,
+                 probe=tcp_probe, ready_timeout: float = 90.0, poll_interval: float = 0.2):
+        self.docker = docker
+        self.registry = registry
+        self.wake_log = wake_log
+        self.probe = probe
+        self.ready_timeout = ready_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._waking = {}
+        self._registry_stamp = self._stamp()
+
+    def _stamp(self) -> tuple[int, int] | None:
+        try:
+            st = self.registry.path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def is_registered(self, username: str) -> bool:
+        """Whether `username` is in the registry, re-reading it if it changed on disk."""
+        stamp = self._stamp()
+        if stamp != self._registry_stamp:
+            self.registry, self._registry_stamp = UserRegistry(self.registry.path), stamp
+        return username in self.registry.users
+
+    # --- idle sweep ---------------------------------------------------------
+
+    def running_sessions(self) -> dict[str, float]:
+        """Registered users whose container is running, mapped to its start time."""
+        names = set(self.docker.run("ps", "--format", "{{.Names}}").split())
+        users = [u for u in sorted(self.registry.users) if container_name(u) in names]
+        if not users:
+            return {}
+        out = self.docker.run("inspect", "--format", "{{.Name}} {{.State.StartedAt}}",
+                              *(container_name(u) for u in users))
+        started = {}
+        for line in out.splitlines():
+            name, _, when = line.strip().lstrip("/").partition(" ")
+            started[name] = parse_docker_time(when)
+        return {u: started[container_name(u)] for u in users if container_name(u) in started}
+
+    def registered_at(self, username: str) -> float:
+        try:
+            return parse_docker_time(self.registry.users[username]["created"])
+        except (KeyError, ValueError):
+            return 0.0
+
+    def connections(self, username: str) -> int:
+        out = self.docker.run("exec", container_name(username), "cat", "/proc/net/tcp", "/proc/net/tcp6")
+        return count_connections(out) + count_connections(out, RFB_PORT)
+
+    def sweep(self, state: SessionState, idle_seconds: float, now: float | None = None,
+              jobs: int = 8, dry_run: bool = False) -> list[str]:
+        """Stop the sessions idle for `idle_seconds`; returns the users stopped."""
+        now = time.time() if now is None else now
+        running = self.running_sessions()
+        with ThreadPoolExecutor(max(1, min(jobs, len(running) or 1))) as pool:
+            counts = dict(zip(running, pool.map(self._connections_or_none, running)))
+        idle = []
+        for username, started in running.items():
+            if counts[username] is None:
+                continue
+            if counts[username]:
+                state.last_active[username] = now
+            # a session woken after its last activity is as fresh as its start, and one
+            # claimed from the warm pool (booted long before) as fresh as its registration
+            last = max(state.last_active.get(username, 0.0), started, self.registered_at(username))
+            if now - last >= idle_seconds:
+                idle.append(username)
+        if idle and not dry_run:
+            names = [container_name(u) for u in idle]
+            self.docker.run("update", "--restart", "unless-stopped", *names)
+            self.docker.run("stop", *names)
+        state.save()
+        return idle
+
+    def _connections_or_none(self, username: str) -> int | None:
+        try:
+            return self.connections(username)
+        except DockerError:
+            # stopped between `ps` and `exec`; judge it next time
+            return None
+
+    # --- wake-up ------------------------------------------------------------
+
+    def status(self, username: str) -> str:
+        try:
+            return self.docker.run("inspect", "--format", "{{.State.Status}}", container_name(username)).strip()
+        except DockerError:
+            return "missing"
+
+    def container_ip(self, username: str) -> str | None:
+        out = self.docker.run("inspect", "--format", "{{range .NetworkSettings.Networks}}{{.IPAddress}} {{end}}",
+                              container_name(username))
+        addresses = out.split()
+        return addresses[0] if addresses else None
+
+    def is_ready(self, username: str) -> bool:
+        ip = self.container_ip(username)
+        return ip is not None and self.probe(ip, WEBSOCKIFY_PORT)
+
+    def wake(self, username: str) -> Future:
+        """Start `username`'s session; the future resolves to the seconds it took
+        to become ready. Callers waking the same user share one future."""
+        with self._lock:
+            future = self._waking.get(username)
+            if future is not None:
+                return future
+            future = self._waking[username] = Future()
+        threading.Thread(target=self._wake, args=(username, future), daemon=True).start()
+        return future
+
+    def _wake(self, username: str, future: Future) -> None:
+        start = time.perf_counter()
+        try:
+            status = self.status(username)
+            if status == "paused":
+                self.docker.run("unpause", container_name(username))
+            elif status != "running":
+                self.docker.run("start", container_name(username))
+                # undo the sweep's unless-stopped: restart on crashes and host reboots again
+                self.docker.run("update", "--restart", "always", container_name(username))
+            deadline = start + self.ready_timeout
+            while not self.is_ready(username):
+                if time.perf_counter() >= deadline:
+                    raise TimeoutError(f"{username}: websockify not ready after {self.ready_timeout:.0f}s")
+                time.sleep(self.poll_interval)
+            seconds = time.perf_counter() - start
+            self.log_wake(username, seconds, True)
+            future.set_result(seconds)
+        except Exception as e:
+            self.log_wake(username, time.perf_counter() - start, False)
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._waking.pop(username, None)
+
+    def log_wake(self, username: str, seconds: float, ready: bool) -> None:
+        entry = {"at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "user": username,
+                 "seconds": round(seconds, 3), "ready": ready}
+        with self._lock, open(self.wake_log, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+class WakeHandler(BaseHTTPRequestHandler):
+    """Answers the requests nginx forwards from @tikzit_wake."""
+
+    server_version = "tikzit-session-controller"
+
+    def do_GET(self):
+        controller = self.server.controller
+        # nginx has already rewritten self.path to the session's own URI
+        uri = self.headers.get("X-Original-URI") or self.path
+        username = uri.lstrip("/").split("/", 1)[0].split("?", 1)[0]
+        if not USERNAME_RE.match(username) or not controller.is_registered(username):
+            return self.reply(404, "No such session\n")
+        if controller.status(username) == "running" and controller.is_ready(username):
+            # nginx failed for another reason; redirecting would loop
+            return self.reply(502, "The session is running but did not answer\n")
+        try:
+            seconds = controller.wake(username).result(controller.ready_timeout + 5)
+        except Exception as e:
+            self.log_message("wake %s failed: %s", username, e)
+            return self.reply(503, "The session is starting, please retry\n", {"Retry-After": "5"})
+        self.log_message("woke %s in %.2fs", username, seconds)
+        # 307 repeats the request (and its method) against the now running session
+        self.reply(307, "", {"Location": uri, "Cache-Control": "no-store"})
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        # the body is not used, but must not be left unread on a keep-alive connection
+        length = self.headers.get("Content-Length", "")
+        if length.isdigit():
+            self.rfile.read(int(length))
+        elif "Transfer-Encoding" in self.headers:
+            self.close_connection = True
+        self.do_GET()
+
+    def reply(self, code: int, body: str, headers: dict[str, str] | None = None) -> None:
+        data = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+
+class WakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], controller: SessionController):
+        super().__init__(address, WakeHandler)
+        self.controller = controller
+
+
+def docker_gateway(docker: DockerCli, network: str = NETWORK_NAME) -> str | None:
+    """The host's address on `network`, which host.docker.internal (host-gateway) points at."""
+    try:
+        out = docker.run("network", "inspect", "--format", "{{range .IPAM.Config}}{{.Gateway}} {{end}}", network)
+    except DockerError:
+        return None
+    addresses = out.split()
+    return addresses[0] if addresses else None
+
+
+def format_report(entries: list[dict]) -> str:
+    ready = [e["seconds"] for e in entries if e.get("ready")]
+    lines = [f"{len(entries)} wake-ups, {len(entries) - len(ready)} failed"]
+    if ready:
+        lines.append("cold start: p50 %.2fs  p90 %.2fs  p99 %.2fs  max %.2fs" % (
+            percentile(ready, 50), percentile(ready, 90), percentile(ready, 99), max(ready)))
+    return "\n".join(lines)
+
+
+def main(argv: list[str], docker: DockerCli | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Stop idle TikZiT sessions and wake them on demand")
+    parser.add_argument("--registry", type=Path, default=REGISTRY_PATH, help="User registry file")
+    parser.add_argument("--wake-log", type=Path, default=WAKE_LOG_PATH, help="Cold-start latency log")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sweep_cmd = commands.add_parser("sweep", help="Stop sessions without a connection for a while")
+    sweep_cmd.add_argument("--idle-minutes", type=float, default=30)
+    sweep_cmd.add_argument("--state", type=Path, default=STATE_PATH, help="Last-activity state file")
+    sweep_cmd.add_argument("-j", "--jobs", type=int, default=8, help="Containers to inspect at once")
+    sweep_cmd.add_argument("--dry-run", action="store_true", help="Report idle sessions without stopping them")
+
+    serve_cmd = commands.add_parser("serve", help="Run the wake endpoint for nginx")
+    serve_cmd.add_argument("--host", help="Address to listen on (default: the gateway of --network)")
+    serve_cmd.add_argument("--network", default=NETWORK_NAME, help="Docker network nginx and the sessions run on")
+    serve_cmd.add_argument("--port", type=int, default=8090)
+    serve_cmd.add_argument("--ready-timeout", type=float, default=90, help="Seconds to wait for websockify")
+
+    commands.add_parser("report", help="Summarize cold-start latency")
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        print(format_report(read_json_lines(args.wake_log)))
+        return 0
+
+    docker = docker or DockerCli()
+    registry = UserRegistry(args.registry)
+    controller = SessionController(docker, registry, args.wake_log,
+                                   ready_timeout=getattr(args, "ready_timeout", 90.0))
+
+    if args.command == "sweep":
+        stopped = controller.sweep(SessionState(args.state), args.idle_minutes * 60, jobs=args.jobs,
+                                   dry_run=args.dry_run)
+        for username in stopped:
+            print(f"{'Idle' if args.dry_run else 'Stopped'}: {username}")
+        return 0
+
+    host = args.host or docker_gateway(docker, args.network) or "127.0.0.1"
+    server = WakeServer((host, args.port), controller)
+    print(f"Waking sessions on http://{host}:{args.port}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""One websocket gateway in front of the VNC servers of all user sessions.
+
+Without it, a viewer's websocket goes from nginx to the websockify process
+in the user's container, and on to TigerVNC on localhost:5901. With it, nginx
+hands every /<user>/websockify request to this single asyncio process, which
+splices the websocket directly to the RFB port of the user's container
+(Xvnc listens with -localhost no). websockify still serves the noVNC page.
+
+Requests are authenticated with a per-user token in the query string
+(/<user>/websockify?token=...). The token is an HMAC of the username and an
+expiry time, keyed with GATEWAY_SECRET from the environment or the .env file.
+`url` prints session URLs that carry a token; noVNC passes it along through
+its ?path= parameter. URLs handed out before the gateway carry no token:
+until GATEWAY_LEGACY_UNTIL (an ISO date, UTC) they are still let through and
+logged as legacy connections, so `report` names the users whose URLs still
+have to be re-issued with `url`.
+
+Routes are read from the table scripts/nginx_routes.py generates
+(user_configs/tikzit.routes). The file is re-read whenever it changes, so
+adding a user needs neither a restart nor an nginx reload.
+
+Every connection is counted: bytes and frames each way, the time to connect
+to the VNC server, the time until its first byte reached the viewer, and the
+time spent waiting for a slow viewer. GET /_gateway/stats returns the live
+counters as JSON. Closed connections are appended to a JSON lines log, and
+`report` summarizes them. A stopped session makes the upstream connection
+fail with 502, which nginx hands to the session controller to wake it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import re
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from nginx_routes import ROUTES_FILE, parse_routes
+from provision_users import CONFIG_DIR, DOMAIN, USERNAME_RE, read_env_file, read_json_lines, session_url
+from stats import percentile
+
+
+GATEWAY_PORT = 8070
+RFB_PORT = 5901
+CONNECTION_LOG = Path("gateway_connections.jsonl")
+TOKEN_DAYS = 30
+STATS_PATH = "/_gateway/stats"
+SESSION_PATH = re.compile(r"^/([a-z0-9]+)/websockify$")
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+MAX_FRAME = 1 << 24
+READ_CHUNK = 1 << 16
+REQUEST_TIMEOUT = 10.0
+
+
+class ProtocolError(Exception):
+    pass
+
+
+# --- tokens -------------------------------------------------------------------
+
+def session_token(secret: str, username: str, expires: int) -> str:
+    """A token that lets `username` connect until `expires` (seconds since the epoch)."""
+    digest = hmac.new(secret.encode("utf-8"), f"{username}:{expires}".encode("utf-8"), hashlib.sha256)
+    return f"{expires}.{digest.hexdigest()}"
+
+
+def check_token(secret: str, username: str, token: str, now: float | None = None) -> bool:
+    expires, _, _ = token.partition(".")
+    # str.isdigit() also accepts digits int() rejects, and compare_digest() only ASCII str
+    if not (token.isascii() and expires.isdigit()):
+        return False
+    if int(expires) < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(token.encode("ascii"), session_token(secret, username, int(expires)).encode("ascii"))
+
+
+def gateway_secret(env_file: Path) -> str | None:
+    secret = os.environ.get("GATEWAY_SECRET")
+    if not secret:
+        try:
+            secret = read_env_file(env_file).get("GATEWAY_SECRET")
+        except OSError:
+            return None
+    return secret or None
+
+
+def legacy_deadline(env_file: Path) -> float | None:
+    """GATEWAY_LEGACY_UNTIL as seconds since the epoch; None when it is not set."""
+    value = os.environ.get("GATEWAY_LEGACY_UNTIL")
+    if value is None:
+        try:
+            value = read_env_file(env_file).get("GATEWAY_LEGACY_UNTIL")
+        except OSError:
+            return None
+    if not value:
+        return None
+    deadline = datetime.fromisoformat(value)
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=timezone.utc)
+    return deadline.timestamp()
+
+
+def token_url(secret: str, username: str, days: float = TOKEN_DAYS, domain: str = DOMAIN) -> str:
+    return session_url(username, domain, session_token(secret, username, int(time.time() + days * 86400)))
+
+
+# --- websocket framing ----------------------------------------------------------
+
+def accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def apply_mask(payload: bytes, mask: bytes) -> bytes:
+    # one big-integer XOR instead of a Python loop over the bytes
+    if not payload:
+        return payload
+    keystream = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(keystream, "big")).to_bytes(len(payload), "big")
+
+
+def encode_frame(opcode: int, payload: bytes, mask: bytes | None = None, fin: bool = True) -> bytes:
+    """One websocket frame; clients must pass a 4-byte `mask`, servers must not."""
+    head = bytes([(0x80 if fin else 0) | opcode])
+    mask_bit = 0x80 if mask else 0
+    if len(payload) < 126:
+        head += bytes([mask_bit | len(payload)])
+    elif len(payload) < 1 << 16:
+        head += bytes([mask_bit | 126]) + struct.pack("!H", len(payload))
+    else:
+        head += bytes([mask_bit | 127]) + struct.pack("!Q", len(payload))
+    if mask:
+        return head + mask + apply_mask(payload, mask)
+    return head + payload
+
+
+async def read_frame(reader: asyncio.StreamReader, max_size: int = MAX_FRAME) -> tuple[bool, int, bytes]:
+    """The next frame: (fin, opcode, unmasked payload). Raises IncompleteReadError at EOF."""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    if length > max_size:
+        raise ProtocolError(f"frame of {length} bytes")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = apply_mask(payload, mask)
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str]]:
+    """The request line and headers of an HTTP request: (method, target, {lowercase name: value})."""
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    lines = head.split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise ProtocolError(f"bad request line {lines[0]!r}")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+# --- routes ---------------------------------------------------------------------
+
+class RouteTable:
+    """The username -> container table, re-read whenever the file changes."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.routes = {}
+        self._stamp = None
+        self.lookup("")
+
+    def lookup(self, username: str) -> str | None:
+        try:
+            st = self.path.stat()
+            stamp = st.st_mtime_ns, st.st_size
+        except OSError:
+            stamp = None
+        if stamp != self._stamp:
+            try:
+                self.routes = parse_routes(self.path.read_text(encoding="utf-8")) if stamp else {}
+            except (OSError, ValueError) as e:
+                # keep routing with the previous table; nginx_routes.py writes atomically
+                print(f"❌ {self.path}: {e}", file=sys.stderr)
+            self._stamp = stamp
+        return self.routes.get(username)
+
+
+# --- gateway --------------------------------------------------------------------
+
+class Connection:
+    """Counters of one viewer connection."""
+
+    def __init__(self, number: int, username: str, peer: str):
+        self.number = number
+        self.username = username
+        self.peer = peer
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.connect_ms = None
+        self.first_byte_ms = None
+        self.stalled_ms = 0.0
+        self.bytes_in = self.bytes_out = 0
+        self.frames_in = self.frames_out = 0
+        self.closed = None
+        self.legacy = False
+
+    def to_dict(self) -> dict:
+        return {"id": self.number, "user": self.username, "peer": self.peer, "started": round(self.started, 3),
+                "seconds": round(time.perf_counter() - self._start, 3), "connect_ms": self.connect_ms,
+                "first_byte_ms": self.first_byte_ms, "stalled_ms": round(self.stalled_ms, 3),
+                "bytes_in": self.bytes_in, "bytes_out": self.bytes_out, "frames_in": self.frames_in,
+                "frames_out": self.frames_out, "closed": self.closed, "legacy": self.legacy}
+
+
+def _ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 3)
+
+
+class Gateway:
+
+    def __init__(self, routes: RouteTable, secret: str, upstream_port: int = RFB_PORT,
+                 connect_timeout: float = 5.0, log: Path | None = CONNECTION_LOG, legacy_until: float | None = None):
+        self.routes = routes
+        self.secret = secret
+        # URLs from before the gateway have no token; they are let through until then
+        self.legacy_until = legacy_until
+        self.upstream_port = upstream_port
+        self.connect_timeout = connect_timeout
+        self.log = log
+        self.active = {}
+        self.totals = {"connections": 0, "rejected": 0, "failed": 0, "legacy": 0, "bytes_in": 0, "bytes_out": 0}
+        self._numbers = itertools.count(1)
+
+    def stats(self) -> dict:
+        return {"active": [c.to_dict() for c in self.active.values()], "totals": dict(self.totals),
+                "routes": len(self.routes.routes)}
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await self._handle(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ProtocolError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        method, target, headers = await asyncio.wait_for(read_request(reader), REQUEST_TIMEOUT)
+        path, _, query = target.partition("?")
+        if path == STATS_PATH and method == "GET":
+            return await self.reply(writer, 200, json.dumps(self.stats()) + "\n", "application/json")
+        match = SESSION_PATH.match(path)
+        if not match or method != "GET":
+            return await self.reply(writer, 404, "No such session\n")
+        key = headers.get("sec-websocket-key")
+        if headers.get("upgrade", "").lower() != "websocket" or not key:
+            return await self.reply(writer, 400, "Expected a websocket upgrade\n")
+
+        username = match.group(1)
+        tokens = parse_qs(query).get("token")
+        legacy = tokens is None and self.legacy_until is not None and time.time() < self.legacy_until
+        if not legacy and not check_token(self.secret, username, (tokens or [""])[0]):
+            self.totals["rejected"] += 1
+            return await self.reply(writer, 403, "Invalid or expired session token\n")
+        container = self.routes.lookup(username)
+        if container is None:
+            self.totals["rejected"] += 1
+            return await self.reply(writer, 404, "No such session\n")
+
+        peer = headers.get("x-real-ip") or writer.get_extra_info("peername", ("",))[0]
+        conn = Connection(next(self._numbers), username, peer)
+        conn.legacy = legacy
+        start = time.perf_counter()
+        try:
+            upstream_reader, upstream_writer = await asyncio.wait_for(
+                asyncio.open_connection(container, self.upstream_port), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError):
+            # nginx hands this to the session controller, which starts a stopped session
+            self.totals["failed"] += 1
+            return await self.reply(writer, 502, "The session did not answer\n")
+        conn.connect_ms = _ms(start)
+
+        response = ("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                    f"Sec-WebSocket-Accept: {accept_key(key)}\r\n")
+        protocols = [p.strip() for p in headers.get("sec-websocket-protocol", "").split(",")]
+        if "binary" in protocols:
+            response += "Sec-WebSocket-Protocol: binary\r\n"
+        writer.write((response + "\r\n").encode("ascii"))
+        self.totals["connections"] += 1
+        self.totals["legacy"] += legacy
+        self.active[conn.number] = conn
+        try:
+            conn.closed = await self.splice(conn, reader, writer, upstream_reader, upstream_writer)
+        finally:
+            upstream_writer.close()
+            del self.active[conn.number]
+            self.totals["bytes_in"] += conn.bytes_in
+            self.totals["bytes_out"] += conn.bytes_out
+            self.record(conn)
+
+    async def splice(self, conn: Connection, reader, writer, upstream_reader, upstream_writer) -> str:
+        """Relay until either side closes; returns which one did."""
+        tasks = [asyncio.ensure_future(self._from_viewer(conn, reader, writer, upstream_writer)),
+                 asyncio.ensure_future(self._from_vnc(conn, upstream_reader, writer))]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        try:
+            return done.pop().result()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return "connection lost"
+        except ProtocolError as e:
+            return f"protocol error: {e}"
+
+    async def _from_viewer(self, conn: Connection, reader, writer, upstream_writer) -> str:
+        while True:
+            _, opcode, payload = await read_frame(reader)
+            if opcode == OP_CLOSE:
+                writer.write(encode_frame(OP_CLOSE, payload[:2]))
+                return "viewer"
+            if opcode == OP_PING:
+                writer.write(encode_frame(OP_PONG, payload))
+            elif opcode in (OP_BINARY, OP_CONTINUATION):
+                conn.frames_in += 1
+                conn.bytes_in += len(payload)
+                upstream_writer.write(payload)
+                await upstream_writer.drain()
+            elif opcode != OP_PONG:
+                raise ProtocolError(f"unexpected opcode {opcode:#x}")
+
+    async def _from_vnc(self, conn: Connection, upstream_reader, writer) -> str:
+        start = time.perf_counter()
+        while True:
+            data = await upstream_reader.read(READ_CHUNK)
+            if not data:
+                writer.write(encode_frame(OP_CLOSE, struct.pack("!H", 1000)))
+                return "vnc"
+            writer.write(encode_frame(OP_BINARY, data))
+            stalled = time.perf_counter()
+            await writer.drain()
+            conn.stalled_ms += (time.perf_counter() - stalled) * 1000
+            if conn.first_byte_ms is None:
+                conn.first_byte_ms = _ms(start)
+            conn.frames_out += 1
+            conn.bytes_out += len(data)
+
+    async def reply(self, writer: asyncio.StreamWriter, code: int, body: str,
+                    content_type: str = "text/plain; charset=utf-8") -> None:
+        reasons = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 502: "Bad Gateway"}
+        data = body.encode("utf-8")
+        writer.write(f"HTTP/1.1 {code} {reasons[code]}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("ascii") + data)
+        await writer.drain()
+
+    def record(self, conn: Connection) -> None:
+        if self.log is None:
+            return
+        try:
+            with open(self.log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(conn.to_dict()) + "\n")
+        except OSError as e:
+            print(f"❌ Cannot write {self.log}: {e}", file=sys.stderr)
+
+
+# --- report ---------------------------------------------------------------------
+
+def format_report(entries: list[dict]) -> str:
+    lines = [f"{len(entries)} connections from {len({e.get('user') for e in entries})} users"]
+    for field, label, unit in (("connect_ms", "connect to VNC", "ms"), ("first_byte_ms", "first byte", "ms"),
+                               ("seconds", "duration", "s")):
+        values = [e[field] for e in entries if e.get(field) is not None]
+        if values:
+            lines.append(f"{label}: p50 {percentile(values, 50):.1f}{unit}  p90 {percentile(values, 90):.1f}{unit}  "
+                         f"p99 {percentile(values, 99):.1f}{unit}  max {max(values):.1f}{unit}")
+    if entries:
+        lines.append("traffic: %.1f MB to viewers, %.1f MB from viewers" % (
+            sum(e.get("bytes_out", 0) for e in entries) / 1e6, sum(e.get("bytes_in", 0) for e in entries) / 1e6))
+    legacy = sorted({e.get("user") for e in entries if e.get("legacy")})
+    if legacy:
+        lines.append(f"{sum(1 for e in entries if e.get('legacy'))} connections without a token, "
+                     f"re-issue the URLs of: {', '.join(legacy)}")
+    return "\n".join(lines)
+
+
+async def serve(gateway: Gateway, host: str, port: int) -> None:
+    server = await gateway.start(host, port)
+    print(f"Gateway for {len(gateway.routes.routes)} sessions on {host}:{port}", flush=True)
+    if gateway.legacy_until is not None and time.time() < gateway.legacy_until:
+        until = datetime.fromtimestamp(gateway.legacy_until, timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+        print(f"Accepting session URLs without a token until {until}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Websocket gateway to the VNC servers of the TikZiT sessions")
+    parser.add_argument("--env-file", type=Path, default=Path(".env"), help="File that sets GATEWAY_SECRET")
+    parser.add_argument("--log", type=Path, default=CONNECTION_LOG, help="Closed connections (JSON lines)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = commands.add_parser("serve", help="Accept viewer websockets")
+    serve_cmd.add_argument("--host", default="0.0.0.0")
+    serve_cmd.add_argument("--port", type=int, default=GATEWAY_PORT)
+    serve_cmd.add_argument("--routes", type=Path, default=CONFIG_DIR / ROUTES_FILE,
+                           help="Routing table written by nginx_routes.py")
+    serve_cmd.add_argument("--upstream-port", type=int, default=RFB_PORT, help="VNC port of the sessions")
+
+    url_cmd = commands.add_parser("url", help="Print session URLs with a token")
+    url_cmd.add_argument("users", nargs="+")
+    url_cmd.add_argument("--days", type=float, default=TOKEN_DAYS, help="Days until the token expires")
+    url_cmd.add_argument("--domain", default=DOMAIN)
+
+    commands.add_parser("report", help="Summarize the connection log")
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        print(format_report(read_json_lines(args.log)))
+        return 0
+
+    secret = gateway_secret(args.env_file)
+    if not secret:
+        print(f"❌ Error: neither the environment nor {args.env_file} sets GATEWAY_SECRET.")
+        return 1
+    if args.command == "url":
+        invalid = [u for u in args.users if not USERNAME_RE.match(u)]
+        if invalid:
+            print(f"❌ Invalid usernames: {', '.join(invalid)}")
+            return 1
+        for username in args.users:
+            print(token_url(secret, username, args.days, args.domain))
+        return 0
+
+    try:
+        legacy_until = legacy_deadline(args.env_file)
+    except ValueError as e:
+        print(f"❌ Error: GATEWAY_LEGACY_UNTIL is not an ISO date: {e}")
+        return 1
+    gateway = Gateway(RouteTable(args.routes), secret, args.upstream_port, log=args.log, legacy_until=legacy_until)
+    try:
+        asyncio.run(serve(gateway, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""Keep a pool of pre-booted TikZiT session containers for new users.
+
+A cold session start has several steps. `docker run` creates the container,
+and entrypoint.sh writes the VNC password and xstartup. supervisord then
+starts TigerVNC and websockify, and xstartup waits before TikZiT launches.
+A pool container (tikzit_pool_<slot>) has done all of that before anybody
+asks for it. It runs with the same image, network, restart policy and
+password as a user container. Its data volume is tikzit_pool_data_<slot>,
+because a container's mounts cannot be changed once it exists.
+
+Claiming a pool container for a new user renames it to tikzit_<user>, which
+nginx and the other tools route and manage by name. `docker rename` fails
+for all but one of several claimers, so a container is never handed out
+twice. The slot volume stays with the user and is recorded in the registry.
+Users who already have a data volume are always started cold, so they keep
+their files.
+
+A container is ready once websockify answers a websocket connection with
+the VNC server's RFB greeting. That greeting is the first thing a viewer
+receives. `measure` times it for cold starts and for claims, appends the
+samples to a JSON lines log, and `report` summarizes them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import secrets
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from provision_users import IMAGE_NAME, NETWORK_NAME, DockerCli, DockerError, read_env_file, read_json_lines
+from stats import percentile
+
+
+POOL_PREFIX = "tikzit_pool_"
+MEASURE_PREFIX = "tikzit_ttff_"
+POOL_SIZE = 2
+WEBSOCKIFY_PORT = 8080
+FIRST_FRAME_LOG = Path("first_frame.jsonl")
+DATA_DIR = "/home/tikzituser/.local/share/tikzit"
+
+
+def slot_volume_name(name: str) -> str:
+    """The data volume of a pre-booted container: tikzit_pool_ab12 -> tikzit_pool_data_ab12."""
+    prefix, _, slot = name.rpartition("_")
+    return f"{prefix}_data_{slot}"
+
+
+def _read_exactly(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return data
+
+
+def read_frame(sock: socket.socket) -> tuple[int, bytes]:
+    """One unfragmented websocket frame from the server: (opcode, payload)."""
+    head = _read_exactly(sock, 2)
+    length = head[1] & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", _read_exactly(sock, 2))
+    elif length == 127:
+        length, = struct.unpack("!Q", _read_exactly(sock, 8))
+    mask = _read_exactly(sock, 4) if head[1] & 0x80 else None
+    payload = _read_exactly(sock, length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return head[0] & 0x0F, payload
+
+
+def rfb_banner(host: str, port: int = WEBSOCKIFY_PORT, timeout: float = 2.0) -> bytes | None:
+    """The RFB greeting (b'RFB 003.008\\n') websockify relays from the VNC server, or None."""
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    request = (f"GET /websockify HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+               f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n"
+               "Sec-WebSocket-Protocol: binary\r\n\r\n")
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.sendall(request.encode("ascii"))
+            response = b""
+            while b"\r\n\r\n" not in response:
+                chunk = sock.recv(1024)
+                if not chunk:
+                    return None
+                response += chunk
+            if response.split(b"\r\n", 1)[0].split()[1:2] != [b"101"]:
+                return None
+            # the greeting may have arrived in the same packet as the handshake
+            rest = response.split(b"\r\n\r\n", 1)[1]
+            if rest:
+                sock = _Prepended(sock, rest)
+            opcode, payload = read_frame(sock)
+    except (OSError, ConnectionError, IndexError):
+        return None
+    return payload if opcode == 0x2 and payload.startswith(b"RFB ") else None
+
+
+class _Prepended:
+    """A socket whose first reads return bytes already received."""
+
+    def __init__(self, sock: socket.socket, data: bytes):
+        self.sock = sock
+        self.data = data
+
+    def recv(self, size: int) -> bytes:
+        if self.data:
+            chunk, self.data = self.data[:size], self.data[size:]
+            return chunk
+        return self.sock.recv(size)
+
+
+def container_ip(docker: DockerCli, name: str) -> str | None:
+    out = docker.run("inspect", "--format", "{{range .NetworkSettings.Networks}}{{.IPAddress}} {{end}}", name)
+    addresses = out.split()
+    return addresses[0] if addresses else None
+
+
+class WarmPool:
+
+    def __init__(self, docker: DockerCli, vnc_password: str, size: int = POOL_SIZE, image: str = IMAGE_NAME,
+                 network: str = NETWORK_NAME, probe=rfb_banner, ready_timeout: float = 120.0,
+                 poll_interval: float = 0.5, log: Path | None = FIRST_FRAME_LOG):
+        self.docker = docker
+        self.vnc_password = vnc_password
+        self.size = size
+        self.image = image
+        self.network = network
+        self.probe = probe
+        self.ready_timeout = ready_timeout
+        self.poll_interval = poll_interval
+        self.log = log
+        self._lock = threading.Lock()
+        self._refilling = None
+
+    def members(self) -> list[str]:
+        names = self.docker.run("ps", "-a", "--format", "{{.Names}}").split()
+        return sorted(n for n in names if n.startswith(POOL_PREFIX))
+
+    def run_session(self, name: str, volume: str) -> None:
+        """Start a session container as provision_users.start_container does."""
+        self.docker.run("run", "-d",
+                        "--name", name,
+                        "--network", self.network,
+                        "--restart", "always",
+                        "-e", "VNC_PASSWORD",
+                        "-v", f"{volume}:{DATA_DIR}",
+                        self.image,
+                        env={"VNC_PASSWORD": self.vnc_password})
+
+    def boot(self, name: str | None = None) -> str:
+        name = name or POOL_PREFIX + secrets.token_hex(4)
+        self.run_session(name, slot_volume_name(name))
+        return name
+
+    def refill(self) -> list[str]:
+        """Boot containers until the pool has `size` of them; returns those booted."""
+        missing = self.size - len(self.members())
+        return [self.boot() for _ in range(max(0, missing))]
+
+    def refill_in_background(self) -> Future:
+        """Refill on a background thread; callers share a refill already running."""
+        with self._lock:
+            if self._refilling is None:
+                self._refilling = Future()
+                threading.Thread(target=self._refill, args=(self._refilling,), daemon=True).start()
+            return self._refilling
+
+    def _refill(self, future: Future) -> None:
+        try:
+            future.set_result(self.refill())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._refilling = None
+
+    def is_ready(self, name: str) -> bool:
+        try:
+            ip = container_ip(self.docker, name)
+        except DockerError:
+            return False
+        return ip is not None and self.probe(ip, WEBSOCKIFY_PORT) is not None
+
+    def wait_ready(self, name: str, start: float | None = None) -> float:
+        """Seconds from `start` (default: now) until `name` greets a viewer."""
+        start = time.perf_counter() if start is None else start
+        while not self.is_ready(name):
+            if time.perf_counter() - start >= self.ready_timeout:
+                raise TimeoutError(f"{name}: no RFB greeting after {self.ready_timeout:.0f}s")
+            time.sleep(self.poll_interval)
+        return time.perf_counter() - start
+
+    def claim(self, container: str) -> str | None:
+        """Rename a ready pool container to `container`; returns its data volume,
+        or None when no pool container is ready."""
+        claimed = self._claim(container, self.members())
+        return claimed[0] if claimed else None
+
+    def _claim(self, container: str, candidates: list[str]) -> tuple[str, float] | None:
+        for name in candidates:
+            start = time.perf_counter()
+            if not self.is_ready(name):
+                continue
+            try:
+                self.docker.run("rename", name, container)
+            except DockerError:
+                # claimed by somebody else in the meantime
+                continue
+            seconds = self.wait_ready(container, start)
+            self.log_first_frame("warm", container, seconds, True)
+            return slot_volume_name(name), seconds
+        return None
+
+    def drain(self) -> list[str]:
+        """Remove the unclaimed pool containers and their volumes."""
+        names = self.members()
+        if names:
+            self.docker.run("rm", "-f", *names)
+            self.docker.run("volume", "rm", *(slot_volume_name(n) for n in names))
+        return names
+
+    def measure(self, mode: str) -> float:
+        """Seconds to the first greeting of a throwaway session: from `docker run`
+        for 'cold', from the claim of a booted container for 'warm'."""
+        name = MEASURE_PREFIX + secrets.token_hex(4)
+        container = name
+        start = time.perf_counter()
+        try:
+            self.boot(name)
+            if mode == "cold":
+                seconds = self.wait_ready(name, start)
+                self.log_first_frame("cold", name, seconds, True)
+                return seconds
+            self.wait_ready(name)
+            # not a pool member, so no provisioner can claim it first
+            claimed = self._claim(name + "_claimed", [name])
+            if claimed is None:
+                raise TimeoutError(f"{name}: not ready when claimed")
+            container = name + "_claimed"
+            return claimed[1]
+        except (DockerError, TimeoutError):
+            self.log_first_frame(mode, name, time.perf_counter() - start, False)
+            raise
+        finally:
+            self.docker.run("rm", "-f", container)
+            self.docker.run("volume", "rm", slot_volume_name(name))
+
+    def log_first_frame(self, mode: str, container: str, seconds: float, ready: bool) -> None:
+        if self.log is None:
+            return
+        entry = {"at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "mode": mode,
+                 "container": container, "seconds": round(seconds, 3), "ready": ready}
+        with self._lock, open(self.log, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def format_report(entries: list[dict]) -> str:
+    lines = []
+    for mode in ("cold", "warm"):
+        samples = [e for e in entries if e.get("mode") == mode]
+        ready = [e["seconds"] for e in samples if e.get("ready")]
+        line = f"{mode}: {len(samples)} starts, {len(samples) - len(ready)} failed"
+        if ready:
+            line += "; first frame p50 %.2fs  p90 %.2fs  max %.2fs" % (
+                percentile(ready, 50), percentile(ready, 90), max(ready))
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv: list[str], docker: DockerCli | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Keep pre-booted TikZiT sessions ready for new users")
+    parser.add_argument("--size", type=int, default=POOL_SIZE, help="Containers to keep booted")
+    parser.add_argument("--env-file", type=Path, default=Path(".env"), help="File that sets VNC_PASSWORD")
+    parser.add_argument("--image", default=IMAGE_NAME)
+    parser.add_argument("--network", default=NETWORK_NAME)
+    parser.add_argument("--log", type=Path, default=FIRST_FRAME_LOG, help="Time-to-first-frame log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fill_cmd = commands.add_parser("fill", help="Boot containers until the pool is full")
+    fill_cmd.add_argument("--wait", action="store_true", help="Wait until every pool container is ready")
+    commands.add_parser("status", help="List the pool containers")
+    commands.add_parser("drain", help="Remove the pool containers, e.g. after changing the image or password")
+    measure_cmd = commands.add_parser("measure", help="Time the first frame of cold starts and of claims")
+    measure_cmd.add_argument("--trials", type=int, default=3)
+    commands.add_parser("report", help="Summarize the time-to-first-frame log")
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        print(format_report(read_json_lines(args.log)))
+        return 0
+
+    vnc_password = ""
+    if args.command in ("fill", "measure"):
+        try:
+            vnc_password = read_env_file(args.env_file)["VNC_PASSWORD"]
+        except (OSError, KeyError):
+            print(f"❌ Error: {args.env_file} does not set VNC_PASSWORD. Cannot start containers without a password.")
+            return 1
+    pool = WarmPool(docker or DockerCli(), vnc_password, args.size, args.image, args.network, log=args.log)
+
+    try:
+        if args.command == "fill":
+            booted = pool.refill()
+            print(f"Booted {len(booted)}; the pool has {len(pool.members())} of {args.size}")
+            if args.wait:
+                with ThreadPoolExecutor(max(1, len(pool.members()))) as waiters:
+                    for name, seconds in zip(pool.members(), waiters.map(pool.wait_ready, pool.members())):
+                        print(f"✅ {name} ready after {seconds:.1f}s")
+        elif args.command == "status":
+            for name in pool.members():
+                print(f"{name}: {'ready' if pool.is_ready(name) else 'booting'}")
+        elif args.command == "drain":
+            print(f"Removed {len(pool.drain())} pool containers")
+        else:
+            for _ in range(max(1, args.trials)):
+                pool.measure("cold")
+                pool.measure("warm")
+            print(format_report(read_json_lines(args.log)))
+    except (DockerError, TimeoutError) as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
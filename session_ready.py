@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Launch TikZiT in the VNC session as soon as the desktop is ready.
+
+The xstartup that entrypoint.sh writes runs this in the background instead
+of a fixed `sleep 3`. It waits for three signals:
+
+- x11: the X server accepts connections on /tmp/.X11-unix/X<display>;
+- wm: the window manager (xfwm4) is running;
+- websockify: something listens on TCP port 8080.
+
+It then replaces itself with the command given after `--`. Each signal is
+appended to the startup timeline (/var/log/session_timeline.jsonl) as one
+JSON line as soon as it is seen. The lines hold the boot, the event, the
+wall-clock time and the seconds since the container started. entrypoint.sh
+appends its own phases to the same file, and scripts/boot_profile.py
+aggregates the timelines of many boots. If a signal never comes, the
+command is started anyway after --timeout seconds and the missing signals
+are logged.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+
+TIMELINE_PATH = Path(os.environ.get("SESSION_TIMELINE", "/var/log/session_timeline.jsonl"))
+# written by entrypoint.sh, which marks its own phases in the timeline under this boot id
+BOOT_ID_PATH = Path("/var/log/session_boot")
+WINDOW_MANAGER = "xfwm4"
+WEBSOCKIFY_PORT = 8080
+TCP_LISTEN = "0A"
+
+
+def container_started(proc: Path = Path("/proc")) -> float:
+    """Wall-clock start of PID 1, i.e. of the container; now if /proc cannot tell."""
+    try:
+        # the command name in field 2 may contain spaces; starttime is field 22
+        fields = (proc / "1" / "stat").read_text().rsplit(")", 1)[1].split()
+        ticks = int(fields[19])
+        btime = next(int(line.split()[1]) for line in (proc / "stat").read_text().splitlines()
+                     if line.startswith("btime "))
+    except (OSError, IndexError, ValueError, StopIteration):
+        return time.time()
+    return btime + ticks / os.sysconf("SC_CLK_TCK")
+
+
+def x11_ready(display: str, x11_dir: Path = Path("/tmp/.X11-unix")) -> bool:
+    path = x11_dir / f"X{display.lstrip(':').split('.')[0]}"
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(0.5)
+            sock.connect(str(path))
+    except OSError:
+        return False
+    return True
+
+
+def process_running(name: str, proc: Path = Path("/proc")) -> bool:
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            if (entry / "comm").read_text().strip() == name:
+                return True
+        except OSError:
+            # exited while we looked
+            continue
+    return False
+
+
+def port_listening(port: int, proc: Path = Path("/proc")) -> bool:
+    for table in ("tcp", "tcp6"):
+        try:
+            lines = (proc / "net" / table).read_text().splitlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) > 3 and fields[3] == TCP_LISTEN and int(fields[1].rsplit(":", 1)[1], 16) == port:
+                return True
+    return False
+
+
+def read_boot_id(path: Path = BOOT_ID_PATH) -> str | None:
+    try:
+        return path.read_text().strip() or None
+    except OSError:
+        return None
+
+
+class Timeline:
+    """Appends the events of one boot to the timeline log; never fails the launch."""
+
+    def __init__(self, path: Path, started: float, boot: str | None = None):
+        self.path = path
+        self.started = started
+        self.boot = boot or f"{socket.gethostname()}-{int(started)}"
+
+    def record(self, event: str, **extra) -> None:
+        now = time.time()
+        entry = {"boot": self.boot, "event": event, "at": round(now, 3),
+                 "since_start": round(now - self.started, 3), **extra}
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"session_ready: cannot write {self.path}: {e}", file=sys.stderr)
+
+
+def wait_ready(checks: dict, timeline: Timeline, timeout: float, interval: float) -> list:
+    """Poll `checks` ({event: callable}) until all pass or `timeout` expires;
+    returns the events that never passed."""
+    pending = dict(checks)
+    deadline = time.monotonic() + timeout
+    while pending:
+        for event, check in list(pending.items()):
+            if check():
+                timeline.record(event)
+                del pending[event]
+        if not pending or time.monotonic() >= deadline:
+            break
+        time.sleep(interval)
+    return sorted(pending)
+
+
+def main(argv: list, execvp=os.execvp) -> int:
+    parser = argparse.ArgumentParser(description="Start a command once the VNC desktop is ready")
+    parser.add_argument("--display", default=os.environ.get("DISPLAY", ":1"))
+    parser.add_argument("--window-manager", default=WINDOW_MANAGER, help="Process name of the window manager")
+    parser.add_argument("--port", type=int, default=WEBSOCKIFY_PORT, help="websockify port")
+    parser.add_argument("--timeout", type=float, default=30, help="Start the command anyway after this long")
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between checks")
+    parser.add_argument("--log", type=Path, default=TIMELINE_PATH, help="Startup timeline (JSON lines)")
+    parser.add_argument("--boot-file", type=Path, default=BOOT_ID_PATH, help="Boot id written by entrypoint.sh")
+    parser.add_argument("--proc", type=Path, default=Path("/proc"), help=argparse.SUPPRESS)
+    parser.add_argument("--x11-dir", type=Path, default=Path("/tmp/.X11-unix"), help=argparse.SUPPRESS)
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="-- COMMAND [ARG...]")
+    args = parser.parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("no command given")
+
+    timeline = Timeline(args.log, container_started(args.proc), read_boot_id(args.boot_file))
+    checks = {
+        "x11": lambda: x11_ready(args.display, args.x11_dir),
+        "wm": lambda: process_running(args.window_manager, args.proc),
+        "websockify": lambda: port_listening(args.port, args.proc),
+    }
+    missing = wait_ready(checks, timeline, args.timeout, args.interval)
+    if missing:
+        timeline.record("timeout", missing=missing)
+    timeline.record("launch", command=command[0])
+    try:
+        execvp(command[0], command)
+    except OSError as e:
+        timeline.record("launch_failed", error=str(e))
+        print(f"session_ready: cannot start {command[0]}: {e}", file=sys.stderr)
+        return 127
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
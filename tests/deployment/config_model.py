@@ -0,0 +1,310 @@
+"""
+Parse-once model of the deployment artifacts shared by the deployment tests.
+
+Each artifact is read and parsed on first use and the result is memoized for
+the whole session, keyed by path. A cached entry is reused only while the
+file's mtime and size are unchanged, so watch-mode reruns see edits.
+
+    nginx(path)         -> NginxConfig      blocks and directives
+    supervisord(path)   -> SupervisordConfig  sections and their options
+    dockerfile(path)    -> Dockerfile       instructions grouped into stages
+    compose(path)       -> ComposeFile      YAML config and its services
+    shell_script(path)  -> ShellScript      shebang and variable assignments
+"""
+
+import re
+import threading
+from pathlib import Path
+
+import yaml
+
+
+class TextFile:
+    """A text artifact; subclasses parse `text` in `parse()`."""
+
+    def __init__(self, path, text):
+        self.path = Path(path)
+        self.text = text
+        self.lines = text.splitlines()
+        self.parse()
+
+    def parse(self):
+        pass
+
+
+# --- nginx ---------------------------------------------------------------
+
+class NginxBlock:
+    """A `name args { ... }` block; the file itself is a block named ''."""
+
+    def __init__(self, name, args, line):
+        self.name = name
+        self.args = args
+        self.line = line
+        self.directives = []
+        self.children = []
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def blocks(self, name):
+        """Every block called `name` at any depth below this one."""
+        return [b for b in self.walk() if b is not self and b.name == name]
+
+    def find_directives(self, name):
+        """Every `name ...;` directive at any depth, as (block, args) pairs."""
+        return [(b, d[1]) for b in self.walk() for d in b.directives if d[0] == name]
+
+    def directive(self, name):
+        """Arguments of the first `name` directive directly in this block, or None."""
+        for directive, args in self.directives:
+            if directive == name:
+                return args
+        return None
+
+
+NGINX_TOKEN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|#[^\n]*|[{};]|[^\s{};"\'#]+')
+
+
+class NginxConfig(TextFile):
+
+    def parse(self):
+        self.root = NginxBlock('', [], 0)
+        self.error = None
+        stack = [self.root]
+        words, line = [], 1
+        pos = 0
+        for match in NGINX_TOKEN.finditer(self.text):
+            line += self.text.count('\n', pos, match.start())
+            pos = match.start()
+            token = match.group()
+            if token.startswith('#'):
+                continue
+            if token == '{':
+                if not words:
+                    self.error = f"line {line}: block without a name"
+                    words = ['']
+                block = NginxBlock(words[0], words[1:], line)
+                stack[-1].children.append(block)
+                stack.append(block)
+                words = []
+            elif token == ';':
+                if words:
+                    stack[-1].directives.append((words[0], words[1:]))
+                words = []
+            elif token == '}':
+                if words:
+                    self.error = self.error or f"line {line}: directive '{words[0]}' without ';'"
+                    words = []
+                if len(stack) == 1:
+                    self.error = self.error or f"line {line}: unexpected '}}'"
+                else:
+                    stack.pop()
+            else:
+                words.append(token)
+        if len(stack) > 1 and self.error is None:
+            self.error = f"block '{stack[-1].name}' opened on line {stack[-1].line} is not closed"
+
+    def blocks(self, name):
+        return self.root.blocks(name)
+
+    def find_directives(self, name):
+        return self.root.find_directives(name)
+
+    def locations(self):
+        """Map each `location` path to its block (the last one wins)."""
+        return dict((' '.join(b.args), b) for b in self.blocks('location'))
+
+
+# --- supervisord ---------------------------------------------------------
+
+class SupervisordConfig(TextFile):
+
+    def parse(self):
+        """`sections` maps a section name (e.g. 'program:novnc') to its options."""
+        self.sections = {}
+        self.invalid_lines = []
+        options, key = None, None
+        for number, raw in enumerate(self.lines, 1):
+            line = raw.strip()
+            if not line or line.startswith(';') or line.startswith('#'):
+                continue
+            header = re.match(r'^\[([^\]]+)\]$', line)
+            if header:
+                options = self.sections.setdefault(header.group(1), {})
+                key = None
+            elif raw[:1].isspace() and key is not None:
+                options[key] += '\n' + line
+            elif '=' in line and options is not None:
+                key, value = (part.strip() for part in line.split('=', 1))
+                options[key] = value
+            else:
+                self.invalid_lines.append((number, line))
+
+    def programs(self):
+        return dict((name.split(':', 1)[1], options) for name, options in self.sections.items()
+                    if name.startswith('program:'))
+
+
+# --- Dockerfile ----------------------------------------------------------
+
+class DockerInstruction:
+
+    def __init__(self, keyword, args, line, stage):
+        self.keyword = keyword
+        self.args = args
+        self.line = line
+        self.stage = stage
+
+    def __repr__(self):
+        return f"{self.keyword} {self.args}"
+
+
+class DockerStage:
+
+    def __init__(self, base, name):
+        self.base = base
+        self.name = name
+        self.instructions = []
+
+    def find(self, keyword):
+        return [i for i in self.instructions if i.keyword == keyword]
+
+
+class Dockerfile(TextFile):
+
+    def parse(self):
+        """Join continuation lines into `instructions` and group them into `stages`."""
+        self.instructions = []
+        self.stages = []
+        pending, start = [], 0
+        for number, raw in enumerate(self.lines, 1):
+            line = raw.strip()
+            if not pending and (not line or line.startswith('#')):
+                continue
+            if pending and line.startswith('#'):
+                continue
+            if not pending:
+                start = number
+            if line.endswith('\\'):
+                pending.append(line[:-1].strip())
+                continue
+            pending.append(line)
+            self._add(' '.join(p for p in pending if p), start)
+            pending = []
+        if pending:
+            self._add(' '.join(p for p in pending if p), start)
+
+    def _add(self, text, line):
+        keyword, _, args = text.partition(' ')
+        keyword, args = keyword.upper(), args.strip()
+        if keyword == 'FROM':
+            match = re.match(r'(\S+)(?:\s+AS\s+(\S+))?', args, re.IGNORECASE)
+            self.stages.append(DockerStage(match.group(1), match.group(2)))
+        instruction = DockerInstruction(keyword, args, line, len(self.stages) - 1)
+        self.instructions.append(instruction)
+        if self.stages:
+            self.stages[-1].instructions.append(instruction)
+
+    def find(self, keyword):
+        return [i for i in self.instructions if i.keyword == keyword]
+
+    def stage(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+
+# --- docker compose ------------------------------------------------------
+
+class ComposeFile(TextFile):
+
+    def parse(self):
+        """`config` is the loaded YAML, or None with `error` set when it does not parse."""
+        self.error = None
+        try:
+            self.config = yaml.safe_load(self.text)
+        except yaml.YAMLError as e:
+            self.config, self.error = None, e
+        self.services = (self.config or {}).get('services') or {}
+
+
+# --- shell scripts -------------------------------------------------------
+
+SHELL_ASSIGNMENT = re.compile(r'^\s*(?:export\s+|local\s+|readonly\s+|declare\s+(?:-\w+\s+)*)?(\w+)=(.*)$')
+
+
+class ShellScript(TextFile):
+
+    def parse(self):
+        """`assignments` maps each variable to the values it is assigned, in order."""
+        self.shebang = self.lines[0] if self.lines and self.lines[0].startswith('#!') else None
+        self.assignments = {}
+        for line in self.lines:
+            match = SHELL_ASSIGNMENT.match(line)
+            if match:
+                self.assignments.setdefault(match.group(1), []).append(match.group(2).strip())
+
+    def value(self, name):
+        """The first value assigned to `name` with surrounding quotes removed, or None."""
+        values = self.assignments.get(name)
+        if not values:
+            return None
+        value = values[0]
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+            value = value[1:-1]
+        return value
+
+
+# --- cache ---------------------------------------------------------------
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def load(path, kind=TextFile):
+    """Parse `path` as `kind`, reusing the parsed model while the file is unchanged."""
+    path = Path(path).resolve()
+    st = path.stat()
+    key = (path, kind)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+    model = kind(path, path.read_text(encoding='utf-8'))
+    with _lock:
+        _cache[key] = (stamp, model)
+    return model
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+def text(path):
+    return load(path, TextFile)
+
+
+def nginx(path):
+    return load(path, NginxConfig)
+
+
+def supervisord(path):
+    return load(path, SupervisordConfig)
+
+
+def dockerfile(path):
+    return load(path, Dockerfile)
+
+
+def compose(path):
+    return load(path, ComposeFile)
+
+
+def shell_script(path):
+    return load(path, ShellScript)
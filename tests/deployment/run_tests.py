@@ -2,64 +2,409 @@
 """
 Test runner for deployment infrastructure tests.
 Runs all deployment tests and generates a report.
+
+With --jobs the test classes are sharded across a process pool and the
+results merged; --junit-xml writes a report in the same shape as pytest's
+--junitxml (see fixtures/test-results.xml, a copy of the report in the
+repository root).
+
+With --changed-since only the test classes that inspect a file changed since
+that git ref are run (see TEST_INPUTS), and --durations orders them slowest
+first using the times recorded in a JUnit report. After the run the new times
+are merged into that report, so a partial run keeps the times of the classes
+it skipped.
 """
 
+import argparse
+import fnmatch
+import os
+import socket
+import subprocess
 import sys
+import time
+import traceback
 import unittest
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from io import StringIO
 from pathlib import Path
 
-def run_deployment_tests():
-    """Run all deployment tests and report results."""
-    
-    test_dir = Path(__file__).parent
+TEST_DIR = Path(__file__).parent
+ROOT = TEST_DIR.parent.parent
+
+TEST_MODULES = [
+    'test_docker_compose',
+    'test_config_files',
+    'test_shell_scripts',
+    'test_session_ready',
+    'test_config_model',
+    'test_shell_syntax',
+    'test_run_tests',
+]
+
+# JUnit classnames are dotted from the repository root, as pytest reports them
+JUNIT_PACKAGE = 'tests.deployment'
+
+# Repository files each test class inspects, as globs relative to the root
+# ('*' does not cross directories). A class missing here is always selected.
+TEST_INPUTS = {
+    'test_docker_compose.TestDockerCompose': ['docker-compose.yml', 'docker-compose.prod.yml'],
+    'test_config_files.TestNginxConfig': ['nginx.conf'],
+    'test_config_files.TestSupervisorConfig': ['supervisord.conf'],
+    'test_shell_scripts.TestShellScripts': ['*.sh'],
+    'test_shell_scripts.TestDockerfile': ['Dockerfile'],
+    'test_session_ready.TestSessionReady': ['session_ready.py', 'entrypoint.sh', 'Dockerfile'],
+    # unit tests of the shared helpers, which select everything when they change
+    'test_config_model.TestCache': [],
+    'test_config_model.TestNginx': [],
+    'test_config_model.TestSupervisord': [],
+    'test_config_model.TestDockerfile': [],
+    'test_config_model.TestCompose': [],
+    'test_config_model.TestShellScript': [],
+    'test_shell_syntax.TestShellSyntaxChecker': ['*.sh'],
+    'test_run_tests.TestRunner': ['tests/deployment/fixtures/*.xml'],
+    'test_run_tests.TestSelection': ['tests/deployment/fixtures/*.xml'],
+}
+
+# Changes to these select every test class.
+SHARED_INPUTS = ['tests/requirements.txt', 'tests/deployment/*.py']
+
+
+class RecordingResult(unittest.TextTestResult):
+    """Test result that also keeps a picklable record of every test case."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.records = []
+        self._started = {}
+
+    def startTest(self, test):
+        self._started[test.id()] = time.perf_counter()
+        super().startTest(test)
+
+    def _record(self, test, outcome, message='', details=''):
+        start = self._started.pop(test.id(), None)
+        cls = type(test)
+        module = cls.__module__
+        if not module.startswith(JUNIT_PACKAGE + '.'):
+            module = JUNIT_PACKAGE + '.' + module
+        self.records.append({
+            'classname': module + '.' + cls.__qualname__,
+            'name': getattr(test, '_testMethodName', str(test)),
+            'time': time.perf_counter() - start if start is not None else 0.0,
+            'outcome': outcome,
+            'message': message,
+            'details': details,
+        })
+
+    def addSuccess(self, test):
+        super().addSuccess(test)
+        self._record(test, 'passed')
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self._record(test, 'failure', str(err[1]), self.failures[-1][1])
+
+    def addError(self, test, err):
+        super().addError(test, err)
+        if isinstance(test, unittest.TestCase):
+            self._record(test, 'error', str(err[1]), self.errors[-1][1])
+        else:
+            # setUpClass/tearDownClass failures are reported against the suite
+            self.records.append({'classname': str(test), 'name': str(test), 'time': 0.0,
+                                 'outcome': 'error', 'message': str(err[1]),
+                                 'details': self.errors[-1][1]})
+
+    def addSkip(self, test, reason):
+        super().addSkip(test, reason)
+        self._record(test, 'skipped', reason)
+
+    def addExpectedFailure(self, test, err):
+        super().addExpectedFailure(test, err)
+        self._record(test, 'skipped', 'expected failure')
+
+    def addUnexpectedSuccess(self, test):
+        super().addUnexpectedSuccess(test)
+        self._record(test, 'failure', 'unexpected success')
+
+
+def iter_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iter_tests(test)
+        else:
+            yield test
+
+
+def load_modules(modules=TEST_MODULES):
+    """Import the test modules; returns the loaded suite and the modules that failed."""
+    if str(TEST_DIR) not in sys.path:
+        sys.path.insert(0, str(TEST_DIR))
     loader = unittest.TestLoader()
     suite = unittest.TestSuite()
-    
-    test_modules = [
-        'test_docker_compose',
-        'test_config_files',
-        'test_shell_scripts',
-    ]
-    
-    print("=" * 70)
-    print("TikZiT Deployment Infrastructure Tests")
-    print("=" * 70)
-    print()
-    
-    for module_name in test_modules:
+    failed = []
+    for module_name in modules:
         try:
             module = __import__(module_name)
-            module_tests = loader.loadTestsFromModule(module)
-            suite.addTests(module_tests)
+            suite.addTests(loader.loadTestsFromModule(module))
             print(f"✅ Loaded tests from {module_name}")
         except ImportError as e:
             print(f"❌ Failed to load {module_name}: {e}")
-    
+            failed.append(module_name)
+    return suite, failed
+
+
+def test_classes(suite):
+    """Dotted names of the test classes in `suite`, in load order."""
+    names = []
+    for test in iter_tests(suite):
+        name = type(test).__module__ + '.' + type(test).__qualname__
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def _matches(path, pattern):
+    return fnmatch.fnmatchcase(path, pattern) and path.count('/') == pattern.count('/')
+
+
+def changed_files(base):
+    """Paths changed since git ref `base`, committed or not, including untracked
+    files; None when git cannot tell (no repository, unknown ref)."""
+    try:
+        diff = subprocess.run(['git', 'diff', '--name-only', '--relative', base, '--'],
+                              cwd=ROOT, capture_output=True, text=True, check=True)
+        untracked = subprocess.run(['git', 'ls-files', '--others', '--exclude-standard'],
+                                   cwd=ROOT, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return sorted(set(diff.stdout.splitlines()) | set(untracked.stdout.splitlines()))
+
+
+def affected_classes(classes, changed):
+    """The classes in `classes` (dotted module.Class names) affected by the
+    `changed` repository paths, in their original order."""
+    selected = set(c for c in classes if c not in TEST_INPUTS)
+    for path in changed:
+        directory, _, name = path.rpartition('/')
+        module = name[:-len('.py')]
+        if directory == 'tests/deployment' and module in TEST_MODULES:
+            selected.update(c for c in classes if c.startswith(module + '.'))
+        elif any(_matches(path, pattern) for pattern in SHARED_INPUTS):
+            return list(classes)
+        else:
+            selected.update(c for c in classes
+                            if any(_matches(path, pattern) for pattern in TEST_INPUTS.get(c, [])))
+    return [c for c in classes if c in selected]
+
+
+def load_durations(path):
+    """Seconds per test from a previous JUnit report, as {class: {name: time}};
+    empty when there is no readable report."""
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError):
+        return {}
+    durations = {}
+    for case in root.iter('testcase'):
+        classname = case.get('classname', '')
+        if classname.startswith(JUNIT_PACKAGE + '.'):
+            classname = classname[len(JUNIT_PACKAGE) + 1:]
+        try:
+            durations.setdefault(classname, {})[case.get('name')] = float(case.get('time', 0))
+        except ValueError:
+            continue
+    return durations
+
+
+def update_durations(path, records, classes):
+    """Merge the times of `records` into the JUnit report at `path`, keeping
+    the recorded times of the tests that did not run. Classes no longer in
+    `classes` are dropped."""
+    durations = load_durations(path)
+    for r in records:
+        classname = r['classname']
+        if classname.startswith(JUNIT_PACKAGE + '.'):
+            durations.setdefault(classname[len(JUNIT_PACKAGE) + 1:], {})[r['name']] = r['time']
+    merged = [{'classname': JUNIT_PACKAGE + '.' + c, 'name': name, 'time': t,
+               'outcome': 'passed', 'message': '', 'details': ''}
+              for c in classes for name, t in sorted(durations.get(c, {}).items())]
+    write_junit_xml(merged, path, sum(r['time'] for r in merged))
+
+
+def order_tests(suite, classes, durations):
+    """A suite of the tests in `classes`, slowest class first and slowest test
+    first within each class. Tests without a recorded time go first, since
+    their cost is unknown."""
+    by_class = {}
+    for test in iter_tests(suite):
+        by_class.setdefault(type(test).__module__ + '.' + type(test).__qualname__, []).append(test)
+
+    def cost(times, name):
+        return (name in times, -times.get(name, 0.0))
+
+    totals = dict((c, sum(durations[c].values())) for c in classes if c in durations)
+    ordered = unittest.TestSuite()
+    for name in sorted(classes, key=lambda c: cost(totals, c)):
+        times = durations.get(name, {})
+        ordered.addTests(sorted(by_class.get(name, []),
+                                key=lambda t: cost(times, getattr(t, '_testMethodName', ''))))
+    return ordered
+
+
+def run_shard(class_name, verbosity=1, test_names=None):
+    """Run one test class (or just `test_names` in it, in that order) in a
+    worker process; returns its records and output."""
+    if str(TEST_DIR) not in sys.path:
+        sys.path.insert(0, str(TEST_DIR))
+    stream = StringIO()
+    loader = unittest.TestLoader()
+    if test_names:
+        suite = loader.loadTestsFromNames([class_name + '.' + name for name in test_names])
+    else:
+        suite = loader.loadTestsFromName(class_name)
+    # drive the result directly: the per-shard "Ran N tests" footer would be noise
+    result = RecordingResult(unittest.runner._WritelnDecorator(stream), True, verbosity)
+    try:
+        suite(result)
+        result.printErrors()
+    except Exception:
+        return [{'classname': JUNIT_PACKAGE + '.' + class_name, 'name': class_name, 'time': 0.0,
+                 'outcome': 'error', 'message': 'shard crashed', 'details': traceback.format_exc()}], ''
+    return result.records, stream.getvalue()
+
+
+def run_serial(suite, verbosity=2):
+    runner = unittest.TextTestRunner(verbosity=verbosity, resultclass=RecordingResult)
+    return runner.run(suite).records
+
+
+def run_parallel(suite, jobs, verbosity=2):
+    """Shard the test classes of `suite` across `jobs` processes and merge the results."""
+    classes = test_classes(suite)
+    names = {}
+    for test in iter_tests(suite):
+        names.setdefault(type(test).__module__ + '.' + type(test).__qualname__, []).append(test._testMethodName)
+    records = []
+    with ProcessPoolExecutor(max_workers=min(jobs, len(classes)) or 1) as pool:
+        shards = [pool.submit(run_shard, name, verbosity, names[name]) for name in classes]
+        # merge in load order, so the report does not depend on scheduling
+        for shard in shards:
+            shard_records, output = shard.result()
+            sys.stderr.write(output)
+            records.extend(shard_records)
+    return records
+
+
+def write_junit_xml(records, path, elapsed):
+    counts = dict((k, sum(1 for r in records if r['outcome'] == k)) for k in ('error', 'failure', 'skipped'))
+    suites = ET.Element('testsuites', name='pytest tests')
+    suite = ET.SubElement(suites, 'testsuite', {
+        'name': 'pytest',
+        'errors': str(counts['error']),
+        'failures': str(counts['failure']),
+        'skipped': str(counts['skipped']),
+        'tests': str(len(records)),
+        'time': '%.3f' % elapsed,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'hostname': socket.gethostname(),
+    })
+    for r in records:
+        case = ET.SubElement(suite, 'testcase', classname=r['classname'], name=r['name'], time='%.3f' % r['time'])
+        if r['outcome'] == 'skipped':
+            ET.SubElement(case, 'skipped', type='unittest.skip', message=r['message']).text = r['details'] or None
+        elif r['outcome'] in ('failure', 'error'):
+            ET.SubElement(case, r['outcome'], message=r['message']).text = r['details']
+    with open(path, 'wb') as f:
+        f.write(b'<?xml version="1.0" encoding="utf-8"?>')
+        f.write(ET.tostring(suites, encoding='utf-8'))
+
+
+def run_deployment_tests(jobs=1, junit_xml=None, changed_since=None, durations=None):
+    """Run the deployment tests (those affected by changes since git ref
+    `changed_since`, if given) and report results."""
+
+    print("=" * 70)
+    print("TikZiT Deployment Infrastructure Tests")
+    print("=" * 70)
+    print()
+
+    suite, failed_modules = load_modules()
+    all_classes = classes = test_classes(suite)
+    if changed_since:
+        changed = changed_files(changed_since)
+        if changed is None:
+            print(f"⚠️  Cannot diff against {changed_since}; running every test class")
+        else:
+            selected = affected_classes(classes, changed)
+            print(f"Selected {len(selected)} of {len(classes)} test classes "
+                  f"affected by {len(changed)} files changed since {changed_since}")
+            classes = selected
+    if not classes and not failed_modules:
+        print("✅ No deployment tests are affected by the changes.")
+        return 0
+    suite = order_tests(suite, classes, load_durations(durations) if durations else {})
+
     print()
     print("=" * 70)
-    print("Running Tests...")
+    print("Running Tests..." if jobs <= 1 else f"Running Tests on {jobs} workers...")
     print("=" * 70)
     print()
-    
-    runner = unittest.TextTestRunner(verbosity=2)
-    result = runner.run(suite)
-    
+
+    start = time.perf_counter()
+    if jobs <= 1:
+        records = run_serial(suite)
+    else:
+        records = run_parallel(suite, jobs)
+    elapsed = time.perf_counter() - start
+
+    if junit_xml:
+        write_junit_xml(records, junit_xml, elapsed)
+    if durations:
+        update_durations(durations, records, all_classes)
+
+    failures = sum(1 for r in records if r['outcome'] == 'failure')
+    errors = sum(1 for r in records if r['outcome'] == 'error')
+    skipped = sum(1 for r in records if r['outcome'] == 'skipped')
+
     print()
     print("=" * 70)
     print("Test Summary")
     print("=" * 70)
-    print(f"Tests run: {result.testsRun}")
-    print(f"Successes: {result.testsRun - len(result.failures) - len(result.errors)}")
-    print(f"Failures: {len(result.failures)}")
-    print(f"Errors: {len(result.errors)}")
+    print(f"Tests run: {len(records)}")
+    print(f"Successes: {len(records) - failures - errors - skipped}")
+    print(f"Failures: {failures}")
+    print(f"Errors: {errors}")
+    if skipped:
+        print(f"Skipped: {skipped}")
+    print(f"Time: {elapsed:.3f}s")
+    if junit_xml:
+        print(f"JUnit report: {junit_xml}")
     print()
-    
-    if result.wasSuccessful():
+
+    if not failures and not errors and not failed_modules:
         print("✅ All deployment tests passed!")
         return 0
     else:
         print("❌ Some tests failed. See details above.")
         return 1
 
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Run the TikZiT deployment infrastructure tests')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='shard test classes across this many processes (0: one per CPU)')
+    parser.add_argument('--junit-xml', metavar='PATH', help='write a JUnit XML report to PATH')
+    parser.add_argument('--changed-since', metavar='REF',
+                        help='run only the test classes affected by files changed since git REF')
+    parser.add_argument('--durations', metavar='PATH',
+                        help='run the slowest tests first, using the times in the JUnit report at PATH, '
+                             'and merge the new times into it')
+    args = parser.parse_args(argv)
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    return run_deployment_tests(jobs, args.junit_xml, args.changed_since, args.durations)
+
+
 if __name__ == '__main__':
-    sys.exit(run_deployment_tests())
+    sys.exit(main(sys.argv[1:]))
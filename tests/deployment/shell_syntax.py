@@ -0,0 +1,115 @@
+"""
+Batched `bash -n` syntax checking for the repository's shell scripts.
+
+All scripts are checked in one pass on a thread pool instead of one
+subprocess per test. Results are cached on disk keyed by the script's
+content hash and the bash binary, so an unchanged script is never
+re-checked across runs. The cache lives in $MGB_UML_TEST_CACHE
+(default ~/.cache/mgb-uml-tests).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SHELL_SCRIPTS = [
+    'entrypoint.sh',
+    'deploy.sh',
+    'multi_user_manager.sh',
+    'publish_all.sh',
+    'update_and_redeploy.sh',
+]
+
+CACHE_VERSION = 1
+
+
+def repository_scripts(root):
+    """The deployment scripts plus the platform deploy-*.sh scripts under `root`."""
+    root = Path(root)
+    return [root / name for name in SHELL_SCRIPTS] + sorted(root.glob('deploy-*.sh'))
+
+
+def default_cache_path():
+    cache_dir = os.environ.get('MGB_UML_TEST_CACHE', Path.home() / '.cache' / 'mgb-uml-tests')
+    return Path(cache_dir) / 'shell-syntax.json'
+
+
+def bash_identity(bash='bash'):
+    """Identifies the bash binary, so upgrading bash invalidates the cache."""
+    path = shutil.which(bash)
+    if path is None:
+        return None
+    st = os.stat(path)
+    return f"{os.path.realpath(path)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+class ShellSyntaxChecker:
+    """Checks scripts with `bash -n`, reusing cached results by content hash."""
+
+    def __init__(self, cache_path=None, bash='bash', jobs=None):
+        self.cache_path = cache_path
+        self.bash = bash
+        self.jobs = jobs or min(8, os.cpu_count() or 1)
+        self.identity = bash_identity(bash)
+        self.results = {}
+        self.checked = self.reused = 0
+        if cache_path is None:
+            return
+        try:
+            data = json.loads(Path(cache_path).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return
+        if data.get('version') == CACHE_VERSION and data.get('bash') == self.identity:
+            self.results = data.get('results', {})
+
+    def _bash_n(self, data):
+        # feed the script on stdin so the message does not depend on its path
+        result = subprocess.run([self.bash, '-n'], input=data, capture_output=True)
+        return [result.returncode == 0, result.stderr.decode('utf-8', 'replace')]
+
+    def check(self, paths):
+        """Map each path to (is_valid, error); only unseen contents run bash."""
+        contents = dict((Path(p), Path(p).read_bytes()) for p in paths)
+        digests = dict((p, hashlib.sha256(data).hexdigest()) for p, data in contents.items())
+        pending = {}
+        for path, digest in digests.items():
+            if digest in self.results:
+                self.reused += 1
+            else:
+                pending.setdefault(digest, contents[path])
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.jobs, len(pending))) as pool:
+                checks = dict((digest, pool.submit(self._bash_n, data)) for digest, data in pending.items())
+            for digest, check in checks.items():
+                self.results[digest] = check.result()
+            self.checked += len(pending)
+            self.save()
+        report = {}
+        for path, digest in digests.items():
+            ok, error = self.results[digest]
+            report[path] = (ok, error.replace('bash: ', f'{path.name}: ', 1) if error.startswith('bash: ') else error)
+        return report
+
+    def save(self):
+        if self.cache_path is None:
+            return
+        path = Path(self.cache_path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({'version': CACHE_VERSION, 'bash': self.identity,
+                                       'results': self.results}, sort_keys=True), encoding='utf-8')
+            os.replace(tmp, path)
+        except OSError:
+            # a read-only home only costs the next run a re-check
+            pass
+
+
+def check_repository(root, cache_path=None):
+    """Syntax results for every repository script under `root`, keyed by resolved path."""
+    checker = ShellSyntaxChecker(cache_path or default_cache_path())
+    return checker.check(p.resolve() for p in repository_scripts(root))
@@ -4,10 +4,15 @@ Tests syntax, structure, and required settings.
 """
 
 import unittest
+import sys
 import re
 import os
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent))
+
+import config_model  # noqa: E402
+
 
 class TestNginxConfig(unittest.TestCase):
 
@@ -20,102 +25,81 @@ class TestNginxConfig(unittest.TestCase):
         self.assertTrue(self.nginx_conf_file.exists(),
                        f"nginx.conf not found at {self.nginx_conf_file}")
 
+    def _nginx(self):
+        return config_model.nginx(self.nginx_conf_file)
+
     def test_nginx_conf_not_empty(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertTrue(len(content.strip()) > 0, "nginx.conf is empty")
+        content = self._nginx().text
+        self.assertTrue(len(content.strip()) > 0, "nginx.conf is empty")
 
     def test_nginx_conf_has_events_block(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('events', content, "nginx.conf must have 'events' block")
+        self.assertTrue(self._nginx().blocks('events'), "nginx.conf must have 'events' block")
 
     def test_nginx_conf_has_http_block(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('http', content, "nginx.conf must have 'http' block")
+        self.assertTrue(self._nginx().blocks('http'), "nginx.conf must have 'http' block")
 
     def test_nginx_conf_has_server_block(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('server {', content, "nginx.conf must have 'server' block")
+        self.assertTrue(self._nginx().blocks('server'), "nginx.conf must have 'server' block")
 
     def test_nginx_conf_has_upstream_block(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('upstream', content, "nginx.conf should define upstream backend")
+        self.assertTrue(self._nginx().blocks('upstream'), "nginx.conf should define upstream backend")
 
     def test_nginx_conf_has_ssl_certificate(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('ssl_certificate', content,
-                         "nginx.conf should configure SSL certificates")
+        self.assertTrue(self._nginx().find_directives('ssl_certificate'),
+                        "nginx.conf should configure SSL certificates")
 
     def test_nginx_conf_has_ssl_key(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('ssl_certificate_key', content,
-                         "nginx.conf should configure SSL key")
+        self.assertTrue(self._nginx().find_directives('ssl_certificate_key'),
+                        "nginx.conf should configure SSL key")
 
     def test_nginx_conf_has_proxy_pass(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('proxy_pass', content,
-                         "nginx.conf should have proxy_pass for backend")
+        self.assertTrue(self._nginx().find_directives('proxy_pass'),
+                        "nginx.conf should have proxy_pass for backend")
 
     def test_nginx_conf_has_http_redirect(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('return 301', content,
-                         "nginx.conf should redirect HTTP to HTTPS")
+        returns = [args for _, args in self._nginx().find_directives('return')]
+        self.assertTrue(any(args[:1] == ['301'] for args in returns),
+                        "nginx.conf should redirect HTTP to HTTPS")
 
     def test_nginx_conf_has_websocket_upgrade(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('Upgrade', content,
-                         "nginx.conf should support WebSocket upgrade headers")
+        headers = [args for _, args in self._nginx().find_directives('proxy_set_header')]
+        self.assertTrue(any(args[:1] == ['Upgrade'] for args in headers),
+                        "nginx.conf should support WebSocket upgrade headers")
 
     def test_nginx_conf_has_docs_location(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('/docs/', content,
-                         "nginx.conf should have /docs/ location for documentation")
+        self.assertIn('/docs/', self._nginx().locations(),
+                      "nginx.conf should have /docs/ location for documentation")
 
     def test_nginx_conf_has_worker_connections(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('worker_connections', content,
-                         "nginx.conf should configure worker_connections")
+        events = self._nginx().blocks('events')
+        self.assertTrue(events and events[0].directive('worker_connections'),
+                        "nginx.conf should configure worker_connections")
 
     def test_nginx_conf_braces_balanced(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            open_braces = content.count('{')
-            close_braces = content.count('}')
-            self.assertEqual(open_braces, close_braces,
-                           f"Unbalanced braces: {open_braces} open, {close_braces} close")
+        content = self._nginx().text
+        open_braces = content.count('{')
+        close_braces = content.count('}')
+        self.assertEqual(open_braces, close_braces,
+                       f"Unbalanced braces: {open_braces} open, {close_braces} close")
 
     def test_nginx_conf_no_syntax_errors(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            if 'server_name' in content:
-                self.assertIsNotNone(
-                    re.search(r'server_name\s+[\w\.\-]+', content),
-                    "server_name directive syntax invalid"
-                )
+        nginx = self._nginx()
+        self.assertIsNone(nginx.error, f"nginx.conf does not parse: {nginx.error}")
+        if 'server_name' in nginx.text:
+            self.assertIsNotNone(
+                re.search(r'server_name\s+[\w\.\-]+', nginx.text),
+                "server_name directive syntax invalid"
+            )
 
     def test_nginx_conf_has_acme_challenge_location(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('/.well-known/acme-challenge/', content,
-                         "nginx.conf should have ACME challenge location for Let's Encrypt")
+        self.assertIn('/.well-known/acme-challenge/', self._nginx().locations(),
+                      "nginx.conf should have ACME challenge location for Let's Encrypt")
 
     def test_nginx_conf_listen_ports(self):
-        with open(self.nginx_conf_file, 'r') as f:
-            content = f.read()
-            self.assertRegex(content, r'listen\s+80', "nginx.conf should listen on port 80")
-            self.assertRegex(content, r'listen\s+443\s+ssl', 
-                           "nginx.conf should listen on port 443 with SSL")
+        listens = [args for _, args in self._nginx().find_directives('listen')]
+        self.assertIn(['80'], listens, "nginx.conf should listen on port 80")
+        self.assertIn(['443', 'ssl'], listens,
+                      "nginx.conf should listen on port 443 with SSL")
 
 
 class TestSupervisorConfig(unittest.TestCase):
@@ -129,112 +113,83 @@ class TestSupervisorConfig(unittest.TestCase):
         self.assertTrue(self.supervisord_conf_file.exists(),
                        f"supervisord.conf not found at {self.supervisord_conf_file}")
 
+    def _supervisord(self):
+        return config_model.supervisord(self.supervisord_conf_file)
+
+    def _program(self, name):
+        program = self._supervisord().programs().get(name)
+        self.assertIsNotNone(program, f"{name} section not found")
+        return program
+
     def test_supervisord_conf_not_empty(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            self.assertTrue(len(content.strip()) > 0, "supervisord.conf is empty")
+        content = self._supervisord().text
+        self.assertTrue(len(content.strip()) > 0, "supervisord.conf is empty")
 
     def test_supervisord_conf_has_supervisord_section(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('[supervisord]', content,
-                         "supervisord.conf must have [supervisord] section")
+        self.assertIn('supervisord', self._supervisord().sections,
+                      "supervisord.conf must have [supervisord] section")
 
     def test_supervisord_conf_nodaemon_true(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('nodaemon=true', content,
+        self.assertEqual(self._supervisord().sections.get('supervisord', {}).get('nodaemon'), 'true',
                          "supervisord should run in foreground mode (nodaemon=true)")
 
     def test_supervisord_conf_has_vncserver_program(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('[program:vncserver]', content,
-                         "supervisord.conf should define vncserver program")
+        self.assertIn('vncserver', self._supervisord().programs(),
+                      "supervisord.conf should define vncserver program")
 
     def test_supervisord_conf_has_novnc_program(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('[program:novnc]', content,
-                         "supervisord.conf should define novnc program")
+        self.assertIn('novnc', self._supervisord().programs(),
+                      "supervisord.conf should define novnc program")
 
     def test_supervisord_vncserver_has_command(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            # Find vncserver section and check for command
-            vncserver_section = re.search(r'\[program:vncserver\](.*?)(?=\[|$)', content, re.DOTALL)
-            self.assertIsNotNone(vncserver_section, "vncserver section not found")
-            self.assertIn('command=', vncserver_section.group(1),
-                         "vncserver program must have command directive")
+        self.assertIn('command', self._program('vncserver'),
+                      "vncserver program must have command directive")
 
     def test_supervisord_vncserver_has_autorestart(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            vncserver_section = re.search(r'\[program:vncserver\](.*?)(?=\[|$)', content, re.DOTALL)
-            self.assertIsNotNone(vncserver_section)
-            self.assertIn('autorestart=', vncserver_section.group(1),
-                         "vncserver program should have autorestart directive")
+        self.assertIn('autorestart', self._program('vncserver'),
+                      "vncserver program should have autorestart directive")
 
     def test_supervisord_novnc_has_command(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            novnc_section = re.search(r'\[program:novnc\](.*?)(?=\[|$)', content, re.DOTALL)
-            self.assertIsNotNone(novnc_section, "novnc section not found")
-            self.assertIn('command=', novnc_section.group(1),
-                         "novnc program must have command directive")
+        self.assertIn('command', self._program('novnc'),
+                      "novnc program must have command directive")
 
     def test_supervisord_vncserver_runs_as_user(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            vncserver_section = re.search(r'\[program:vncserver\](.*?)(?=\[|$)', content, re.DOTALL)
-            self.assertIsNotNone(vncserver_section)
-            self.assertIn('user=', vncserver_section.group(1),
-                         "vncserver program should specify user")
+        self.assertIn('user', self._program('vncserver'),
+                      "vncserver program should specify user")
 
     def test_supervisord_has_logfile(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('logfile=', content,
-                         "supervisord should have logfile configuration")
+        self.assertIn('logfile', self._supervisord().sections.get('supervisord', {}),
+                      "supervisord should have logfile configuration")
 
     def test_supervisord_logfile_unbounded(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('logfile_maxbytes=0', content,
+        self.assertEqual(self._supervisord().sections.get('supervisord', {}).get('logfile_maxbytes'), '0',
                          "supervisord logfile_maxbytes should be 0 for Docker (unbounded)")
 
     def test_supervisord_vncserver_has_environment_vars(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            vncserver_section = re.search(r'\[program:vncserver\](.*?)(?=\[|$)', content, re.DOTALL)
-            self.assertIsNotNone(vncserver_section)
-            self.assertIn('environment=', vncserver_section.group(1),
-                         "vncserver program should set environment variables")
+        self.assertIn('environment', self._program('vncserver'),
+                      "vncserver program should set environment variables")
 
     def test_supervisord_vncserver_geometry_configured(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            self.assertIn('-geometry', content,
-                         "VNC geometry should be configured")
+        self.assertIn('-geometry', self._program('vncserver').get('command', ''),
+                      "VNC geometry should be configured")
 
     def test_supervisord_section_headers_valid(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            content = f.read()
-            section_pattern = r'\[[\w:]+\]'
-            sections = re.findall(section_pattern, content)
-            self.assertTrue(len(sections) > 0, "No valid section headers found")
-            for section in sections:
-                self.assertRegex(section, section_pattern,
-                               f"Invalid section header: {section}")
+        content = self._supervisord().text
+        section_pattern = r'\[[\w:]+\]'
+        sections = re.findall(section_pattern, content)
+        self.assertTrue(len(sections) > 0, "No valid section headers found")
+        for section in sections:
+            self.assertRegex(section, section_pattern,
+                           f"Invalid section header: {section}")
 
     def test_supervisord_no_invalid_directives(self):
-        with open(self.supervisord_conf_file, 'r') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if line and not line.startswith(';') and not line.startswith('#') and not line.startswith('['):
-                    self.assertIn('=', line,
-                                 f"Line {line_num} doesn't have key=value format: {line}")
-
+        supervisord = self._supervisord()
+        for line_num, line in enumerate(supervisord.lines, 1):
+            line = line.strip()
+            if line and not line.startswith(';') and not line.startswith('#') and not line.startswith('['):
+                self.assertIn('=', line,
+                             f"Line {line_num} doesn't have key=value format: {line}")
+        self.assertEqual(supervisord.invalid_lines, [])
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,166 @@
+"""
+Unit tests for the shared deployment config model (config_model.py).
+Tests the parsers and the parse-once cache.
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import config_model  # noqa: E402
+
+
+class ConfigModelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        path = self.dir / name
+        path.write_text(text)
+        return path
+
+
+class TestCache(ConfigModelTestCase):
+
+    def test_parsed_once_while_unchanged(self):
+        path = self.write("a.sh", "#!/bin/bash\nA=1\n")
+        first = config_model.shell_script(path)
+        self.assertIs(config_model.shell_script(path), first)
+        self.assertIs(config_model.shell_script(self.dir / "." / "a.sh"), first)
+
+    def test_kinds_are_cached_separately(self):
+        path = self.write("a.conf", "[supervisord]\nnodaemon=true\n")
+        self.assertIsInstance(config_model.text(path), config_model.TextFile)
+        self.assertIsInstance(config_model.supervisord(path), config_model.SupervisordConfig)
+
+    def test_edit_invalidates(self):
+        path = self.write("a.sh", "A=1\n")
+        first = config_model.shell_script(path)
+        path.write_text("A=22\n")
+        second = config_model.shell_script(path)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.value("A"), "22")
+
+    def test_same_size_edit_with_new_mtime_invalidates(self):
+        path = self.write("a.sh", "A=1\n")
+        first = config_model.shell_script(path)
+        path.write_text("A=2\n")
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertEqual(config_model.shell_script(path).value("A"), "2")
+        self.assertEqual(first.value("A"), "1")
+
+
+class TestNginx(ConfigModelTestCase):
+
+    def test_blocks_and_directives(self):
+        nginx = config_model.nginx(self.write("nginx.conf", (
+            "events { worker_connections 1024; }\n"
+            "http {\n"
+            "  server {\n"
+            "    listen 443 ssl;  # tls\n"
+            "    location / { proxy_pass http://app; }\n"
+            "    location ~ \"^/a;b\" { return 404; }\n"
+            "  }\n"
+            "}\n")))
+        self.assertIsNone(nginx.error)
+        self.assertEqual(nginx.blocks("events")[0].directive("worker_connections"), ["1024"])
+        self.assertEqual([args for _, args in nginx.find_directives("listen")], [["443", "ssl"]])
+        locations = nginx.locations()
+        self.assertEqual(sorted(locations), ['/', '~ "^/a;b"'])
+        self.assertEqual(locations["/"].directive("proxy_pass"), ["http://app"])
+        self.assertEqual(locations["/"].line, 5)
+
+    def test_unbalanced_braces(self):
+        self.assertIn("not closed", config_model.nginx(self.write("a.conf", "http { server {\n}\n")).error)
+        self.assertIn("unexpected", config_model.nginx(self.write("b.conf", "http { }\n}\n")).error)
+
+    def test_missing_semicolon(self):
+        nginx = config_model.nginx(self.write("a.conf", "http { listen 80 }\n"))
+        self.assertIn("listen", nginx.error)
+
+
+class TestSupervisord(ConfigModelTestCase):
+
+    def test_sections_and_continuations(self):
+        conf = config_model.supervisord(self.write("s.conf", (
+            "; comment\n"
+            "[supervisord]\n"
+            "nodaemon = true\n"
+            "[program:vnc]\n"
+            "command=/usr/bin/vnc\n"
+            "environment=A=1,\n"
+            "    B=2\n"
+            "garbage line\n")))
+        self.assertEqual(conf.sections["supervisord"], {"nodaemon": "true"})
+        self.assertEqual(conf.programs()["vnc"]["environment"], "A=1,\nB=2")
+        self.assertEqual(conf.invalid_lines, [(8, "garbage line")])
+
+
+class TestDockerfile(ConfigModelTestCase):
+
+    def test_stages_and_continuations(self):
+        dockerfile = config_model.dockerfile(self.write("Dockerfile", (
+            "FROM ubuntu:22.04 AS builder\n"
+            "RUN apt-get update && \\\n"
+            "    # comment inside a continuation\n"
+            "    apt-get install -y g++\n"
+            "\n"
+            "from ubuntu:22.04\n"
+            "COPY --from=builder /out /usr/local\n"
+            "EXPOSE 8080\n")))
+        self.assertEqual([(s.base, s.name) for s in dockerfile.stages],
+                         [("ubuntu:22.04", "builder"), ("ubuntu:22.04", None)])
+        run, = dockerfile.find("RUN")
+        self.assertEqual(run.args, "apt-get update && apt-get install -y g++")
+        self.assertEqual((run.line, run.stage), (2, 0))
+        self.assertEqual([i.args for i in dockerfile.stages[1].find("EXPOSE")], ["8080"])
+        self.assertIs(dockerfile.stage("builder"), dockerfile.stages[0])
+
+
+class TestCompose(ConfigModelTestCase):
+
+    def test_services(self):
+        compose = config_model.compose(self.write("c.yml", "services:\n  web:\n    image: nginx\n"))
+        self.assertIsNone(compose.error)
+        self.assertEqual(compose.services["web"]["image"], "nginx")
+
+    def test_invalid_yaml(self):
+        compose = config_model.compose(self.write("c.yml", "services: [unclosed\n"))
+        self.assertIsNotNone(compose.error)
+        self.assertIsNone(compose.config)
+        self.assertEqual(compose.services, {})
+
+
+class TestShellScript(ConfigModelTestCase):
+
+    def test_shebang_and_assignments(self):
+        script = config_model.shell_script(self.write("s.sh", (
+            "#!/bin/bash\n"
+            "NAME=\"tikzit\"\n"
+            "export PORT=8080\n"
+            "  local DIR='/srv'\n"
+            "NAME=other\n"
+            "echo NOT=assigned\n")))
+        self.assertEqual(script.shebang, "#!/bin/bash")
+        self.assertEqual(list(script.assignments), ["NAME", "PORT", "DIR"])
+        self.assertEqual(script.assignments["NAME"], ['"tikzit"', "other"])
+        self.assertEqual(script.value("NAME"), "tikzit")
+        self.assertEqual(script.value("DIR"), "/srv")
+        self.assertIsNone(script.value("MISSING"))
+
+    def test_no_shebang(self):
+        self.assertIsNone(config_model.shell_script(self.write("s.sh", "A=1\n")).shebang)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+"""
+Unit tests for the deployment test runner (run_tests.py).
+Tests sharded runs, the JUnit XML report and change-aware selection.
+"""
+
+import unittest
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import run_tests  # noqa: E402
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+class TestRunner(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # a suite drops its tests as it runs them, so every run loads afresh
+        cls.serial = run_tests.run_serial(cls._suite(), verbosity=0)
+
+    @staticmethod
+    def _suite():
+        # everything but this module, which would run itself again
+        return run_tests.load_modules([m for m in run_tests.TEST_MODULES if m != "test_run_tests"])[0]
+
+    def _report(self, records):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "results.xml"
+            run_tests.write_junit_xml(records, path, 1.5)
+            return path.read_bytes()
+
+    def test_shards_are_test_classes(self):
+        classes = run_tests.test_classes(self._suite())
+        self.assertIn("test_config_files.TestNginxConfig", classes)
+        self.assertIn("test_shell_scripts.TestDockerfile", classes)
+        self.assertEqual(len(classes), len(set(classes)))
+
+    def test_parallel_run_matches_serial(self):
+        parallel = run_tests.run_parallel(self._suite(), 3, verbosity=0)
+        key = lambda r: (r["classname"], r["name"], r["outcome"])
+        self.assertEqual([key(r) for r in parallel], [key(r) for r in self.serial])
+
+    def test_junit_xml_matches_checked_in_report(self):
+        report = ET.fromstring(self._report(self.serial))
+        checked_in = ET.parse(FIXTURES / "test-results.xml").getroot()
+        self.assertEqual(report.tag, checked_in.tag)
+        self.assertEqual(report.attrib, checked_in.attrib)
+        suite, expected = report.find("testsuite"), checked_in.find("testsuite")
+        self.assertEqual(set(suite.attrib), set(expected.attrib))
+        cases = lambda s: sorted((c.get("classname"), c.get("name")) for c in s.iter("testcase"))
+        self.assertTrue(set(cases(expected)) <= set(cases(suite)))
+
+    def test_junit_xml_reports_failures(self):
+        records = [
+            {"classname": "tests.deployment.m.C", "name": "test_a", "time": 0.01,
+             "outcome": "failure", "message": "boom", "details": "Traceback ..."},
+            {"classname": "tests.deployment.m.C", "name": "test_b", "time": 0.0,
+             "outcome": "skipped", "message": "no docker", "details": ""},
+            {"classname": "tests.deployment.m.C", "name": "test_c", "time": 0.0,
+             "outcome": "passed", "message": "", "details": ""},
+        ]
+        report = self._report(records)
+        self.assertTrue(report.startswith(b'<?xml version="1.0" encoding="utf-8"?><testsuites'))
+        suite = ET.fromstring(report).find("testsuite")
+        self.assertEqual((suite.get("tests"), suite.get("failures"), suite.get("skipped"), suite.get("errors")),
+                         ("3", "1", "1", "0"))
+        self.assertEqual(suite.find("testcase/failure").get("message"), "boom")
+        self.assertEqual(suite.find("testcase/skipped").get("message"), "no docker")
+
+
+class TestSelection(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.suite = run_tests.load_modules()[0]
+        cls.classes = run_tests.test_classes(cls.suite)
+
+    def _affected(self, *changed):
+        return run_tests.affected_classes(self.classes, list(changed))
+
+    def test_every_class_has_inputs(self):
+        self.assertEqual(sorted(self.classes), sorted(run_tests.TEST_INPUTS))
+
+    def test_config_change_selects_its_classes(self):
+        self.assertEqual(self._affected("nginx.conf"), ["test_config_files.TestNginxConfig"])
+        self.assertEqual(self._affected("docker-compose.prod.yml", "Dockerfile"),
+                         ["test_docker_compose.TestDockerCompose", "test_shell_scripts.TestDockerfile",
+                          "test_session_ready.TestSessionReady"])
+        self.assertEqual(self._affected("deploy-osx.sh"),
+                         ["test_shell_scripts.TestShellScripts", "test_shell_syntax.TestShellSyntaxChecker"])
+
+    def test_unrelated_change_selects_nothing(self):
+        self.assertEqual(self._affected("src/data/node.cpp", "scripts/run.sh", "tests/deployment/README.md"), [])
+
+    def test_test_module_change_selects_its_classes(self):
+        self.assertEqual(self._affected("tests/deployment/test_config_files.py"),
+                         ["test_config_files.TestNginxConfig", "test_config_files.TestSupervisorConfig"])
+        self.assertEqual(self._affected("tests/deployment/test_run_tests.py"),
+                         ["test_run_tests.TestRunner", "test_run_tests.TestSelection"])
+
+    def test_helper_tests_are_in_the_suite(self):
+        for module in ("test_config_model", "test_shell_syntax", "test_run_tests"):
+            self.assertTrue(any(c.startswith(module + ".") for c in self.classes), module)
+
+    def test_shared_change_selects_everything(self):
+        self.assertEqual(self._affected("nginx.conf", "tests/deployment/config_model.py"), self.classes)
+        self.assertEqual(self._affected("tests/requirements.txt"), self.classes)
+
+    def test_unmapped_class_is_always_selected(self):
+        classes = self.classes + ["test_new.TestSomething"]
+        self.assertEqual(run_tests.affected_classes(classes, ["nginx.conf"]),
+                         ["test_config_files.TestNginxConfig", "test_new.TestSomething"])
+
+    def test_changed_files(self):
+        self.assertIsNone(run_tests.changed_files("no-such-ref-" + "0" * 8))
+
+    def test_slowest_first(self):
+        durations = run_tests.load_durations(FIXTURES / "test-results.xml")
+        self.assertIn("test_config_files.TestNginxConfig", durations)
+        durations = {
+            "test_config_files.TestNginxConfig": {"test_nginx_conf_exists": 0.5, "test_nginx_conf_not_empty": 2.0},
+            "test_shell_scripts.TestDockerfile": {"test_dockerfile_exists": 1.0},
+            "test_docker_compose.TestDockerCompose": {"test_docker_compose_yml_exists": 9.0},
+        }
+        classes = ["test_config_files.TestNginxConfig", "test_shell_scripts.TestDockerfile",
+                   "test_docker_compose.TestDockerCompose", "test_config_files.TestSupervisorConfig"]
+        ordered = list(run_tests.iter_tests(run_tests.order_tests(self.suite, classes, durations)))
+        self.assertEqual(run_tests.test_classes(ordered), [
+            "test_config_files.TestSupervisorConfig",  # no history
+            "test_docker_compose.TestDockerCompose",
+            "test_config_files.TestNginxConfig",
+            "test_shell_scripts.TestDockerfile",
+        ])
+        nginx = [t._testMethodName for t in ordered if type(t).__name__ == "TestNginxConfig"]
+        # tests without a recorded time first, then slowest first
+        self.assertEqual(nginx[-2:], ["test_nginx_conf_not_empty", "test_nginx_conf_exists"])
+        self.assertEqual(len(ordered), len([t for t in run_tests.iter_tests(self.suite)
+                                            if run_tests.test_classes([t])[0] in classes]))
+
+    def test_partial_run_keeps_the_other_durations(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "durations.xml"
+            run_tests.write_junit_xml([
+                {"classname": "tests.deployment.test_config_files.TestNginxConfig", "name": "test_a", "time": 2.0,
+                 "outcome": "passed", "message": "", "details": ""},
+                {"classname": "tests.deployment.test_gone.TestGone", "name": "test_b", "time": 1.0,
+                 "outcome": "passed", "message": "", "details": ""},
+            ], path, 3.0)
+            records = run_tests.run_serial(run_tests.order_tests(
+                self.suite, ["test_config_files.TestSupervisorConfig"], {}), verbosity=0)
+            run_tests.update_durations(path, records, self.classes)
+            durations = run_tests.load_durations(path)
+        self.assertEqual(durations["test_config_files.TestNginxConfig"], {"test_a": 2.0})
+        self.assertEqual(len(durations["test_config_files.TestSupervisorConfig"]), len(records))
+        self.assertNotIn("test_gone.TestGone", durations)
+
+    def test_parallel_shards_keep_the_order(self):
+        classes = ["test_config_files.TestNginxConfig"]
+        durations = {classes[0]: {"test_nginx_conf_exists": 5.0}}
+        records = run_tests.run_parallel(run_tests.order_tests(self.suite, classes, durations), 2, verbosity=0)
+        self.assertEqual(records[-1]["name"], "test_nginx_conf_exists")
+        self.assertEqual(records[-1]["outcome"], "passed")
+
+
+if __name__ == '__main__':
+    unittest.main()
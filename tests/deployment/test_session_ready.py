@@ -0,0 +1,136 @@
+"""
+Unit tests for session_ready.py, the helper that starts TikZiT in the VNC session.
+/proc and the X11 socket directory are replaced by temporary directories.
+"""
+
+import unittest
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+import session_ready  # noqa: E402
+
+TCP_HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+LISTEN_8080 = "   0: 00000000:1F90 00000000:0000 0A 00000000:00000000 00:00000000 00000000  1000        0 1 1\n"
+LISTEN_5901 = "   1: 00000000:170D 00000000:0000 0A 00000000:00000000 00:00000000 00000000  1000        0 2 1\n"
+
+
+class TestSessionReady(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.proc = self.dir / "proc"
+        (self.proc / "1").mkdir(parents=True)
+        (self.proc / "net").mkdir()
+        # PID 1 started 250 ticks after a boot at 1700000000
+        (self.proc / "1" / "stat").write_text("1 (supervisord) S" + " 0" * 18 + " 250 0 0\n")
+        (self.proc / "stat").write_text("cpu  1 2 3\nbtime 1700000000\n")
+        (self.proc / "net" / "tcp").write_text(TCP_HEADER + LISTEN_5901)
+        self.x11_dir = self.dir / "x11"
+        self.x11_dir.mkdir()
+        self.log = self.dir / "timeline.jsonl"
+        self.launched = []
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+        self.tmp.cleanup()
+
+    def start_x_server(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(str(self.x11_dir / "X1"))
+        sock.listen(8)
+        self.sockets.append(sock)
+
+    def start_process(self, pid, name):
+        (self.proc / str(pid)).mkdir()
+        (self.proc / str(pid) / "comm").write_text(name + "\n")
+
+    def main(self, *options):
+        argv = ["--display", ":1", "--proc", str(self.proc), "--x11-dir", str(self.x11_dir),
+                "--log", str(self.log), "--boot-file", str(self.dir / "session_boot"), "--interval", "0.01",
+                *options, "--", "/usr/local/bin/tikzit", "-v"]
+        return session_ready.main(argv, execvp=lambda *args: self.launched.append(args))
+
+    def events(self):
+        return [json.loads(line) for line in self.log.read_text().splitlines()]
+
+    def test_container_start_time(self):
+        ticks = os.sysconf("SC_CLK_TCK")
+        self.assertAlmostEqual(session_ready.container_started(self.proc), 1700000000 + 250 / ticks)
+        self.assertAlmostEqual(session_ready.container_started(self.dir / "missing"), time.time(), delta=5)
+
+    def test_signals(self):
+        self.assertFalse(session_ready.x11_ready(":1", self.x11_dir))
+        self.start_x_server()
+        self.assertTrue(session_ready.x11_ready(":1.0", self.x11_dir))
+        self.assertFalse(session_ready.process_running("xfwm4", self.proc))
+        self.start_process(42, "xfwm4")
+        self.assertTrue(session_ready.process_running("xfwm4", self.proc))
+        self.assertFalse(session_ready.port_listening(8080, self.proc))
+        (self.proc / "net" / "tcp6").write_text(TCP_HEADER + LISTEN_8080)
+        self.assertTrue(session_ready.port_listening(8080, self.proc))
+
+    def test_launches_once_everything_is_up(self):
+        self.start_x_server()
+
+        def desktop_comes_up():
+            time.sleep(0.05)
+            self.start_process(42, "xfwm4")
+            time.sleep(0.05)
+            (self.proc / "net" / "tcp").write_text(TCP_HEADER + LISTEN_5901 + LISTEN_8080)
+
+        thread = threading.Thread(target=desktop_comes_up)
+        thread.start()
+        self.assertEqual(self.main("--timeout", "10"), 0)
+        thread.join()
+        self.assertEqual(self.launched, [("/usr/local/bin/tikzit", ["/usr/local/bin/tikzit", "-v"])])
+        events = self.events()
+        self.assertEqual([e["event"] for e in events], ["x11", "wm", "websockify", "launch"])
+        self.assertEqual(len(set(e["boot"] for e in events)), 1)
+        self.assertTrue(events[1]["at"] >= events[0]["at"] + 0.04)
+        started = int(1700000000 + 250 / os.sysconf("SC_CLK_TCK"))
+        self.assertEqual(events[0]["boot"], f"{socket.gethostname()}-{started}")
+
+    def test_launches_anyway_after_the_timeout(self):
+        self.start_x_server()
+        self.assertEqual(self.main("--timeout", "0.05"), 0)
+        self.assertEqual(len(self.launched), 1)
+        events = self.events()
+        self.assertEqual([e["event"] for e in events], ["x11", "timeout", "launch"])
+        self.assertEqual(events[1]["missing"], ["websockify", "wm"])
+
+    def test_boot_id_from_entrypoint(self):
+        (self.dir / "session_boot").write_text("0123abcd-1700000001\n")
+        self.assertEqual(self.main("--timeout", "0"), 0)
+        self.assertEqual(set(e["boot"] for e in self.events()), {"0123abcd-1700000001"})
+
+    def test_unwritable_log_does_not_block_the_launch(self):
+        self.log = self.dir / "missing" / "timeline.jsonl"
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            self.assertEqual(self.main("--timeout", "0"), 0)
+        self.assertEqual(len(self.launched), 1)
+        self.assertIn("cannot write", err.getvalue())
+
+    def test_xstartup_uses_the_helper(self):
+        entrypoint = (ROOT / "entrypoint.sh").read_text()
+        xstartup = entrypoint[entrypoint.index("<<'EOF'"):]
+        self.assertIn("/usr/local/bin/session_ready.py -- /usr/local/bin/tikzit", xstartup)
+        self.assertNotIn("sleep", xstartup)
+        self.assertIn("COPY session_ready.py /usr/local/bin/session_ready.py", (ROOT / "Dockerfile").read_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
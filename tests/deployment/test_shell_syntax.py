@@ -0,0 +1,94 @@
+"""
+Unit tests for the batched shell syntax checker (shell_syntax.py).
+"""
+
+import unittest
+import json
+import sys
+import tempfile
+import unittest.mock
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import shell_syntax  # noqa: E402
+
+
+class TestShellSyntaxChecker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.cache = self.dir / "cache" / "shell-syntax.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        path = self.dir / name
+        path.write_text(text)
+        return path
+
+    def checker(self):
+        return shell_syntax.ShellSyntaxChecker(self.cache)
+
+    def test_reports_errors_against_the_script(self):
+        good = self.write("good.sh", "#!/bin/bash\nset -e\necho ok\n")
+        bad = self.write("bad.sh", "#!/bin/bash\nif true; then\n  echo\n")
+        results = self.checker().check([good, bad])
+        self.assertEqual(results[good], (True, ""))
+        ok, error = results[bad]
+        self.assertFalse(ok)
+        self.assertTrue(error.startswith("bad.sh: line"), error)
+
+    def test_unchanged_scripts_are_not_rechecked(self):
+        scripts = [self.write(f"s{i}.sh", f"echo {i}\n") for i in range(3)]
+        first = self.checker()
+        first.check(scripts)
+        self.assertEqual((first.checked, first.reused), (3, 0))
+
+        second = self.checker()
+        with unittest.mock.patch.object(shell_syntax.subprocess, "run") as run:
+            second.check(scripts)
+        run.assert_not_called()
+        self.assertEqual((second.checked, second.reused), (0, 3))
+
+        scripts[1].write_text("echo changed\n")
+        third = self.checker()
+        third.check(scripts)
+        self.assertEqual((third.checked, third.reused), (1, 2))
+
+    def test_identical_contents_are_checked_once(self):
+        a = self.write("a.sh", "echo same\n")
+        b = self.write("b.sh", "echo same\n")
+        checker = self.checker()
+        self.assertEqual(checker.check([a, b]), {a: (True, ""), b: (True, "")})
+        self.assertEqual(checker.checked, 1)
+
+    def test_cache_from_another_bash_is_ignored(self):
+        script = self.write("a.sh", "echo\n")
+        self.checker().check([script])
+        data = json.loads(self.cache.read_text())
+        data["bash"] = "/opt/old/bash:0:0"
+        self.cache.write_text(json.dumps(data))
+        checker = self.checker()
+        checker.check([script])
+        self.assertEqual(checker.checked, 1)
+
+    def test_corrupt_cache_is_ignored(self):
+        self.cache.parent.mkdir()
+        self.cache.write_text("{not json")
+        checker = self.checker()
+        checker.check([self.write("a.sh", "echo\n")])
+        self.assertEqual(checker.checked, 1)
+
+    def test_repository_scripts(self):
+        root = Path(__file__).parent.parent.parent
+        names = [p.name for p in shell_syntax.repository_scripts(root)]
+        self.assertEqual(names[:len(shell_syntax.SHELL_SCRIPTS)], shell_syntax.SHELL_SCRIPTS)
+        self.assertIn("deploy-linux.sh", names)
+        self.assertIn("deploy-osx.sh", names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,19 @@
+"""
+Tests for the release and deployment helper scripts in scripts/
+
+This package contains unit tests for the Python tooling used by the release jobs
+and the multi-user deployment:
+- GitHub API helper (gh.py), exercised against a local stand-in HTTP server
+- SDK packager (package_sdk.py) and its incremental build cache
+- Include-closure scanner for the SDK headers (include_closure.py)
+- SDK packaging benchmark harness (bench_package_sdk.py)
+- JUnit timing history and duration-regression check (junit_history.py)
+- Percentiles shared by the timing and load-test scripts (stats.py)
+- Bulk user provisioning (provision_users.py) against a stand-in docker client
+- nginx routing table generator and its benchmark (nginx_routes.py, bench_nginx_routes.py)
+- Idle session sweep and wake endpoint (session_controller.py)
+- Warm pool of pre-booted sessions and its RFB readiness probe (warm_pool.py)
+- Session boot timelines and their percentiles across boots (boot_profile.py)
+- Websocket gateway to the sessions' VNC servers, against a stub RFB server (vnc_gateway.py)
+- noVNC session recording and multi-viewer replay against a stand-in RFB server (rfb_loadtest.py)
+"""
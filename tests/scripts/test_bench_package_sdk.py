@@ -0,0 +1,79 @@
+"""
+Unit tests for scripts/bench_package_sdk.py.
+Runs the benchmarks against a tiny synthetic tree.
+"""
+
+import unittest
+import unittest.mock
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import bench_package_sdk  # noqa: E402
+import package_sdk  # noqa: E402
+
+
+def sample(seconds, size=1000):
+    return {"seconds": seconds, "bytes_read": 0, "bytes_written": 0, "output_bytes": size}
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.history = Path(self.tmp.name) / "history.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_synthetic_tree_is_benchmarked_per_stage(self):
+        environ = dict(os.environ)
+        results = bench_package_sdk.run_benchmarks(headers=8, repeat=1, jobs=2, real=False)
+        self.assertEqual(dict(os.environ), environ)
+        self.assertEqual(sorted(results), [
+            "synthetic-8/build_sdk_tree", "synthetic-8/make_tar_gz", "synthetic-8/make_zip",
+            "synthetic-8/stream_tar_gz", "synthetic-8/stream_tar_xz", "synthetic-8/stream_zip"])
+        for result in results.values():
+            self.assertGreater(result["output_bytes"], 0)
+            self.assertGreaterEqual(result["seconds"], 0)
+        # the staged tree holds all eight headers, the docs and the manifest
+        self.assertGreater(results["synthetic-8/build_sdk_tree"]["output_bytes"],
+                           results["synthetic-8/stream_tar_xz"]["output_bytes"])
+        self.assertEqual(package_sdk.ROOT, ROOT.resolve())
+
+    def test_history_is_appended(self):
+        argv = ["--no-real", "--headers", "4", "--repeat", "1", "--history", str(self.history)]
+        with unittest.mock.patch("builtins.print"):
+            self.assertEqual(bench_package_sdk.main(argv), 0)
+            self.assertEqual(bench_package_sdk.main(argv), 0)
+        runs = json.loads(self.history.read_text())["runs"]
+        self.assertEqual(len(runs), 2)
+        self.assertIn("synthetic-4/stream_zip", runs[1]["results"])
+
+    def test_regressions_against_median_baseline(self):
+        history = [{"results": {"a": sample(s)}} for s in (1.0, 1.1, 5.0, 0.9, 1.0)]
+        find = bench_package_sdk.find_regressions
+        self.assertEqual(find(history, {"a": sample(1.2)}, 0.25, 0.05), [])
+        self.assertEqual(len(find(history, {"a": sample(1.3)}, 0.25, 0.05)), 1)
+        self.assertIn("output_bytes", find(history, {"a": sample(1.0, 1100)}, 0.25, 0.05)[0])
+        # new benchmarks have no baseline yet
+        self.assertEqual(find(history, {"b": sample(9.0)}, 0.25, 0.05), [])
+
+    def test_fail_on_regression(self):
+        self.history.write_text(json.dumps({"runs": [{"results": {
+            "synthetic-4/make_zip": sample(1e-9, 1)}}]}))
+        argv = ["--no-real", "--headers", "4", "--repeat", "1", "--history", str(self.history),
+                "--no-record", "--fail-on-regression"]
+        with unittest.mock.patch("builtins.print") as printed:
+            self.assertEqual(bench_package_sdk.main(argv), 1)
+        self.assertTrue(any("REGRESSION synthetic-4/make_zip" in str(c.args[0]) for c in printed.call_args_list))
+        self.assertEqual(len(json.loads(self.history.read_text())["runs"]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+"""
+Unit tests for scripts/boot_profile.py.
+The logs of two boots of one container are written to a temporary directory.
+"""
+
+import unittest
+import contextlib
+import io
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import boot_profile  # noqa: E402
+import provision_users  # noqa: E402
+
+# 2026-10-17 10:00:00 UTC
+T0 = 1792231200.0
+
+TIMELINE = "".join(json.dumps(entry) + "\n" for entry in [
+    {"boot": "abc-1", "event": "entrypoint", "at": T0 + 0.2},
+    {"boot": "abc-1", "event": "vnc_password", "at": T0 + 0.5},
+    {"boot": "abc-1", "event": "supervisord", "at": T0 + 0.9},
+    {"boot": "abc-1", "event": "x11", "at": T0 + 2.4, "since_start": 2.5},
+    {"boot": "abc-1", "event": "launch", "at": T0 + 3.2, "since_start": 3.3},
+    {"boot": "abc-2", "event": "entrypoint", "at": T0 + 600.0},
+    {"boot": "abc-2", "event": "supervisord", "at": T0 + 601.0},
+    {"boot": "abc-2", "event": "launch", "at": T0 + 605.0},
+]) + "not json\n"
+
+SUPERVISORD_LOG = """\
+2026-10-17 10:00:01,000 INFO supervisord started with pid 1
+2026-10-17 10:00:01,100 INFO spawned: 'vncserver' with pid 12
+2026-10-17 10:00:01,150 INFO spawned: 'novnc' with pid 13
+2026-10-17 10:00:02,200 INFO success: vncserver entered RUNNING state, process has stayed up for > than 1 seconds (startsecs)
+2026-10-17 10:10:01,500 INFO spawned: 'vncserver' with pid 11
+"""
+
+VNC_LOG = """\
+Xvnc TigerVNC 1.12.0 - built Feb 28 2022 10:00:00
+Underlying X server release 12101003, The X.Org Foundation
+
+
+Sat Oct 17 10:00:02 2026
+ vncext:      VNC extension running!
+ vncext:      Listening for VNC connections on all interface(s), port 5901
+ vncext:      created VNC server for screen 0
+"""
+
+NOVNC_LOG = """\
+WebSocket server settings:
+  - Listen on :8080
+172.18.0.4 - - [17/Oct/2026 10:00:07] 172.18.0.4: Plain non-SSL (ws://) WebSocket connection
+172.18.0.4 - - [17/Oct/2026 10:00:07] connecting to: localhost:5901
+172.18.0.4 - - [17/Oct/2026 10:00:09] connecting to: localhost:5901
+"""
+
+
+class FakeDocker:
+    """docker exec cat of the files in one directory per container."""
+
+    def __init__(self, logs):
+        self.logs = logs
+
+    def run(self, *args, env=None):
+        _, container, _, path = args
+        try:
+            return self.logs[container][Path(path).name]
+        except KeyError:
+            raise provision_users.DockerError(f"cat: {path}: No such file or directory")
+
+
+class TestBootProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.logs = {"session_timeline.jsonl": TIMELINE, "supervisord.log": SUPERVISORD_LOG,
+                     "vncserver.stderr.log": VNC_LOG, "novnc.stdout.log": NOVNC_LOG}
+        self.container = self.dir / "tikzit_alice"
+        self.container.mkdir()
+        for name, text in self.logs.items():
+            (self.container / name).write_text(text)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_log_parsers(self):
+        self.assertEqual(boot_profile.parse_supervisord_log(SUPERVISORD_LOG)[:3], [
+            (T0 + 1.1, "vncserver_spawned"), (T0 + 1.15, "novnc_spawned"), (T0 + 2.2, "vncserver_running")])
+        self.assertEqual(boot_profile.parse_vnc_log(VNC_LOG), [(T0 + 2, "vnc_listening")])
+        self.assertEqual(boot_profile.parse_websockify_log(NOVNC_LOG)[0], (T0 + 7, "first_viewer"))
+        self.assertEqual(len(boot_profile.parse_timeline(TIMELINE)), 8)
+
+    def test_events_are_assigned_to_their_boot(self):
+        first, second = boot_profile.load_boots(self.container)
+        self.assertEqual((first["container"], first["boot"], first["start"]), ("tikzit_alice", "abc-1", T0 + 0.2))
+        self.assertEqual(first["events"], {
+            "entrypoint": 0.0, "vnc_password": 0.3, "supervisord": 0.7, "vncserver_spawned": 0.9,
+            "novnc_spawned": 0.95, "vnc_listening": 1.8, "vncserver_running": 2.0, "x11": 2.2,
+            "launch": 3.0, "first_viewer": 6.8})
+        self.assertEqual(second["events"], {"entrypoint": 0.0, "vncserver_spawned": 1.5, "supervisord": 1.0,
+                                            "launch": 5.0})
+
+    def test_report_and_baseline(self):
+        shutil.copytree(self.container, self.dir / "tikzit_bob")
+        stats_file = self.dir / "stats.json"
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(boot_profile.main(["report", str(self.dir), "--json", str(stats_file)]), 0)
+        self.assertIn("4 boots", out.getvalue())
+        stats = json.loads(stats_file.read_text())
+        self.assertEqual(stats["launch"], {"boots": 4, "p50": 4.0, "p90": 5.0, "p99": 5.0, "max": 5.0})
+        self.assertEqual(stats["first_viewer"]["boots"], 2)
+        lines = out.getvalue().splitlines()
+        self.assertLess(lines.index(next(l for l in lines if l.startswith("x11"))),
+                        lines.index(next(l for l in lines if l.startswith("launch"))))
+
+        baseline = {"launch": {"p50": 2.0}, "x11": {"p50": 2.0}, "gone": {"p50": 1.0}}
+        self.assertEqual(boot_profile.find_regressions(stats, baseline, 1.5, 0.5),
+                         ["launch: p50 4.00s vs baseline 2.00s"])
+        stats_file.write_text(json.dumps(baseline))
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(boot_profile.main(["report", str(self.container), "--baseline", str(stats_file)]), 1)
+            self.assertEqual(boot_profile.main(["report", str(self.container), "--baseline", str(stats_file),
+                                                "--factor", "3"]), 0)
+        self.assertIn("REGRESSION launch", out.getvalue())
+
+    def test_collect(self):
+        docker = FakeDocker({"tikzit_bob": self.logs, "tikzit_carol": {}})
+        output = self.dir / "collected"
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(boot_profile.main(["collect", "tikzit_bob", "tikzit_carol", "-o", str(output)], docker), 1)
+            self.assertEqual(boot_profile.main(["timeline", str(output / "tikzit_bob")]), 0)
+        self.assertIn("tikzit_bob: 4 log files", out.getvalue())
+        self.assertIn("tikzit_bob boot abc-1 at 2026-10-17 10:00:00Z", out.getvalue())
+        self.assertEqual(sorted(p.name for p in (output / "tikzit_bob").iterdir()), sorted(self.logs))
+        self.assertFalse((output / "tikzit_carol").exists())
+
+    @unittest.skipUnless(shutil.which("bash"), "bash is not installed")
+    def test_entrypoint_marks_parse(self):
+        entrypoint = (ROOT / "entrypoint.sh").read_text()
+        block = entrypoint[entrypoint.index("TIMELINE="):entrypoint.index("mark entrypoint")]
+        script = block.replace("/var/log", str(self.dir)) + "mark entrypoint\nmark supervisord\n"
+        subprocess.run(["bash", "-euc", script], check=True)
+        entries = boot_profile.parse_timeline((self.dir / "session_timeline.jsonl").read_text())
+        self.assertEqual([e["event"] for e in entries], ["entrypoint", "supervisord"])
+        self.assertEqual(entries[0]["boot"], (self.dir / "session_boot").read_text().strip())
+        self.assertGreaterEqual(entries[1]["at"], entries[0]["at"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,610 @@
+"""
+Unit tests for scripts/gh.py and the gh-* release scripts.
+Runs the helpers against a local stand-in for the GitHub API.
+"""
+
+import unittest
+import unittest.mock
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+os.environ.setdefault('GITHUB_TOKEN', 'test-token')
+
+import gh  # noqa: E402
+
+
+def load_script(name):
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), ROOT / "scripts" / (name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _record(self, body=b''):
+        self.server.requests.append({
+            'method': self.command,
+            'path': self.path,
+            'headers': dict(self.headers),
+            'body': body,
+        })
+
+    def do_GET(self):
+        self._record()
+        if self.server.limited:
+            self._send(*self.server.limited.pop(0))
+            return
+        if self.server.delay:
+            self.server.delay.wait(5)
+        route = self.server.routes.get(self.path)
+        if route is None:
+            self._send(404, b'{"message": "Not Found"}')
+            return
+        etag = route[2].get('ETag') if len(route) > 2 else None
+        ranged = self.headers.get('Range', '').startswith('bytes=')
+        if etag and self.headers.get('If-None-Match') == etag:
+            self._send(304, b'', {'ETag': etag})
+        elif ranged and route[0] == 200:
+            start = int(self.headers['Range'][len('bytes='):].rstrip('-'))
+            if start >= len(route[1]):
+                self._send(416)
+            else:
+                self._send(206, route[1][start:])
+        else:
+            self._send(*route)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        self._record(body)
+        if self.server.fail_posts > 0:
+            self.server.fail_posts -= 1
+            self._send(502, b'{"message": "Bad Gateway"}')
+        else:
+            self._send(201, json.dumps({'size': len(body)}).encode())
+
+    def do_DELETE(self):
+        self._record()
+        self._send(204)
+
+
+def start_server(routes=None):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads = True
+    server.routes = routes or {}
+    server.requests = []
+    server.connections = 0
+    server.fail_posts = 0
+    server.limited = []
+    server.delay = None
+    threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+    return server
+
+
+class GhTestCase(unittest.TestCase):
+
+    routes = {}
+
+    def setUp(self):
+        self.server = start_server(dict(self.routes))
+        self.base = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self._api_url = gh.api_url
+        gh.api_url = self.base + '/repos/o/r'
+        gh.client = gh.Client()
+        gh.scheduler = gh.Scheduler()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self._cache = gh.response_cache
+        gh.response_cache = gh.ResponseCache(self.cache_dir.name)
+        for k in gh.stats:
+            gh.stats[k] = 0
+
+    def tearDown(self):
+        gh.client.close()
+        gh.response_cache = self._cache
+        self.cache_dir.cleanup()
+        gh.api_url = self._api_url
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestGhClient(GhTestCase):
+
+    releases = [{'name': 'v1.0', 'draft': False}, {'name': 'v1.1', 'draft': True}]
+    routes = {'/repos/o/r/releases': (200, json.dumps(releases).encode())}
+
+    def test_gh_parses_json(self):
+        self.assertEqual(gh.gh('releases'), self.releases)
+
+    def test_gh_sends_token(self):
+        gh.gh('releases')
+        self.assertEqual(self.server.requests[0]['headers']['Authorization'], 'token test-token')
+
+    def test_gh_without_auth(self):
+        gh.gh('releases', auth=False)
+        self.assertNotIn('Authorization', self.server.requests[0]['headers'])
+
+    def test_gh_reuses_connection(self):
+        for _ in range(5):
+            gh.gh('releases')
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(gh.stats['requests'], 5)
+        self.assertEqual(gh.stats['connections'], 1)
+        self.assertEqual(gh.stats['reused'], 4)
+        self.assertGreater(gh.stats['seconds'], 0)
+
+    def test_gh_unparsed_returns_bytes(self):
+        self.assertEqual(gh.gh('releases', parse=False), json.dumps(self.releases).encode())
+
+    def test_gh_empty_response_parses_as_object(self):
+        self.assertEqual(gh.gh('releases/assets/1', ['-X', 'DELETE']), {})
+        self.assertEqual(self.server.requests[0]['method'], 'DELETE')
+
+    def test_gh_uploads_file_body(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(b'\x00\x01binary\xff' * 100)
+        try:
+            resp = gh.gh(self.base + '/upload?name=a.zip', [
+                '-H', 'Content-type: application/octet-stream',
+                '--data-binary', '@' + f.name])
+        finally:
+            os.unlink(f.name)
+        req = self.server.requests[0]
+        self.assertEqual(req['method'], 'POST')
+        self.assertEqual(req['body'], b'\x00\x01binary\xff' * 100)
+        self.assertEqual(req['headers']['Content-type'], 'application/octet-stream')
+        self.assertEqual(resp, {'size': 900})
+
+    def test_gh_rejects_unknown_curl_option(self):
+        with self.assertRaises(ValueError):
+            gh.gh('releases', ['--compressed'])
+
+
+class TestGhCache(GhTestCase):
+
+    json_headers = {'Content-Type': 'application/json', 'ETag': '"v1"'}
+    routes = {
+        '/repos/o/r/releases': (200, b'[{"name": "v1.0"}]', json_headers),
+        '/repos/o/r/blob': (200, b'raw', {'Content-Type': 'application/octet-stream', 'ETag': '"b"'}),
+    }
+
+    def test_gh_revalidates_with_etag(self):
+        first = gh.gh('releases')
+        second = gh.gh('releases')
+        self.assertEqual(first, second)
+        self.assertNotIn('If-None-Match', self.server.requests[0]['headers'])
+        self.assertEqual(self.server.requests[1]['headers']['If-None-Match'], '"v1"')
+        self.assertEqual(gh.stats['cached'], 1)
+
+    def test_gh_refreshes_changed_resource(self):
+        gh.gh('releases')
+        self.server.routes['/repos/o/r/releases'] = (
+            200, b'[{"name": "v1.1"}]', dict(self.json_headers, ETag='"v2"'))
+        self.assertEqual(gh.gh('releases'), [{'name': 'v1.1'}])
+        self.assertEqual(gh.gh('releases'), [{'name': 'v1.1'}])
+        self.assertEqual(gh.stats['cached'], 1)
+
+    def test_gh_cache_bypass(self):
+        gh.gh('releases')
+        gh.gh('releases', cache=False)
+        self.assertNotIn('If-None-Match', self.server.requests[1]['headers'])
+        self.assertEqual(gh.stats['cached'], 0)
+
+    def test_gh_writes_bypass_cache(self):
+        gh.gh('releases/assets/1', ['-X', 'DELETE'])
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+    def test_gh_only_caches_json(self):
+        gh.gh('blob', parse=False)
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+    def test_cache_evicts_by_age(self):
+        gh.gh('releases')
+        gh.response_cache.max_age = -1
+        gh.response_cache.evict()
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+    def test_cache_evicts_least_recently_used_by_size(self):
+        rc = gh.response_cache
+        rc.max_bytes = 10
+        resp = gh.Client().request('GET', self.base + '/repos/o/r/releases')
+        resp.read()
+        rc.store('old', 'u1', resp, b'x' * 8)
+        os.utime(rc.files('old')[0], (0, 0))
+        rc.store('new', 'u2', resp, b'y' * 8)
+        self.assertIsNone(rc.lookup('old'))
+        self.assertIsNotNone(rc.lookup('new'))
+
+    def test_cache_scans_only_past_the_size_limit(self):
+        rc = gh.response_cache
+        rc.max_bytes = 20
+        resp = gh.Client().request('GET', self.base + '/repos/o/r/releases')
+        resp.read()
+        with unittest.mock.patch.object(gh.os, 'listdir', wraps=os.listdir) as listdir:
+            for key in ('a', 'b', 'a'):
+                rc.store(key, 'u', resp, b'x' * 8)
+            self.assertEqual((listdir.call_count, rc.total), (1, 16))
+            rc.store('c', 'u', resp, b'x' * 8)
+            self.assertEqual(listdir.call_count, 2)
+        self.assertLessEqual(rc.total, 20)
+
+    def test_cache_is_keyed_by_token(self):
+        url = self.base + '/repos/o/r/releases'
+        self.assertNotEqual(gh.response_cache.key(url, {'Authorization': 'token a'}),
+                            gh.response_cache.key(url, {'Authorization': 'token b'}))
+        self.assertNotEqual(gh.response_cache.key(url, {'Authorization': 'token a'}),
+                            gh.response_cache.key(url, {}))
+
+
+class TestGhPagination(GhTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pages = [[{'name': 'v%d.%d' % (p, i), 'draft': p == 0 and i == 1} for i in range(3)]
+                 for p in range(3)]
+        for n, page in enumerate(pages):
+            path = '/repos/o/r/releases' + ('?page=%d' % n if n else '')
+            headers = {'Content-Type': 'application/json'}
+            if n + 1 < len(pages):
+                headers['Link'] = '<%s/repos/o/r/releases?page=%d>; rel="next", <%s>; rel="last"' % (
+                    self.base, n + 1, self.base + '/repos/o/r/releases?page=2')
+            self.server.routes[path] = (200, json.dumps(page).encode(), headers)
+
+    def fetched(self):
+        return [r['path'] for r in self.server.requests]
+
+    def test_gh_iter_follows_next_links(self):
+        names = [r['name'] for r in gh.gh_iter('releases')]
+        self.assertEqual(len(names), 9)
+        self.assertEqual(names[0], 'v0.0')
+        self.assertEqual(names[-1], 'v2.2')
+
+    def test_gh_find_stops_early(self):
+        self.assertEqual(gh.get_draft()['name'], 'v0.1')
+        self.assertNotIn('/repos/o/r/releases?page=2', self.fetched())
+
+    def test_get_release_on_later_page(self):
+        self.assertEqual(gh.get_release('v2.1')['name'], 'v2.1')
+        self.assertIsNone(gh.get_release('v9'))
+
+    def test_gh_iter_per_page(self):
+        self.server.routes['/repos/o/r/releases?per_page=100'] = (200, b'[]')
+        self.assertEqual(list(gh.gh_iter('releases', per_page=100)), [])
+
+    def test_gh_iter_raises_on_error(self):
+        with self.assertRaises(IOError):
+            list(gh.gh_iter('missing'))
+
+    def test_next_link(self):
+        self.assertEqual(gh.next_link('<https://x/?page=2>; rel="next", <https://x/?page=5>; rel="last"'),
+                         'https://x/?page=2')
+        self.assertIsNone(gh.next_link('<https://x/?page=1>; rel="prev"'))
+        self.assertIsNone(gh.next_link(None))
+
+
+class TestGhScheduler(GhTestCase):
+
+    routes = {'/repos/o/r/releases': (200, b'[]')}
+
+    def setUp(self):
+        super().setUp()
+        self.sleeps = []
+        self.now = float(int(gh.time.time()))
+        for name, fake in (('sleep', self.sleep), ('time', lambda: self.now)):
+            patcher = unittest.mock.patch.object(gh.time, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def budget(self, remaining, reset_in):
+        return {'X-RateLimit-Remaining': str(remaining),
+                'X-RateLimit-Reset': str(int(gh.time.time() + reset_in))}
+
+    def test_scheduler_tracks_rate_limit_headers(self):
+        self.server.routes['/repos/o/r/releases'] = (200, b'[]', self.budget(4000, 3600))
+        gh.gh('releases')
+        self.assertEqual(gh.scheduler.remaining, 4000)
+        gh.gh('releases')
+        self.assertEqual(self.sleeps, [])
+
+    def test_scheduler_waits_for_reset_when_budget_spent(self):
+        self.server.routes['/repos/o/r/releases'] = (200, b'[]', self.budget(0, 30))
+        gh.gh('releases')
+        gh.gh('releases')
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertEqual(self.sleeps, [31])
+        self.assertEqual(gh.stats['delayed'], 1)
+
+    def test_scheduler_paces_low_budget(self):
+        self.server.routes['/repos/o/r/releases'] = (200, b'[]', self.budget(10, 100))
+        gh.gh('releases')
+        for _ in range(3):
+            gh.scheduler.wait()
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertAlmostEqual(self.sleeps[0], 10, delta=0.5)
+        self.assertAlmostEqual(self.sleeps[1], 100 / 9, delta=0.5)
+
+    def test_scheduler_refuses_long_waits(self):
+        self.server.routes['/repos/o/r/releases'] = (200, b'[]', self.budget(0, 7200))
+        gh.gh('releases')
+        with self.assertRaises(IOError):
+            gh.gh('releases')
+
+    def test_retry_after_secondary_limit(self):
+        self.server.limited = [(429, b'{}', {'Retry-After': '3'})]
+        self.assertEqual(gh.gh('releases'), [])
+        self.assertEqual(self.sleeps, [3.0])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_retry_after_http_date(self):
+        date = gh.email.utils.formatdate(self.now + 5, usegmt=True)
+        self.server.limited = [(429, b'{}', {'Retry-After': date})]
+        self.assertEqual(gh.gh('releases'), [])
+        self.assertEqual(self.sleeps, [5.0])
+        self.assertEqual(gh.retry_after('Wed, 21 Oct 2015 07:28:00 -0000'), 0)
+        self.assertIsNone(gh.retry_after('soon'))
+
+    def test_retry_after_primary_limit(self):
+        self.server.limited = [(403, b'{}', self.budget(0, 10))]
+        self.assertEqual(gh.gh('releases'), [])
+        self.assertEqual(self.sleeps, [11])
+        self.assertEqual(gh.stats['delayed'], 1)
+
+    def test_identical_gets_are_coalesced(self):
+        self.server.delay = threading.Event()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(gh.gh('releases'))) for _ in range(4)]
+        for t in threads:
+            t.start()
+        deadline = gh.time.monotonic() + 5
+        while gh.stats['coalesced'] < 3 and gh.time.monotonic() < deadline:
+            threading.Event().wait(0.001)
+        self.server.delay.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [[]] * 4)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class TestGhRedirects(GhTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = start_server({'/blob': (200, b'asset-bytes')})
+        self.server.routes['/repos/o/r/releases/assets/7'] = (
+            302, b'', {'Location': 'http://localhost:%d/blob' % self.other.server_address[1]})
+
+    def tearDown(self):
+        self.other.shutdown()
+        self.other.server_close()
+        super().tearDown()
+
+    def test_gh_follows_redirect_with_l(self):
+        data = gh.gh('releases/assets/7', ['-L', '-H', 'Accept: application/octet-stream'],
+                     parse=False)
+        self.assertEqual(data, b'asset-bytes')
+
+    def test_gh_drops_token_on_cross_host_redirect(self):
+        gh.gh('releases/assets/7', ['-L'], parse=False)
+        self.assertIn('Authorization', self.server.requests[0]['headers'])
+        self.assertNotIn('Authorization', self.other.requests[0]['headers'])
+
+    def test_gh_does_not_follow_without_l(self):
+        self.assertEqual(gh.gh('releases/assets/7', parse=False), b'')
+        self.assertEqual(self.other.requests, [])
+
+
+class TestGhPush(GhTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.push = load_script('gh-push')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.files = []
+        for i, name in enumerate(['a.zip', 'b.tar.gz', 'c.dmg']):
+            path = os.path.join(self.tmp.name, name)
+            with open(path, 'wb') as f:
+                f.write(bytes([i]) * (1000 + i))
+            self.files.append(path)
+        self.assets = [
+            {'id': 11, 'name': 'a.zip', 'state': 'uploaded', 'size': 1000},
+            {'id': 12, 'name': 'b.tar.gz', 'state': 'starter', 'size': 0},
+        ]
+        self.setUp_routes()
+
+    def setUp_routes(self):
+        draft = {'id': 1, 'name': 'v2.0', 'draft': True, 'assets': self.assets,
+                 'upload_url': self.base + '/upload{?name,label}'}
+        self.server.routes['/repos/o/r/releases'] = (200, json.dumps([draft]).encode())
+        self.server.routes['/repos/o/r/releases/1/assets'] = (200, json.dumps(self.assets).encode())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        super().tearDown()
+
+    def run_push(self, *args):
+        out = io.StringIO()
+        with unittest.mock.patch('sys.stdout', out), unittest.mock.patch('time.sleep'):
+            code = self.push.main(list(args))
+        return code, out.getvalue()
+
+    def uploads(self):
+        return sorted((r['path'], len(r['body'])) for r in self.server.requests
+                      if r['method'] == 'POST' and 'SHA256SUMS' not in r['path'])
+
+    def manifest(self):
+        bodies = [r['body'] for r in self.server.requests if r['path'] == '/upload?name=SHA256SUMS']
+        return gh.parse_sums(bodies[-1].decode()) if bodies else None
+
+    def publish_sums(self, sums):
+        self.assets.append({'id': 13, 'name': 'SHA256SUMS', 'state': 'uploaded', 'size': len(sums)})
+        self.server.routes['/repos/o/r/releases/assets/13'] = (200, sums.encode())
+        self.setUp_routes()
+
+    def deletes(self):
+        return sorted(r['path'] for r in self.server.requests if r['method'] == 'DELETE')
+
+    def test_push_uploads_all_files(self):
+        code, out = self.run_push('-j', '3', *self.files)
+        self.assertEqual(code, 0)
+        self.assertEqual(self.uploads(), [('/upload?name=a.zip', 1000),
+                                          ('/upload?name=b.tar.gz', 1001),
+                                          ('/upload?name=c.dmg', 1002)])
+        self.assertEqual(self.deletes(), ['/repos/o/r/releases/assets/11',
+                                          '/repos/o/r/releases/assets/12'])
+        self.assertIn('MB/s', out)
+
+    def test_push_resume_skips_finished_assets(self):
+        code, out = self.run_push('--resume', *self.files)
+        self.assertEqual(code, 0)
+        self.assertEqual([p for p, _ in self.uploads()], ['/upload?name=b.tar.gz', '/upload?name=c.dmg'])
+        self.assertIn('already uploaded', out)
+
+    def test_push_retries_failed_upload(self):
+        self.server.fail_posts = 2
+        code, out = self.run_push(self.files[2])
+        self.assertEqual(code, 0)
+        self.assertEqual(len(self.uploads()), 3)
+        self.assertEqual(out.count('retrying'), 2)
+
+    def test_push_writes_digest_manifest(self):
+        self.run_push(*self.files)
+        self.assertEqual(self.manifest(), dict((os.path.basename(f), gh.sha256sum(f)) for f in self.files))
+
+    def test_push_skips_unchanged_assets(self):
+        self.publish_sums('%s  a.zip\n' % gh.sha256sum(self.files[0]))
+        code, out = self.run_push(*self.files)
+        self.assertEqual(code, 0)
+        self.assertNotIn('/upload?name=a.zip', [p for p, _ in self.uploads()])
+        self.assertNotIn('/repos/o/r/releases/assets/11', self.deletes())
+        self.assertIn('saved 0.0 MB', out)
+
+    def test_push_uses_github_asset_digest(self):
+        self.assets[0]['digest'] = 'sha256:' + gh.sha256sum(self.files[0])
+        self.setUp_routes()
+        self.run_push(self.files[0])
+        self.assertEqual(self.uploads(), [])
+
+    def test_push_uploads_changed_assets(self):
+        self.publish_sums('%s  a.zip\n' % ('0' * 64))
+        self.run_push(self.files[0])
+        self.assertEqual(self.uploads(), [('/upload?name=a.zip', 1000)])
+        self.assertEqual(self.manifest(), {'a.zip': gh.sha256sum(self.files[0])})
+
+    def test_push_no_dedup(self):
+        self.publish_sums('%s  a.zip\n' % gh.sha256sum(self.files[0]))
+        self.run_push('--no-dedup', self.files[0])
+        self.assertEqual(self.uploads(), [('/upload?name=a.zip', 1000)])
+
+    def test_push_reports_exhausted_retries(self):
+        self.server.fail_posts = 10
+        code, out = self.run_push('--retries', '1', self.files[2])
+        self.assertEqual(code, 1)
+        self.assertIn('FAILED', out)
+
+
+class TestGhGet(GhTestCase):
+
+    blobs = {'a.zip': b'\x00zip\xff' * 5000, 'b.tar.gz': b'tgz' * 3000}
+
+    def setUp(self):
+        super().setUp()
+        self.get = load_script('gh-get')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sums = ''.join('%s  %s\n' % (hashlib.sha256(b).hexdigest(), n) for n, b in self.blobs.items())
+        self.publish(self.sums.encode())
+
+    def publish(self, sums):
+        files = dict(self.blobs, SHA256SUMS=sums)
+        assets = []
+        for i, (name, data) in enumerate(sorted(files.items())):
+            assets.append({'id': i, 'name': name, 'size': len(data)})
+            self.server.routes['/repos/o/r/releases/assets/%d' % i] = (
+                302, b'', {'Location': self.base + '/blobs/' + name})
+            self.server.routes['/blobs/' + name] = (200, data)
+        draft = {'id': 1, 'name': 'v2.0', 'draft': True, 'assets': assets}
+        self.server.routes['/repos/o/r/releases'] = (200, json.dumps([draft]).encode())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        super().tearDown()
+
+    def run_get(self, *args):
+        out = io.StringIO()
+        with unittest.mock.patch('sys.stdout', out), unittest.mock.patch('time.sleep'):
+            code = self.get.main(['-o', self.tmp.name] + list(args))
+        return code, out.getvalue()
+
+    def read(self, name):
+        with open(os.path.join(self.tmp.name, name), 'rb') as f:
+            return f.read()
+
+    def test_get_downloads_binary_assets(self):
+        code, out = self.run_get()
+        self.assertEqual(code, 0)
+        for name, data in self.blobs.items():
+            self.assertEqual(self.read(name), data)
+        self.assertFalse([n for n in os.listdir(self.tmp.name) if n.endswith('.part')])
+
+    def test_get_filter(self):
+        self.run_get('zip')
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['a.zip'])
+
+    def test_get_resumes_partial_download(self):
+        data = self.blobs['a.zip']
+        with open(os.path.join(self.tmp.name, 'a.zip.part'), 'wb') as f:
+            f.write(data[:10000])
+        code, _ = self.run_get('a.zip')
+        self.assertEqual(code, 0)
+        self.assertEqual(self.read('a.zip'), data)
+        ranges = [r['headers'].get('Range') for r in self.server.requests if r['path'] == '/blobs/a.zip']
+        self.assertEqual(ranges, ['bytes=10000-'])
+
+    def test_get_rejects_checksum_mismatch(self):
+        self.publish(self.sums.replace(hashlib.sha256(self.blobs['a.zip']).hexdigest(), '0' * 64).encode())
+        code, out = self.run_get('a.zip')
+        self.assertEqual(code, 1)
+        self.assertIn('SHA-256 mismatch', out)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, 'a.zip')))
+
+    def test_get_skips_verified_files(self):
+        self.run_get('b.tar.gz')
+        code, out = self.run_get('b.tar.gz')
+        self.assertEqual(code, 0)
+        self.assertIn('up to date', out)
+
+    def test_parse_sums(self):
+        self.assertEqual(gh.parse_sums('ABC  a.zip\ndef *b.bin\n\n'), {'a.zip': 'abc', 'b.bin': 'def'})
+
+
+if __name__ == '__main__':
+    unittest.main()
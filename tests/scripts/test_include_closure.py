@@ -0,0 +1,139 @@
+"""
+Unit tests for scripts/include_closure.py.
+"""
+
+import unittest
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import include_closure  # noqa: E402
+import package_sdk  # noqa: E402
+
+
+class IncludeTreeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.src = self.root / "src"
+        self.write("src/api.h", '#pragma once\n#include <QtGlobal>\n')
+        self.write("src/data/base.h", '#include "../api.h"\n')
+        self.write("src/data/node.h", '#include "base.h"\n  #  include "api.h"\n// #include <QObject>\n')
+        self.write("src/gui/item.h", '#include "node.h"\n')
+        self.write("src/gui/unused.h", '#include "api.h"\n')
+        self.dirs = [self.root, self.src, self.src / "gui", self.src / "data"]
+        self.index_path = self.root / "cache" / "index.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+        return path
+
+    def graph(self, roots, index=None, **kw):
+        if index is None:
+            index = include_closure.IncludeIndex(None)
+        return include_closure.include_graph([self.root / r for r in roots], index, self.dirs, **kw)
+
+
+class TestIncludeGraph(IncludeTreeTestCase):
+
+    def test_closure_follows_include_path(self):
+        graph = self.graph(["src/gui/item.h"])
+        self.assertEqual(sorted(p.relative_to(self.root).as_posix() for p in graph),
+                         ["src/api.h", "src/data/base.h", "src/data/node.h", "src/gui/item.h"])
+        self.assertEqual(graph[self.src / "data" / "node.h"], [self.src / "data" / "base.h", self.src / "api.h"])
+        self.assertEqual(graph[self.src / "api.h"], [])
+
+    def test_unresolved_include_names_the_includer(self):
+        self.write("src/gui/item.h", '#include "ui_item.h"\n')
+        with self.assertRaises(FileNotFoundError) as ctx:
+            self.graph(["src/gui/item.h"])
+        self.assertIn("item.h", str(ctx.exception))
+        self.assertIn('"ui_item.h"', str(ctx.exception))
+
+    def test_unresolved_includes_can_be_collected(self):
+        self.write("src/gui/item.h", '#include "ui_item.h"\n#include "node.h"\n')
+        missing = {}
+        graph = self.graph(["src/gui/item.h"], missing=missing)
+        self.assertEqual(missing, {self.src / "gui" / "item.h": ["ui_item.h"]})
+        self.assertIn(self.src / "data" / "base.h", graph)
+
+    def test_missing_root(self):
+        with self.assertRaises(FileNotFoundError):
+            self.graph(["src/gone.h"])
+
+    def test_cycles_terminate(self):
+        self.write("src/api.h", '#include "data/node.h"\n')
+        self.assertEqual(len(self.graph(["src/api.h"])), 3)
+
+    def test_dump_formats(self):
+        graph = self.graph(["src/data/base.h"])
+        dumped = json.loads(include_closure.format_graph(graph, "json"))
+        self.assertEqual(len(dumped), 2)
+        dot = include_closure.format_graph(graph, "dot")
+        self.assertTrue(dot.startswith("digraph includes {"))
+        self.assertIn("base.h\" -> \"", dot)
+
+
+class TestIncludeIndex(IncludeTreeTestCase):
+
+    def scan(self):
+        index = include_closure.IncludeIndex(self.index_path)
+        self.graph(["src/gui/item.h"], index)
+        index.save()
+        return index.scanned, index.reused
+
+    def test_rescan_only_reads_changed_headers(self):
+        self.assertEqual(self.scan(), (4, 0))
+        self.assertEqual(self.scan(), (0, 4))
+        self.write("src/data/base.h", '#include "../api.h"\n#include "extra.h"\n')
+        self.write("src/extra.h", "")
+        self.assertEqual(self.scan(), (2, 3))
+
+    def test_touched_header_is_not_reparsed(self):
+        self.scan()
+        base = self.src / "data" / "base.h"
+        st = base.stat()
+        os.utime(base, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertEqual(self.scan(), (0, 4))
+
+    def test_corrupt_or_old_index_is_ignored(self):
+        self.index_path.parent.mkdir()
+        self.index_path.write_text("{not json")
+        self.assertEqual(self.scan(), (4, 0))
+        self.index_path.write_text(json.dumps({"version": 0, "files": {}}))
+        self.assertEqual(self.scan(), (4, 0))
+
+    def test_deleted_files_are_pruned(self):
+        index = include_closure.IncludeIndex(self.index_path)
+        self.graph(["src/gui/item.h", "src/gui/unused.h"], index)
+        index.save()
+        (self.src / "gui" / "unused.h").unlink()
+        self.scan()
+        files = json.loads(self.index_path.read_text())["files"]
+        self.assertNotIn((self.src / "gui" / "unused.h").as_posix(), files)
+
+
+class TestPluginHeaders(unittest.TestCase):
+
+    def test_sdk_headers_are_closed_under_include(self):
+        headers = include_closure.include_closure(package_sdk.PLUGIN_HEADER_FILES)
+        for root in package_sdk.PLUGIN_HEADER_FILES:
+            self.assertIn(root, headers)
+        # node.h pulls these in without them being listed
+        self.assertIn(ROOT.resolve() / "src" / "data" / "graphelementproperty.h", headers)
+        self.assertIn(ROOT.resolve() / "src" / "mgb_api.h", headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Unit tests for scripts/junit_history.py.
+"""
+
+import unittest
+import contextlib
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import junit_history  # noqa: E402
+
+CLASS = "tests.deployment.test_config_files.TestNginxConfig"
+
+
+def report(timestamp, cases):
+    body = "".join(
+        f'<testcase classname="{CLASS}" name="{name}" time="{seconds}">{extra}</testcase>'
+        for name, seconds, extra in cases)
+    return (f'<?xml version="1.0" encoding="utf-8"?><testsuites name="pytest tests">'
+            f'<testsuite name="pytest" errors="0" failures="0" skipped="0" tests="{len(cases)}" time="1.0" '
+            f'timestamp="{timestamp}" hostname="ci">{body}</testsuite></testsuites>')
+
+
+class TestJunitHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.db_path = self.dir / "history.sqlite"
+        self.db = junit_history.connect(self.db_path)
+        self.runs = 0
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def ingest(self, cases, commit="abc123"):
+        self.runs += 1
+        path = self.dir / f"results-{self.runs}.xml"
+        path.write_text(report(f"2026-01-01T00:00:{self.runs:02d}", cases))
+        return junit_history.ingest(self.db, path, commit)
+
+    def test_checked_in_report(self):
+        run_id = junit_history.ingest(self.db, ROOT / "tests" / "deployment" / "fixtures" / "test-results.xml", "deadbee")
+        self.assertEqual(run_id, 1)
+        self.assertIsNone(junit_history.ingest(self.db, ROOT / "tests" / "deployment" / "fixtures" / "test-results.xml", "deadbee"))
+        tests, commit = self.db.execute("SELECT tests, commit_hash FROM runs").fetchone()
+        self.assertEqual((tests, commit), (111, "deadbee"))
+        self.assertEqual(self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0], 111)
+
+    def test_outcomes(self):
+        run_id = self.ingest([("test_a", 0.1, ""), ("test_b", 0.2, '<failure message="x">tb</failure>'),
+                              ("test_c", 0.0, '<skipped message="no docker" />')])
+        outcomes = dict(self.db.execute("SELECT name, outcome FROM results WHERE run_id = ?", (run_id,)))
+        self.assertEqual(outcomes, {"test_a": "passed", "test_b": "failure", "test_c": "skipped"})
+        self.assertEqual(self.db.execute("SELECT failures, skipped FROM runs").fetchone(), (1, 1))
+
+    def test_rolling_window(self):
+        for seconds in (9.0, 1.0, 2.0, 3.0):
+            self.ingest([("test_a", seconds, "")])
+        self.assertEqual(junit_history.history(self.db, None, 3), {(CLASS, "test_a"): [1.0, 2.0, 3.0]})
+        self.assertEqual(junit_history.history(self.db, 3, 3), {(CLASS, "test_a"): [9.0, 1.0]})
+        row, = junit_history.stats(self.db, 3, [50])
+        self.assertEqual((row["runs"], row["percentiles"][50]), (3, 2.0))
+
+    def test_regression_detection(self):
+        for seconds in (0.10, 0.11, 0.12, 0.10, 0.11):
+            self.ingest([("test_a", seconds, ""), ("test_b", 0.01, ""), ("test_c", 0.2, "")])
+        run_id = self.ingest([("test_a", 0.30, ""), ("test_b", 0.04, ""),
+                              ("test_c", 0.9, '<failure message="x">tb</failure>'), ("test_new", 5.0, "")])
+        regressions = junit_history.find_regressions(self.db, run_id, window=20, q=90, factor=2.0,
+                                                     min_runs=5, min_seconds=0.05)
+        # test_b is 4x slower but only by 30ms; failures and new tests are not judged on time
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith(f"{CLASS}.test_a: 0.300s vs p90 0.116s over 5 runs"))
+        self.assertEqual(junit_history.find_regressions(self.db, run_id, 20, 90, 3.0, 5, 0.05), [])
+        self.assertEqual(junit_history.find_regressions(self.db, run_id, 20, 90, 2.0, 6, 0.05), [])
+
+    def test_cli_gate(self):
+        for seconds in (0.1, 0.1, 0.1):
+            self.ingest([("test_a", seconds, "")])
+        self.ingest([("test_a", 1.0, "")])
+        self.db.close()
+        db = ["--db", str(self.db_path)]
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(junit_history.main(db + ["check", "--min-runs", "3"]), 1)
+            self.assertEqual(junit_history.main(db + ["check", "--min-runs", "4"]), 0)
+            self.assertEqual(junit_history.main(db + ["stats"]), 0)
+        self.assertIn("REGRESSION", out.getvalue())
+        self.assertIn(f"{CLASS}.test_a", out.getvalue().splitlines()[-1])
+        self.db = junit_history.connect(self.db_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+Unit tests for scripts/nginx_routes.py and scripts/bench_nginx_routes.py.
+Docker is replaced by an in-memory stand-in.
+"""
+
+import unittest
+import contextlib
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import bench_nginx_routes  # noqa: E402
+import nginx_routes  # noqa: E402
+import provision_users  # noqa: E402
+
+
+class FakeDocker:
+
+    def __init__(self, fail_nginx_test=False):
+        self.fail_nginx_test = fail_nginx_test
+        self.calls = []
+
+    def run(self, *args, env=None):
+        self.calls.append(args)
+        if args[2:] == ("nginx", "-t") and self.fail_nginx_test:
+            raise provision_users.DockerError("docker exec: nginx: [emerg] invalid number of the map parameters")
+        return ""
+
+    def reloads(self):
+        return self.calls.count(("exec", "tikzit_proxy", "nginx", "-s", "reload"))
+
+
+class TestRoutingTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.config_dir = self.dir / "user_configs"
+        self.routes_path = self.config_dir / nginx_routes.ROUTES_FILE
+        self.registry = provision_users.UserRegistry(self.dir / "user_registry.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def register(self, *usernames):
+        for username in usernames:
+            self.registry.add(username)
+
+    def test_render_is_sorted_and_round_trips(self):
+        text = nginx_routes.render_routes(["bob", "alice", "bob"])
+        self.assertTrue(text.startswith("# Generated by scripts/nginx_routes.py"))
+        self.assertTrue(text.endswith("alice tikzit_alice;\nbob tikzit_bob;\n"))
+        self.assertEqual(nginx_routes.parse_routes(text), {"alice": "tikzit_alice", "bob": "tikzit_bob"})
+        self.assertEqual(nginx_routes.render_routes([]), nginx_routes.HEADER)
+
+    def test_unroutable_names_are_rejected(self):
+        for username in ("docs", "default", "Bob", "a/b", "x;"):
+            with self.assertRaises(ValueError):
+                nginx_routes.render_routes(["alice", username])
+        with self.assertRaises(ValueError):
+            nginx_routes.parse_routes("alice tikzit_alice\n")
+        with self.assertRaises(ValueError):
+            nginx_routes.parse_routes("alice tikzit_alice;\nalice tikzit_bob;\n")
+
+    def test_table_is_rewritten_only_when_it_changes(self):
+        docker = FakeDocker()
+        self.register("alice")
+        self.assertTrue(nginx_routes.update_routes(self.registry, self.config_dir, docker))
+        self.assertFalse(nginx_routes.update_routes(self.registry, self.config_dir, docker))
+        self.register("bob")
+        self.assertTrue(nginx_routes.update_routes(self.registry, self.config_dir, docker))
+        self.assertEqual(docker.reloads(), 2)
+        self.assertEqual(docker.calls.count(("exec", "tikzit_proxy", "nginx", "-t")), 2)
+        self.assertEqual(nginx_routes.parse_routes(self.routes_path.read_text()),
+                         {"alice": "tikzit_alice", "bob": "tikzit_bob"})
+        self.assertEqual([p.name for p in self.config_dir.iterdir()], [nginx_routes.ROUTES_FILE])
+
+    def test_rejected_table_is_rolled_back(self):
+        self.register("alice")
+        nginx_routes.update_routes(self.registry, self.config_dir)
+        before = self.routes_path.read_text()
+        legacy = self.config_dir / "bob.conf"
+        legacy.write_text(bench_nginx_routes.legacy_location("bob"))
+        self.register("bob")
+        docker = FakeDocker(fail_nginx_test=True)
+        with self.assertRaises(provision_users.DockerError):
+            nginx_routes.update_routes(self.registry, self.config_dir, docker)
+        self.assertEqual(self.routes_path.read_text(), before)
+        self.assertEqual(legacy.read_text(), bench_nginx_routes.legacy_location("bob"))
+        self.assertEqual(docker.reloads(), 0)
+
+    def test_legacy_location_files_are_migrated(self):
+        self.config_dir.mkdir()
+        for username in ("alice", "carol"):
+            (self.config_dir / f"{username}.conf").write_text(bench_nginx_routes.legacy_location(username))
+        (self.config_dir / "extra.conf").write_text("location /status { return 204; }\n")
+        self.register("alice")
+        self.assertTrue(nginx_routes.update_routes(self.registry, self.config_dir, FakeDocker()))
+        # carol is not registered, so her hand-made route keeps working
+        self.assertEqual(sorted(p.name for p in self.config_dir.iterdir()),
+                         ["alice.conf.migrated", "carol.conf", "extra.conf", nginx_routes.ROUTES_FILE])
+
+    def test_cli_adds_users(self):
+        argv = ["--registry", str(self.registry.path), "--config-dir", str(self.config_dir)]
+        docker = FakeDocker()
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(nginx_routes.main(argv + ["--add", "bob", "alice", "--reload"], docker), 0)
+            self.assertEqual(nginx_routes.main(argv + ["--add", "proxy"], docker), 1)
+            self.assertEqual(nginx_routes.main(argv, docker), 0)
+        self.assertIn("Updated", out.getvalue())
+        self.assertIn("Unchanged", out.getvalue())
+        self.assertEqual(sorted(json.loads(self.registry.path.read_text())["users"]), ["alice", "bob"])
+        self.assertEqual(docker.reloads(), 1)
+
+    def test_deployment_uses_the_table(self):
+        nginx = (ROOT / "nginx.conf").read_text()
+        self.assertIn("include /etc/nginx/conf.d/*.routes;", nginx)
+        self.assertIn("location @tikzit_user", nginx)
+        script = (ROOT / "multi_user_manager.sh").read_text()
+        self.assertIn('scripts/nginx_routes.py" --add "$USERNAME" --config-dir "$CONFIG_DIR" --reload', script)
+        self.assertNotIn("<<EOF", script)
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_layouts_route_alike(self):
+        results = bench_nginx_routes.run_benchmarks([3, 40], repeat=1, nginx=None)
+        self.assertEqual(sorted(results), ["3/legacy", "3/map", "40/legacy", "40/map"])
+        self.assertEqual(results["40/legacy"]["files"], 41)
+        self.assertEqual(results["40/map"]["files"], 2)
+        self.assertGreater(results["40/legacy"]["config_bytes"], results["40/map"]["config_bytes"])
+        for result in results.values():
+            self.assertGreater(result["reload_seconds"], 0)
+
+    def test_matchers(self):
+        users = ["alice", "bob"]
+        legacy = bench_nginx_routes.LegacyMatcher(users)
+        table = bench_nginx_routes.MapMatcher(nginx_routes.render_routes(users))
+        for uri, expected in (("/alice/", "redirect"), ("/bob/websockify", "tikzit_bob"),
+                              ("/alicex/", "tikzit_backend"), ("/docs/", "tikzit_backend"), ("/", "tikzit_backend")):
+            self.assertEqual((legacy.route(uri), table.route(uri)), (expected, expected), uri)
+
+    def test_stand_in_follows_includes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            prefix = Path(tmp)
+            main = bench_nginx_routes.write_layout(prefix, "map", ["alice", "bob"])
+            with_users = bench_nginx_routes.load_config(main, prefix)
+            (prefix / "conf.d" / nginx_routes.ROUTES_FILE).write_text(nginx_routes.HEADER)
+            self.assertEqual(bench_nginx_routes.load_config(main, prefix), with_users - 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+"""
+Unit tests for scripts/package_sdk.py.
+Packages the real SDK inputs into temporary archives.
+"""
+
+import unittest
+import unittest.mock
+import os
+import sys
+import tarfile
+import tempfile
+import zipfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import package_sdk  # noqa: E402
+
+
+class PackageSdkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.out = Path(self.tmp.name)
+        # an extra input the tests are free to modify
+        self.extra = self.out / "EXTRA.txt"
+        self.extra.write_text("first\n")
+        patcher = unittest.mock.patch.object(
+            package_sdk, "SDK_SOURCE_FILES", package_sdk.SDK_SOURCE_FILES + [self.extra])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache = unittest.mock.patch.dict(os.environ, {"MGB_UML_SDK_CACHE": str(self.out / "cache")})
+        cache.start()
+        self.addCleanup(cache.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def package(self, name, *extra):
+        argv = ["package_sdk.py", "--platform", "linux", "--output", str(self.out / name)] + list(extra)
+        with unittest.mock.patch.object(sys, "argv", argv), \
+                unittest.mock.patch("builtins.print") as printed:
+            self.assertEqual(package_sdk.main(), 0)
+        return " ".join(str(c.args[0]) for c in printed.call_args_list)
+
+
+class TestSdkArchives(PackageSdkTestCase):
+
+    def test_zip_contains_sdk_members(self):
+        self.package("sdk.zip")
+        with zipfile.ZipFile(self.out / "sdk.zip") as archive:
+            self.assertIsNone(archive.testzip())
+            names = archive.namelist()
+            header = archive.read("mgb-uml-plugin-sdk-linux/include/mgb-uml/src/data/mgbPluginInterface.h")
+        self.assertIn("mgb-uml-plugin-sdk-linux/SDK_MANIFEST.txt", names)
+        self.assertIn("mgb-uml-plugin-sdk-linux/templates/basic-node-plugin/basicnodeplugin.h", names)
+        self.assertEqual(header, (ROOT / "src" / "data" / "mgbPluginInterface.h").read_bytes())
+
+    def test_tar_gz_contains_sdk_members(self):
+        self.package("sdk.tar.gz")
+        with tarfile.open(self.out / "sdk.tar.gz") as archive:
+            names = archive.getnames()
+        self.assertIn("mgb-uml-plugin-sdk-linux/include/mgb-uml/src/gui/nodeitem.h", names)
+        self.assertIn("mgb-uml-plugin-sdk-linux/EXTRA.txt", names)
+
+    def test_streamed_tar_gz_matches_staged_tree(self):
+        self.package("streamed.tar.gz")
+        self.package("staged.tar.gz", "--stage")
+        with tarfile.open(self.out / "streamed.tar.gz") as streamed, \
+                tarfile.open(self.out / "staged.tar.gz") as staged:
+            self.assertEqual(sorted(streamed.getnames()), sorted(staged.getnames()))
+            for member in staged.getmembers():
+                if member.isfile():
+                    self.assertEqual(streamed.extractfile(member.name).read(),
+                                     staged.extractfile(member).read(), member.name)
+
+    def test_streaming_does_not_stage_a_tree(self):
+        with unittest.mock.patch.object(package_sdk, "build_sdk_tree") as build_sdk_tree:
+            self.package("sdk.zip")
+            self.package("sdk.tar.gz")
+        build_sdk_tree.assert_not_called()
+
+    def test_tar_xz(self):
+        self.package("sdk.tar.xz")
+        with tarfile.open(self.out / "sdk.tar.xz") as archive:
+            self.assertEqual(archive.extractfile("mgb-uml-plugin-sdk-linux/EXTRA.txt").read(), b"first\n")
+
+    @unittest.skipIf(package_sdk.zstandard is None, "zstandard is not installed")
+    def test_tar_zst(self):
+        self.package("sdk.tar.zst")
+        with open(self.out / "sdk.tar.zst", "rb") as f:
+            data = package_sdk.zstandard.ZstdDecompressor().stream_reader(f).read()
+        self.assertIn(b"mgb-uml-plugin-sdk-linux/SDK_MANIFEST.txt", data)
+
+    def test_several_formats_in_one_run(self):
+        output = self.package("sdk.zip", "--output", str(self.out / "sdk.tar.gz"),
+                              "--output", str(self.out / "sdk.tar.xz"))
+        for name in ("sdk.zip", "sdk.tar.gz", "sdk.tar.xz"):
+            self.assertIn("Created %s" % (self.out / name), output)
+        with zipfile.ZipFile(self.out / "sdk.zip") as archive:
+            zip_names = archive.namelist()
+        with tarfile.open(self.out / "sdk.tar.gz") as archive:
+            tar_names = [m.name for m in archive.getmembers() if m.isfile()]
+        self.assertEqual(zip_names, tar_names)
+        self.assertEqual(zip_names, sorted(zip_names))
+
+    def test_include_closure_is_scanned_once(self):
+        with unittest.mock.patch.object(package_sdk, "plugin_headers", wraps=package_sdk.plugin_headers) as scan:
+            self.package("sdk.zip", "--output", str(self.out / "sdk.tar.gz"), "--output", str(self.out / "sdk.tar.xz"))
+        self.assertEqual(scan.call_count, 1)
+
+    def test_rejects_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self.package("sdk.rar")
+
+
+class TestSdkReproducibility(PackageSdkTestCase):
+
+    def assertSameBytes(self, a, b):
+        self.assertEqual((self.out / a).read_bytes(), (self.out / b).read_bytes())
+
+    def test_identical_inputs_give_identical_archives(self):
+        self.package("a.zip", "--output", str(self.out / "a.tar.gz"), "--output", str(self.out / "a.tar.xz"))
+        os.utime(self.extra, (0, 1234567890))
+        self.package("b.zip", "--output", str(self.out / "b.tar.gz"), "--output", str(self.out / "b.tar.xz"),
+                     "--jobs", "1")
+        for ext in ("zip", "tar.gz", "tar.xz"):
+            self.assertSameBytes("a." + ext, "b." + ext)
+
+    def test_members_are_normalised(self):
+        self.package("sdk.tar.gz")
+        with tarfile.open(self.out / "sdk.tar.gz") as archive:
+            for member in archive.getmembers():
+                self.assertEqual((member.uid, member.gid, member.uname, member.gname), (0, 0, "", ""))
+                self.assertEqual(member.mtime, package_sdk.DEFAULT_SOURCE_DATE_EPOCH)
+                self.assertIn(member.mode, (0o644, 0o755))
+
+    def test_source_date_epoch(self):
+        self.package("sdk.zip")
+        with unittest.mock.patch.dict(os.environ, {"SOURCE_DATE_EPOCH": "1700000000"}):
+            self.assertNotIn("Up to date", self.package("sdk.zip"))
+        with zipfile.ZipFile(self.out / "sdk.zip") as archive:
+            self.assertEqual(archive.infolist()[0].date_time[:3], (2023, 11, 14))
+
+
+class TestSdkBuildCache(PackageSdkTestCase):
+
+    def test_unchanged_inputs_reuse_archive(self):
+        self.package("sdk.zip")
+        before = (self.out / "sdk.zip").stat().st_mtime_ns
+        self.assertIn("Up to date", self.package("sdk.zip"))
+        self.assertEqual((self.out / "sdk.zip").stat().st_mtime_ns, before)
+
+    def test_changed_input_repacks_only_that_member(self):
+        self.package("sdk.zip")
+        self.extra.write_text("second\n")
+        output = self.package("sdk.zip")
+        members = len(package_sdk.input_hashes("linux"))
+        self.assertIn("Repacked 1 members, reused %d unchanged" % (members - 1), output)
+        with zipfile.ZipFile(self.out / "sdk.zip") as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read("mgb-uml-plugin-sdk-linux/EXTRA.txt"), b"second\n")
+
+    def test_platform_is_part_of_the_hash(self):
+        self.package("sdk.tar.gz")
+        argv = ["package_sdk.py", "--platform", "macos", "--output", str(self.out / "sdk.tar.gz")]
+        with unittest.mock.patch.object(sys, "argv", argv), unittest.mock.patch("builtins.print"):
+            package_sdk.main()
+        with tarfile.open(self.out / "sdk.tar.gz") as archive:
+            self.assertIn("mgb-uml-plugin-sdk-macos/SDK_MANIFEST.txt", archive.getnames())
+
+    def test_modified_archive_is_rebuilt(self):
+        self.package("sdk.zip")
+        with open(self.out / "sdk.zip", "ab") as f:
+            f.write(b"tampered")
+        self.assertNotIn("Up to date", self.package("sdk.zip"))
+
+    def test_staged_archive_is_never_reused(self):
+        self.package("sdk.zip")
+        self.package("sdk.zip", "--stage", "--no-cache")
+        self.assertFalse(package_sdk.build_info_path(self.out / "sdk.zip").exists())
+        self.assertIn("reused 0", self.package("sdk.zip"))
+        with zipfile.ZipFile(self.out / "sdk.zip") as archive:
+            self.assertEqual({info.date_time for info in archive.infolist()}, {(1980, 1, 1, 0, 0, 0)})
+
+    def test_no_cache_forces_rebuild(self):
+        self.package("sdk.zip")
+        self.assertIn("reused 0", self.package("sdk.zip", "--no-cache"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+"""
+Unit tests for scripts/provision_users.py.
+Docker is replaced by an in-memory stand-in.
+"""
+
+import unittest
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import nginx_routes  # noqa: E402
+import provision_users  # noqa: E402
+
+
+class FakeDocker:
+    """Records docker calls and keeps a set of containers."""
+
+    def __init__(self, containers=(), fail_run=(), fail_nginx_test=False, delay=0.0):
+        self.containers = set(containers)
+        self.fail_run = set(fail_run)
+        self.fail_nginx_test = fail_nginx_test
+        self.delay = delay
+        self.calls = []
+        self.envs = []
+        self.lock = threading.Lock()
+        self.running = self.max_running = 0
+
+    def run(self, *args, env=None):
+        with self.lock:
+            self.calls.append(args)
+        if args[0] == "ps":
+            return "".join(name + "\n" for name in sorted(self.containers))
+        if args[0] == "rm":
+            with self.lock:
+                self.containers.discard(args[-1])
+            return ""
+        if args[0] == "run":
+            name = args[args.index("--name") + 1]
+            with self.lock:
+                self.envs.append(env)
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            time.sleep(self.delay)
+            with self.lock:
+                self.running -= 1
+                if name in self.fail_run:
+                    raise provision_users.DockerError(f"docker run: cannot start {name}")
+                if name in self.containers:
+                    raise provision_users.DockerError(f"docker run: name {name} is in use")
+                self.containers.add(name)
+            return "0123abcd\n"
+        if args[0] == "exec" and args[2:] == ("nginx", "-t") and self.fail_nginx_test:
+            raise provision_users.DockerError("docker exec: nginx: [emerg] unexpected }")
+        return ""
+
+    def count(self, *prefix):
+        return sum(1 for call in self.calls if call[:len(prefix)] == prefix)
+
+
+class TestProvisionUsers(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.config_dir = self.dir / "user_configs"
+        self.registry_path = self.dir / "user_registry.json"
+        self.env_file = self.dir / ".env"
+        self.env_file.write_text("# secrets\nVNC_PASSWORD='s3cret'\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def provision(self, docker, users, **kw):
+        registry = provision_users.UserRegistry(self.registry_path)
+        return provision_users.provision(docker, users, "s3cret", self.config_dir, registry, **kw)
+
+    def routes(self):
+        return nginx_routes.parse_routes((self.config_dir / nginx_routes.ROUTES_FILE).read_text())
+
+    def main(self, docker, *argv):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            status = provision_users.main(["--env-file", str(self.env_file), "--config-dir", str(self.config_dir),
+                                           "--registry", str(self.registry_path), *argv], docker)
+        return status, out.getvalue()
+
+    def test_bulk_provisioning_reloads_once(self):
+        docker = FakeDocker(delay=0.01)
+        users = [f"student{i}" for i in range(12)]
+        outcomes = self.provision(docker, users, jobs=3)
+        self.assertEqual(outcomes, dict((u, "created") for u in users))
+        self.assertEqual(docker.count("ps"), 1)
+        self.assertEqual(docker.count("run"), 12)
+        self.assertEqual(docker.count("exec", "tikzit_proxy", "nginx", "-t"), 1)
+        self.assertEqual(docker.count("exec", "tikzit_proxy", "nginx", "-s", "reload"), 1)
+        self.assertLessEqual(docker.max_running, 3)
+        self.assertEqual([p.name for p in self.config_dir.iterdir()], [nginx_routes.ROUTES_FILE])
+        self.assertEqual(self.routes(), dict((u, f"tikzit_{u}") for u in users))
+        self.assertEqual(sorted(json.loads(self.registry_path.read_text())["users"]), sorted(users))
+
+    def test_password_is_not_on_the_command_line(self):
+        docker = FakeDocker()
+        self.provision(docker, ["alice"])
+        run, = [call for call in docker.calls if call[0] == "run"]
+        self.assertIn("VNC_PASSWORD", run)
+        self.assertFalse(any("s3cret" in arg for arg in run))
+        self.assertEqual(docker.envs, [{"VNC_PASSWORD": "s3cret"}])
+        self.assertIn("tikzit_data_alice:/home/tikzituser/.local/share/tikzit", run)
+
+    def test_existing_users_are_kept_or_recreated(self):
+        docker = FakeDocker(containers={"tikzit_alice"})
+        self.assertEqual(self.provision(docker, ["alice", "bob"]), {"alice": "exists", "bob": "created"})
+        self.assertEqual(docker.count("rm"), 0)
+        outcomes = self.provision(docker, ["alice"], recreate=True)
+        self.assertEqual(outcomes, {"alice": "recreated"})
+        self.assertEqual(docker.count("rm", "-f", "tikzit_alice"), 1)
+
+    def test_unchanged_routes_skip_the_reload(self):
+        docker = FakeDocker()
+        self.provision(docker, ["alice"])
+        self.provision(docker, ["alice"])
+        self.assertEqual(docker.count("exec", "tikzit_proxy", "nginx", "-s", "reload"), 1)
+
+    def test_failed_users_get_no_route(self):
+        docker = FakeDocker(fail_run={"tikzit_bob"})
+        outcomes = self.provision(docker, ["alice", "bob"])
+        self.assertEqual(outcomes["alice"], "created")
+        self.assertTrue(outcomes["bob"].startswith("failed: docker run"))
+        self.assertEqual(self.routes(), {"alice": "tikzit_alice"})
+        self.assertNotIn("bob", json.loads(self.registry_path.read_text())["users"])
+
+    def test_bad_proxy_config_is_not_loaded(self):
+        docker = FakeDocker(fail_nginx_test=True)
+        status, out = self.main(docker, "alice")
+        self.assertEqual(status, 1)
+        self.assertIn("[emerg]", out)
+        self.assertEqual(docker.count("exec", "tikzit_proxy", "nginx", "-s", "reload"), 0)
+        self.assertFalse((self.config_dir / nginx_routes.ROUTES_FILE).exists())
+
+    def test_cli(self):
+        users = self.dir / "class.txt"
+        users.write_text("alice\n\n# late joiners\nbob  # TA\nalice\n")
+        status, out = self.main(FakeDocker(), "carol", "-f", str(users))
+        self.assertEqual(status, 0)
+        self.assertIn("https://mgb-uml.me/bob/vnc.html?path=bob/websockify", out)
+        self.assertIn("Provisioned 3 of 3 users", out)
+
+    def test_cli_rejects_invalid_names_and_missing_password(self):
+        docker = FakeDocker()
+        self.assertEqual(self.main(docker, "alice", "Bob Smith")[0], 1)
+        self.assertEqual(self.main(docker, "docs")[0], 1)
+        self.env_file.write_text("OTHER=1\n")
+        self.assertEqual(self.main(docker, "alice")[0], 1)
+        self.assertEqual(docker.calls, [])
+
+    def test_read_json_lines(self):
+        log = self.dir / "wake.log"
+        self.assertEqual(provision_users.read_json_lines(log), [])
+        log.write_text('{"user": "alice"}\n{"user": "b\n{"user": "carol"}\n')
+        self.assertEqual(provision_users.read_json_lines(log), [{"user": "alice"}, {"user": "carol"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
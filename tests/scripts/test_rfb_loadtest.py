@@ -0,0 +1,229 @@
+"""
+Unit tests for scripts/rfb_loadtest.py.
+Sessions are recorded and replayed against the stand-in RFB server, directly and through the gateway.
+"""
+
+import unittest
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import struct
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import nginx_routes  # noqa: E402
+import rfb_loadtest  # noqa: E402
+import vnc_gateway  # noqa: E402
+
+PASSWORD = "s3cret"
+SECRET = "0123456789abcdef"
+
+
+def pointer(x, y, buttons=0):
+    return struct.pack("!BBHH", rfb_loadtest.POINTER_EVENT, buttons, x, y)
+
+
+def script(*events):
+    """A recording with only viewer input, at the given (seconds, message) times."""
+    header = {"width": 320, "height": 200, "name": "script"}
+    return header, [{"t": t, "from": "viewer", "type": message[0], "data": base64.b64encode(message).decode()}
+                    for t, message in events]
+
+
+async def parse(reader_function, data, *args):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return await reader_function(reader, *args)
+
+
+class TestProtocol(unittest.IsolatedAsyncioTestCase):
+
+    def test_des(self):
+        key, block = bytes.fromhex("133457799BBCDFF1"), bytes.fromhex("0123456789ABCDEF")
+        self.assertEqual(rfb_loadtest.des_encrypt(key, block).hex(), "85e813540f0ab405")
+        # VNC mirrors the bits of each password byte: 0x01 -> 0x80
+        self.assertEqual(rfb_loadtest.vnc_auth_response("\x01", bytes(16))[:8],
+                         rfb_loadtest.des_encrypt(b"\x80" + bytes(7), bytes(8)))
+
+    async def test_viewer_messages(self):
+        messages = [rfb_loadtest.set_encodings(rfb_loadtest.REPLAY_ENCODINGS),
+                    rfb_loadtest.update_request(True, 320, 200), pointer(10, 20, 1),
+                    struct.pack("!BBxxI", rfb_loadtest.KEY_EVENT, 1, 0xff0d),
+                    struct.pack("!B3xI", rfb_loadtest.CLIENT_CUT_TEXT, 5) + b"hello",
+                    struct.pack("!B3x", rfb_loadtest.SET_PIXEL_FORMAT) + rfb_loadtest.DEFAULT_PIXEL_FORMAT]
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"".join(messages))
+        for message in messages:
+            self.assertEqual(await rfb_loadtest.read_client_message(reader), (message[0], message))
+        with self.assertRaises(vnc_gateway.ProtocolError):
+            await parse(rfb_loadtest.read_client_message, b"\xff" + bytes(9))
+
+    async def test_server_messages(self):
+        rects = [struct.pack("!HHHHi", 0, 0, 2, 2, rfb_loadtest.ENC_RAW) + bytes(16),
+                 struct.pack("!HHHHi", 4, 4, 8, 8, rfb_loadtest.ENC_COPYRECT) + bytes(4),
+                 struct.pack("!HHHHiI", 0, 0, 64, 64, rfb_loadtest.ENC_ZRLE, 3) + b"zip",
+                 struct.pack("!HHHHi", 0, 0, 640, 480, rfb_loadtest.ENC_DESKTOP_SIZE),
+                 struct.pack("!HHHHi", 0, 0, 0, 0, rfb_loadtest.ENC_LAST_RECT)]
+        update = struct.pack("!BxH", rfb_loadtest.FB_UPDATE, 0xFFFF) + b"".join(rects)
+        cut = struct.pack("!B3xI", rfb_loadtest.SERVER_CUT_TEXT, 2) + b"hi"
+        reader = asyncio.StreamReader()
+        reader.feed_data(update + b"\x02" + cut)
+        self.assertEqual(await rfb_loadtest.read_server_message(reader, 4), (rfb_loadtest.FB_UPDATE, update))
+        self.assertEqual(await rfb_loadtest.read_server_message(reader, 4), (rfb_loadtest.BELL, b"\x02"))
+        self.assertEqual(await rfb_loadtest.read_server_message(reader, 4), (rfb_loadtest.SERVER_CUT_TEXT, cut))
+        tight = struct.pack("!BxHHHHHi", rfb_loadtest.FB_UPDATE, 1, 0, 0, 8, 8, 7)
+        with self.assertRaises(vnc_gateway.ProtocolError):
+            await parse(rfb_loadtest.read_server_message, tight, 4)
+
+
+class TestRecordAndReplay(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.servers = []
+
+    async def asyncTearDown(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.tmp.cleanup()
+
+    async def listen(self, handler):
+        server = await asyncio.start_server(handler, "127.0.0.1", 0)
+        self.servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    async def record(self, upstream_url, viewer_script):
+        recorded = asyncio.get_running_loop().create_future()
+
+        async def proxy(reader, writer):
+            _, viewer = await rfb_loadtest.accept_websocket(reader, writer)
+            server = await rfb_loadtest.open_websocket(upstream_url)
+            try:
+                recorded.set_result(await rfb_loadtest.record_session(viewer, server))
+            finally:
+                await viewer.close()
+                await server.close()
+
+        port = await self.listen(proxy)
+        viewer = rfb_loadtest.SimulatedViewer("alice", f"ws://127.0.0.1:{port}/alice/websockify", *viewer_script,
+                                              password=PASSWORD, settle=0.2)
+        stats = await viewer.run()
+        self.assertIsNone(stats["error"])
+        return await asyncio.wait_for(recorded, 5)
+
+    async def test_record_then_replay_through_the_gateway(self):
+        stub = rfb_loadtest.RfbStub(password=PASSWORD)
+        stub_port = await self.listen(stub.handle_websocket)
+        header, events = await self.record(f"ws://127.0.0.1:{stub_port}/alice/websockify",
+                                           script((0.05, pointer(10, 10)), (0.1, pointer(100, 50, 1)),
+                                                  (0.15, pointer(300, 190))))
+        self.assertEqual((header["width"], header["height"], header["name"]), (320, 200, "TikZiT stand-in"))
+        kinds = [(e["from"], e["type"]) for e in events]
+        self.assertEqual(kinds.count(("viewer", rfb_loadtest.POINTER_EVENT)), 3)
+        # the full screen, then one small update per pointer event
+        self.assertEqual(kinds.count(("server", rfb_loadtest.FB_UPDATE)), 4)
+        encodings = next(e for e in events if e["type"] == rfb_loadtest.SET_ENCODINGS and e["from"] == "viewer")
+        self.assertEqual(base64.b64decode(encodings["data"]), rfb_loadtest.set_encodings(rfb_loadtest.REPLAY_ENCODINGS))
+        recording = self.dir / "session.rfb.jsonl"
+        rfb_loadtest.write_recording(recording, header, events)
+
+        # replay it from three viewers: nginx -> gateway -> the stand-in's raw RFB port
+        replayed = rfb_loadtest.RfbStub(rfb_loadtest.read_recording(recording), password=PASSWORD, speed=4)
+        rfb_port = await self.listen(replayed.handle_rfb)
+        routes = self.dir / nginx_routes.ROUTES_FILE
+        routes.write_text("alice 127.0.0.1;\nbob 127.0.0.1;\n")
+        gateway = vnc_gateway.Gateway(vnc_gateway.RouteTable(routes), SECRET, rfb_port, log=None)
+        gateway_server = await gateway.start("127.0.0.1", 0)
+        self.servers.append(gateway_server)
+        port = gateway_server.sockets[0].getsockname()[1]
+
+        viewers = []
+        for i, user in enumerate(["alice", "bob", "alice"]):
+            token = vnc_gateway.session_token(SECRET, user, int(time.time()) + 60)
+            viewers.append(rfb_loadtest.SimulatedViewer(
+                user, f"ws://127.0.0.1:{port}/{user}/websockify?token={token}", *rfb_loadtest.read_recording(recording),
+                password=PASSWORD, speed=4, settle=0.3))
+        sessions = await rfb_loadtest.run_load(viewers, ramp=0.01)
+        self.assertEqual([s["error"] for s in sessions], [None] * 3)
+        self.assertEqual(replayed.sessions, 3)
+        for session in sessions:
+            self.assertEqual(session["updates"], 4)
+            self.assertGreaterEqual(len(session["latencies_ms"]), 1)
+            self.assertGreater(session["bytes_in"], 320 * 200 * 4)
+        self.assertEqual(gateway.totals["connections"], 3)
+        report = rfb_loadtest.format_report(sessions, 1.0, 0.3, {"tikzit_alice": 12.0, "tikzit_bob": 20.0})
+        self.assertIn("3 sessions, 0 failed", report)
+        self.assertIn("frame latency: p50", report)
+        self.assertIn("server CPU per session: p50 16.0%  max 20.0% of a core", report)
+        self.assertIn("viewer CPU per session: 10.00% of a core", report)
+
+    async def test_wrong_password_and_refused_route(self):
+        stub_port = await self.listen(rfb_loadtest.RfbStub(password=PASSWORD).handle_websocket)
+        url = f"ws://127.0.0.1:{stub_port}/alice/websockify"
+        wrong = await rfb_loadtest.SimulatedViewer("alice", url, *script(), password="nope").run()
+        self.assertIn("VNC authentication failed", wrong["error"])
+        missing = await rfb_loadtest.SimulatedViewer("alice", url, *script()).run()
+        self.assertIn("asks for a VNC password", missing["error"])
+        refused = await rfb_loadtest.SimulatedViewer("alice", f"ws://127.0.0.1:{stub_port}/vnc.html", *script()).run()
+        self.assertIn("404", refused["error"])
+        report = rfb_loadtest.format_report([wrong, missing, refused], 1.0, 0.0)
+        self.assertIn("3 sessions, 3 failed", report)
+
+
+class FakeDocker:
+    """cgroup v2 CPU counters that advance by a second per read."""
+
+    def __init__(self):
+        self.reads = 0
+
+    def run(self, *args, env=None):
+        self.reads += 1
+        return f"usage_usec {self.reads * 1000000}\nuser_usec 1\n"
+
+
+class TestCli(unittest.TestCase):
+
+    def test_replay_against_the_stub(self):
+        loop = asyncio.new_event_loop()
+        stub = rfb_loadtest.RfbStub()
+        server = loop.run_until_complete(asyncio.start_server(stub.handle_websocket, "127.0.0.1", 0))
+        port = server.sockets[0].getsockname()[1]
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                recording = Path(tmp) / "script.rfb.jsonl"
+                rfb_loadtest.write_recording(recording, *script((0.02, pointer(5, 5)), (0.04, pointer(6, 6))))
+                results = Path(tmp) / "results.json"
+                argv = ["replay", str(recording), "--url", f"ws://127.0.0.1:{port}/{{user}}/websockify",
+                        "--users", "alice", "bob", "-n", "4", "--settle", "0.2", "--env-file", str(Path(tmp) / ".env"),
+                        "--docker", "--json", str(results)]
+                with contextlib.redirect_stdout(io.StringIO()) as out:
+                    self.assertEqual(rfb_loadtest.main(argv, FakeDocker()), 0)
+                    self.assertEqual(rfb_loadtest.main(["replay", str(recording), "--users", "alice", "--env-file",
+                                                        str(Path(tmp) / ".env")]), 1)
+                data = json.loads(results.read_text())
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+        self.assertIn("4 sessions, 0 failed", out.getvalue())
+        self.assertIn("server CPU per session", out.getvalue())
+        self.assertIn("sets GATEWAY_SECRET", out.getvalue())
+        self.assertEqual(stub.sessions, 4)
+        self.assertEqual([s["updates"] for s in data["sessions"]], [3] * 4)
+        self.assertEqual(sorted(data["server_cpu_percent"]), ["tikzit_alice", "tikzit_bob"])
+
+
+if __name__ == '__main__':
+    unittest.main()
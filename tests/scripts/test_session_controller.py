@@ -0,0 +1,302 @@
+"""
+Unit tests for scripts/session_controller.py.
+Docker is replaced by an in-memory stand-in; the wake endpoint runs on a local port.
+"""
+
+import unittest
+import contextlib
+import http.client
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import provision_users  # noqa: E402
+import session_controller  # noqa: E402
+
+STARTED = "2026-01-01T10:00:00.123456789Z"
+T0 = session_controller.parse_docker_time(STARTED)
+
+TCP_HEADER = "  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+
+
+def tcp_table(established=0, gateway=0):
+    rows = ["   0: 00000000:1F90 00000000:0000 0A 00000000:00000000 00:00000000 00000000  1000        0 1 1\n"]
+    rows += [f"   {i + 1}: 0300120A:1F90 0200120A:{0xC000 + i:04X} 01 00000000:00000000 00:00000000 00000000"
+             f"  1000        0 2 1\n" for i in range(established)]
+    # viewers spliced by the gateway connect to the VNC server directly
+    rows += [f"   {i + 5}: 0300120A:170D 0500120A:{0xC000 + i:04X} 01 00000000:00000000 00:00000000 00000000"
+             f"  1000        0 4 1\n" for i in range(gateway)]
+    # a client connection from the session to somewhere else on 8080 is not a viewer
+    rows.append("   9: 0300120A:D431 0400120A:1F90 01 00000000:00000000 00:00000000 00000000  1000        0 3 1\n")
+    return TCP_HEADER + "".join(rows)
+
+
+class FakeDocker:
+
+    def __init__(self):
+        self.containers = {}
+        self.calls = []
+        self.lock = threading.Lock()
+        self.start_delay = 0.0
+
+    def add(self, username, status="running", established=0, gateway=0):
+        self.containers[provision_users.container_name(username)] = {
+            "status": status, "established": established, "gateway": gateway, "ready_at": 0.0}
+
+    def run(self, *args, env=None):
+        with self.lock:
+            self.calls.append(args)
+        command = args[0]
+        if command == "ps":
+            return "".join(f"{n}\n" for n, c in sorted(self.containers.items()) if c["status"] == "running")
+        if command == "inspect":
+            fmt, names = args[2], args[3:]
+            out = []
+            for name in names:
+                if name not in self.containers:
+                    raise provision_users.DockerError(f"docker inspect: no such object: {name}")
+                c = self.containers[name]
+                if fmt == "{{.State.Status}}":
+                    out.append(c["status"])
+                elif fmt.startswith("{{range .NetworkSettings"):
+                    out.append("10.18.0.3 " if c["status"] == "running" else " ")
+                else:
+                    out.append(f"/{name} {STARTED}")
+            return "\n".join(out) + "\n"
+        if command == "exec":
+            c = self.containers[args[1]]
+            if c["status"] != "running":
+                raise provision_users.DockerError(f"docker exec: container {args[1]} is not running")
+            return tcp_table(c["established"], c["gateway"])
+        if command in ("start", "unpause"):
+            with self.lock:
+                self.containers[args[1]]["status"] = "running"
+                self.containers[args[1]]["ready_at"] = time.perf_counter() + self.start_delay
+            return args[1] + "\n"
+        if command == "stop":
+            for name in args[1:]:
+                self.containers[name]["status"] = "exited"
+            return ""
+        if command == "network":
+            return {"bridge": "172.17.0.1 \n", "tikzit_net": "172.20.0.1 \n"}.get(args[-1], "")
+        return ""
+
+    def probe(self, host, port):
+        running = [c for c in self.containers.values() if c["status"] == "running"]
+        return port == 8080 and any(time.perf_counter() >= c["ready_at"] for c in running)
+
+    def count(self, *prefix):
+        return sum(1 for call in self.calls if call[:len(prefix)] == prefix)
+
+
+class ControllerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.registry = provision_users.UserRegistry(self.dir / "user_registry.json")
+        for username in ("alice", "bob", "carol"):
+            self.registry.add(username)
+            self.registry.users[username]["created"] = "2025-12-31T00:00:00Z"
+        self.registry.save()
+        self.docker = FakeDocker()
+        self.wake_log = self.dir / "wakes.jsonl"
+        self.controller = session_controller.SessionController(
+            self.docker, self.registry, self.wake_log, probe=self.docker.probe,
+            ready_timeout=2.0, poll_interval=0.01)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+class TestIdleSweep(ControllerTestCase):
+
+    def test_count_connections(self):
+        self.assertEqual(session_controller.count_connections(tcp_table(3)), 3)
+        self.assertEqual(session_controller.count_connections(tcp_table(0)), 0)
+        self.assertEqual(session_controller.count_connections(tcp_table(0), state=session_controller.TCP_LISTEN), 1)
+
+    def test_idle_sessions_are_stopped(self):
+        self.docker.add("alice", established=2)
+        self.docker.add("bob")
+        self.docker.add("carol", status="exited")
+        state = session_controller.SessionState(self.dir / "state.json")
+
+        self.assertEqual(self.controller.sweep(state, 600, now=T0 + 300), [])
+        stopped = self.controller.sweep(state, 600, now=T0 + 900)
+        self.assertEqual(stopped, ["bob"])
+        self.assertEqual(self.docker.count("update", "--restart", "unless-stopped", "tikzit_bob"), 1)
+        self.assertEqual(self.docker.count("stop", "tikzit_bob"), 1)
+        self.assertEqual(self.docker.containers["tikzit_alice"]["status"], "running")
+
+        # alice's viewers leave; she is idle once the timeout passes from her last connection
+        self.docker.containers["tikzit_alice"]["established"] = 0
+        self.assertEqual(self.controller.sweep(state, 600, now=T0 + 1200), [])
+        state = session_controller.SessionState(self.dir / "state.json")
+        self.assertEqual(self.controller.sweep(state, 600, now=T0 + 1500), ["alice"])
+
+    def test_gateway_viewers_keep_the_session(self):
+        self.docker.add("bob", gateway=1)
+        state = session_controller.SessionState(self.dir / "state.json")
+        self.assertEqual(self.controller.sweep(state, 600, now=T0 + 900), [])
+        self.docker.containers["tikzit_bob"]["gateway"] = 0
+        self.assertEqual(self.controller.sweep(state, 600, now=T0 + 1500), ["bob"])
+
+    def test_claimed_pool_container_is_fresh(self):
+        # booted into the warm pool at T0, handed to bob an hour later
+        self.docker.add("bob")
+        self.registry.users["bob"]["created"] = "2026-01-01T11:00:00Z"
+        state = session_controller.SessionState(self.dir / "state.json")
+        self.assertEqual(self.controller.sweep(state, 600, now=T0 + 3700), [])
+        self.assertEqual(self.controller.sweep(state, 600, now=T0 + 4300), ["bob"])
+
+    def test_dry_run_and_unregistered_containers(self):
+        self.docker.add("bob")
+        self.docker.containers["tikzit_default"] = {"status": "running", "established": 0, "gateway": 0,
+                                                   "ready_at": 0}
+        state = session_controller.SessionState(self.dir / "state.json")
+        self.assertEqual(self.controller.sweep(state, 60, now=T0 + 3600, dry_run=True), ["bob"])
+        self.assertEqual(self.docker.count("stop"), 0)
+        self.assertFalse(any("tikzit_default" in call for call in self.docker.calls))
+
+    def test_docker_time(self):
+        self.assertAlmostEqual(session_controller.parse_docker_time("2026-01-01T10:00:01Z") - T0, 0.876544, 5)
+
+
+class TestWake(ControllerTestCase):
+
+    def test_concurrent_requests_share_one_wake(self):
+        self.docker.add("alice", status="exited")
+        self.docker.start_delay = 0.1
+        futures = [self.controller.wake("alice") for _ in range(5)]
+        self.assertEqual(len(set(map(id, futures))), 1)
+        seconds = futures[0].result(5)
+        self.assertGreaterEqual(seconds, 0.1)
+        self.assertEqual(self.docker.count("start", "tikzit_alice"), 1)
+        # the sweep's unless-stopped is undone
+        self.assertEqual(self.docker.count("update", "--restart", "always", "tikzit_alice"), 1)
+        entry, = [json.loads(line) for line in self.wake_log.read_text().splitlines()]
+        self.assertEqual((entry["user"], entry["ready"]), ("alice", True))
+
+    def test_paused_session_is_unpaused(self):
+        self.docker.add("alice", status="paused")
+        self.controller.wake("alice").result(5)
+        self.assertEqual(self.docker.count("unpause", "tikzit_alice"), 1)
+
+    def test_listens_on_the_session_network(self):
+        self.assertEqual(session_controller.docker_gateway(self.docker), "172.20.0.1")
+        self.assertEqual(session_controller.docker_gateway(self.docker, "bridge"), "172.17.0.1")
+
+    def test_wake_times_out(self):
+        self.docker.add("alice", status="exited")
+        self.docker.start_delay = 60
+        self.controller.ready_timeout = 0.05
+        with self.assertRaises(TimeoutError):
+            self.controller.wake("alice").result(5)
+        self.assertIn('"ready": false', self.wake_log.read_text())
+
+    def test_report(self):
+        self.wake_log.write_text("".join(json.dumps({"user": "u", "seconds": s, "ready": True}) + "\n"
+                                         for s in (1.0, 2.0, 3.0)) + '{"user": "u", "seconds": 90, "ready": false}\n')
+        report = session_controller.format_report(provision_users.read_json_lines(self.wake_log))
+        self.assertIn("4 wake-ups, 1 failed", report)
+        self.assertIn("p50 2.00s", report)
+        self.assertIn("max 3.00s", report)
+
+
+class TestWakeEndpoint(ControllerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = session_controller.WakeServer(("127.0.0.1", 0), self.controller)
+        self.server.RequestHandlerClass.log_message = lambda *args: None
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def request(self, path, method="GET", headers=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+        try:
+            conn.request(method, path, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            conn.close()
+
+    def test_request_is_held_until_ready_then_redirected(self):
+        self.docker.add("alice", status="exited")
+        self.docker.start_delay = 0.05
+        status, headers, _ = self.request("/alice/vnc.html?path=alice/websockify")
+        self.assertEqual(status, 307)
+        self.assertEqual(headers["Location"], "/alice/vnc.html?path=alice/websockify")
+        self.assertEqual(self.docker.containers["tikzit_alice"]["status"], "running")
+
+    def test_original_uri_from_nginx(self):
+        self.docker.add("alice", status="exited")
+        status, headers, _ = self.request("/vnc.html", headers={"X-Original-URI": "/alice/vnc.html?path=alice/websockify"})
+        self.assertEqual((status, headers["Location"]), (307, "/alice/vnc.html?path=alice/websockify"))
+
+    def test_running_session_is_not_redirected(self):
+        self.docker.add("alice")
+        self.assertEqual(self.request("/alice/")[0], 502)
+        self.assertEqual(self.docker.count("start"), 0)
+
+    def test_unknown_users(self):
+        self.assertEqual(self.request("/mallory/")[0], 404)
+        self.assertEqual(self.request("/../etc/")[0], 404)
+        # users provisioned while the server runs are picked up
+        registry = provision_users.UserRegistry(self.registry.path)
+        registry.add("dave")
+        registry.save()
+        self.docker.add("dave", status="exited")
+        self.assertEqual(self.request("/dave/", "HEAD")[0], 307)
+
+    def test_post_body_is_consumed(self):
+        self.docker.add("alice", status="exited")
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+        try:
+            conn.request("POST", "/alice/upload", body=b"x" * 1000)
+            response = conn.getresponse()
+            response.read()
+            self.assertEqual(response.status, 307)
+            # the same keep-alive connection still parses the next request
+            conn.request("GET", "/mallory/")
+            self.assertEqual(conn.getresponse().status, 404)
+        finally:
+            conn.close()
+
+    def test_failed_wake_asks_to_retry(self):
+        self.docker.add("alice", status="exited")
+        self.docker.start_delay = 60
+        self.controller.ready_timeout = 0.05
+        status, headers, _ = self.request("/alice/")
+        self.assertEqual((status, headers["Retry-After"]), (503, "5"))
+
+
+class TestCli(ControllerTestCase):
+
+    def test_sweep_and_report(self):
+        self.docker.add("bob")
+        argv = ["--registry", str(self.registry.path), "--wake-log", str(self.wake_log)]
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            status = session_controller.main(argv + ["sweep", "--idle-minutes", "0",
+                                                     "--state", str(self.dir / "state.json")], self.docker)
+            self.assertEqual(status, 0)
+            self.assertEqual(session_controller.main(argv + ["report"]), 0)
+        self.assertIn("Stopped: bob", out.getvalue())
+        self.assertIn("0 wake-ups", out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
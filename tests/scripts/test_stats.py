@@ -0,0 +1,24 @@
+"""
+Unit tests for scripts/stats.py.
+"""
+
+import unittest
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import stats  # noqa: E402
+
+
+class TestPercentile(unittest.TestCase):
+
+    def test_percentile(self):
+        self.assertEqual(stats.percentile([3.0], 90), 3.0)
+        self.assertEqual(stats.percentile([4.0, 1.0, 3.0, 2.0], 50), 2.5)
+        self.assertAlmostEqual(stats.percentile([float(i) for i in range(11)], 90), 9.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
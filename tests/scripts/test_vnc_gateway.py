@@ -0,0 +1,255 @@
+"""
+Unit tests for scripts/vnc_gateway.py.
+The gateway splices websockets to a local stub RFB server that greets and echoes.
+"""
+
+import unittest
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import unquote
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import nginx_routes  # noqa: E402
+import provision_users  # noqa: E402
+import vnc_gateway  # noqa: E402
+
+SECRET = "0123456789abcdef"
+GREETING = b"RFB 003.008\n"
+
+
+class StubRfbServer:
+    """Sends the RFB greeting, then echoes whatever the viewer sends."""
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.viewers = 0
+
+    async def handle(self, reader, writer):
+        self.viewers += 1
+        writer.write(GREETING)
+        with contextlib.suppress(ConnectionError):
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        writer.close()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class TestFraming(unittest.IsolatedAsyncioTestCase):
+
+    async def test_frames_round_trip(self):
+        for size in (0, 5, 125, 126, 65535, 65536, 200000):
+            payload = os.urandom(size)
+            for mask in (None, b"\x01\x02\x03\x04"):
+                reader = asyncio.StreamReader()
+                reader.feed_data(vnc_gateway.encode_frame(vnc_gateway.OP_BINARY, payload, mask))
+                self.assertEqual(await vnc_gateway.read_frame(reader), (True, vnc_gateway.OP_BINARY, payload))
+
+    async def test_oversized_frame(self):
+        reader = asyncio.StreamReader()
+        reader.feed_data(vnc_gateway.encode_frame(vnc_gateway.OP_BINARY, b"x" * 200))
+        with self.assertRaises(vnc_gateway.ProtocolError):
+            await vnc_gateway.read_frame(reader, max_size=100)
+
+    def test_mask_and_accept_key(self):
+        self.assertEqual(vnc_gateway.apply_mask(b"Hello", b"\x37\xfa\x21\x3d"), b"\x7f\x9f\x4d\x51\x58")
+        # the example of RFC 6455, section 1.3
+        self.assertEqual(vnc_gateway.accept_key("dGhlIHNhbXBsZSBub25jZQ=="), "s3pPLMBiTxaQ9kYGzzhZRbK+xOo=")
+
+    def test_tokens(self):
+        token = vnc_gateway.session_token(SECRET, "alice", 2000)
+        self.assertTrue(vnc_gateway.check_token(SECRET, "alice", token, now=1000))
+        self.assertFalse(vnc_gateway.check_token(SECRET, "alice", token, now=3000))
+        self.assertFalse(vnc_gateway.check_token(SECRET, "bob", token, now=1000))
+        self.assertFalse(vnc_gateway.check_token("other", "alice", token, now=1000))
+        self.assertFalse(vnc_gateway.check_token(SECRET, "alice", "3000." + token.split(".")[1], now=1000))
+        self.assertFalse(vnc_gateway.check_token(SECRET, "alice", "", now=1000))
+        self.assertFalse(vnc_gateway.check_token(SECRET, "alice", "2000.\u00e9", now=1000))
+        self.assertFalse(vnc_gateway.check_token(SECRET, "alice", "\u00b2000." + token.split(".")[1], now=1000))
+
+        url = vnc_gateway.token_url(SECRET, "alice", days=1)
+        self.assertTrue(url.startswith("https://mgb-uml.me/alice/vnc.html?path=alice/websockify%3Ftoken%3D"))
+        token = unquote(url.split("?path=", 1)[1]).split("?token=", 1)[1]
+        self.assertTrue(vnc_gateway.check_token(SECRET, "alice", token))
+        self.assertEqual(provision_users.session_url("bob"), "https://mgb-uml.me/bob/vnc.html?path=bob/websockify")
+
+
+class TestGateway(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.routes = self.dir / nginx_routes.ROUTES_FILE
+        self.routes.write_text(nginx_routes.HEADER + "alice 127.0.0.1;\n")
+        self.log = self.dir / "connections.jsonl"
+        self.rfb = StubRfbServer()
+        await self.rfb.start()
+        self.gateway = vnc_gateway.Gateway(vnc_gateway.RouteTable(self.routes), SECRET, self.rfb.port,
+                                           connect_timeout=2.0, log=self.log)
+        self.server = await self.gateway.start("127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.rfb.close()
+        self.tmp.cleanup()
+
+    async def request(self, path, upgrade=True):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.key = base64.b64encode(os.urandom(16)).decode("ascii")
+        headers = f"GET {path} HTTP/1.1\r\nHost: mgb-uml.me\r\n"
+        if upgrade:
+            headers += (f"Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {self.key}\r\n"
+                        "Sec-WebSocket-Version: 13\r\nSec-WebSocket-Protocol: binary\r\n")
+        writer.write((headers + "\r\n").encode("ascii"))
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        return int(head.split()[1]), head, reader, writer
+
+    def session_path(self, username="alice", expires=None):
+        expires = expires or int(time.time()) + 60
+        return f"/{username}/websockify?token={vnc_gateway.session_token(SECRET, username, expires)}"
+
+    async def send(self, writer, opcode, payload):
+        writer.write(vnc_gateway.encode_frame(opcode, payload, mask=os.urandom(4)))
+        await writer.drain()
+
+    async def test_splices_the_viewer_to_the_vnc_server(self):
+        status, head, reader, writer = await self.request(self.session_path())
+        self.assertEqual(status, 101)
+        self.assertIn(f"Sec-WebSocket-Accept: {vnc_gateway.accept_key(self.key)}", head)
+        self.assertIn("Sec-WebSocket-Protocol: binary", head)
+        self.assertEqual(await vnc_gateway.read_frame(reader), (True, vnc_gateway.OP_BINARY, GREETING))
+
+        await self.send(writer, vnc_gateway.OP_BINARY, b"RFB 003.008\n")
+        self.assertEqual((await vnc_gateway.read_frame(reader))[2], b"RFB 003.008\n")
+        await self.send(writer, vnc_gateway.OP_PING, b"hi")
+        self.assertEqual(await vnc_gateway.read_frame(reader), (True, vnc_gateway.OP_PONG, b"hi"))
+
+        _, _, stats_reader, stats_writer = await self.request(vnc_gateway.STATS_PATH, upgrade=False)
+        stats = json.loads(await stats_reader.read())
+        stats_writer.close()
+        self.assertEqual(stats["routes"], 1)
+        (active,) = stats["active"]
+        self.assertEqual((active["user"], active["bytes_in"], active["frames_in"]), ("alice", 12, 1))
+
+        await self.send(writer, vnc_gateway.OP_CLOSE, b"\x03\xe8")
+        self.assertEqual((await vnc_gateway.read_frame(reader))[1], vnc_gateway.OP_CLOSE)
+        # the connection is logged before it is closed
+        self.assertEqual(await reader.read(), b"")
+        writer.close()
+
+        entry, = [json.loads(line) for line in self.log.read_text().splitlines()]
+        self.assertEqual((entry["user"], entry["closed"]), ("alice", "viewer"))
+        self.assertEqual((entry["bytes_in"], entry["bytes_out"]), (12, 24))
+        self.assertGreaterEqual(entry["first_byte_ms"], 0)
+        self.assertGreaterEqual(entry["connect_ms"], 0)
+        self.assertEqual(self.gateway.active, {})
+        self.assertEqual(self.gateway.totals["bytes_out"], 24)
+        self.assertIn("1 connections from 1 users", vnc_gateway.format_report([entry]))
+
+    async def test_rejections(self):
+        expired = self.session_path(expires=int(time.time()) - 1)
+        for path, expected in ((expired, 403), ("/alice/websockify?token=1.abc", 403), ("/alice/websockify", 403),
+                               (f"/alice/websockify?token={int(time.time()) + 60}.%C3%A9", 403),
+                               (self.session_path("bob"), 404), ("/alice/vnc.html", 404)):
+            status, _, _, writer = await self.request(path)
+            writer.close()
+            self.assertEqual(status, expected, path)
+        status, _, _, writer = await self.request(self.session_path(), upgrade=False)
+        writer.close()
+        self.assertEqual(status, 400)
+        self.assertEqual(self.gateway.totals["rejected"], 5)
+        self.assertEqual(self.rfb.viewers, 0)
+
+    async def test_urls_without_a_token_until_the_legacy_deadline(self):
+        self.gateway.legacy_until = time.time() + 60
+        status, _, reader, writer = await self.request("/alice/websockify")
+        self.assertEqual(status, 101)
+        self.assertEqual((await vnc_gateway.read_frame(reader))[2], GREETING)
+        # a token that is present still has to be valid
+        status, _, _, bad = await self.request("/alice/websockify?token=1.abc")
+        bad.close()
+        self.assertEqual(status, 403)
+        await self.send(writer, vnc_gateway.OP_CLOSE, b"\x03\xe8")
+        await reader.read()
+        writer.close()
+        entry, = [json.loads(line) for line in self.log.read_text().splitlines()]
+        self.assertTrue(entry["legacy"])
+        self.assertIn("1 connections without a token, re-issue the URLs of: alice", vnc_gateway.format_report([entry]))
+        self.assertEqual(self.gateway.totals["legacy"], 1)
+
+        self.gateway.legacy_until = time.time() - 1
+        status, _, _, writer = await self.request("/alice/websockify")
+        writer.close()
+        self.assertEqual(status, 403)
+
+    async def test_stopped_session_is_a_bad_gateway(self):
+        await self.rfb.close()
+        status, _, _, writer = await self.request(self.session_path())
+        writer.close()
+        self.assertEqual(status, 502)
+        self.assertEqual(self.gateway.totals["failed"], 1)
+
+    async def test_routes_are_reloaded_when_the_table_changes(self):
+        status, _, _, writer = await self.request(self.session_path("bob"))
+        writer.close()
+        self.assertEqual(status, 404)
+        provision_users.write_atomic(self.routes, nginx_routes.HEADER + "alice 127.0.0.1;\nbob 127.0.0.1;\n")
+        status, _, reader, writer = await self.request(self.session_path("bob"))
+        self.assertEqual(status, 101)
+        self.assertEqual((await vnc_gateway.read_frame(reader))[2], GREETING)
+        writer.close()
+
+        # a broken table keeps the previous routes
+        self.routes.write_text("bob 127.0.0.1\n")
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            self.assertEqual(self.gateway.routes.lookup("bob"), "127.0.0.1")
+        self.assertIn("bad entry", err.getvalue())
+
+
+class TestCli(unittest.TestCase):
+
+    def test_url_and_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            env_file = Path(tmp) / ".env"
+            env_file.write_text(f"VNC_PASSWORD=s3cret\nGATEWAY_SECRET={SECRET}\n")
+            log = Path(tmp) / "connections.jsonl"
+            log.write_text(json.dumps({"user": "alice", "connect_ms": 1.5, "first_byte_ms": 3.0, "seconds": 60,
+                                       "bytes_in": 1000, "bytes_out": 2000000}) + "\n")
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                self.assertEqual(vnc_gateway.main(["--env-file", str(env_file), "url", "alice"]), 0)
+                self.assertEqual(vnc_gateway.main(["--log", str(log), "report"]), 0)
+                self.assertEqual(vnc_gateway.main(["--env-file", str(env_file), "url", "Alice"]), 1)
+                self.assertEqual(vnc_gateway.main(["--env-file", str(log), "url", "alice"]), 1)
+                env_file.write_text(f"GATEWAY_SECRET={SECRET}\nGATEWAY_LEGACY_UNTIL=soon\n")
+                self.assertEqual(vnc_gateway.main(["--env-file", str(env_file), "serve"]), 1)
+            env_file.write_text("GATEWAY_LEGACY_UNTIL=2026-11-16\n")
+            self.assertEqual(vnc_gateway.legacy_deadline(env_file), 1794787200.0)
+            self.assertIsNone(vnc_gateway.legacy_deadline(log))
+        self.assertIn("alice/websockify%3Ftoken%3D", out.getvalue())
+        self.assertIn("connect to VNC: p50 1.5ms", out.getvalue())
+        self.assertIn("traffic: 2.0 MB to viewers", out.getvalue())
+        self.assertIn(f"neither the environment nor {log} sets GATEWAY_SECRET", out.getvalue())
+        self.assertIn("GATEWAY_LEGACY_UNTIL is not an ISO date", out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
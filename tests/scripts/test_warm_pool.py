@@ -0,0 +1,244 @@
+"""
+Unit tests for scripts/warm_pool.py.
+Docker is replaced by an in-memory stand-in; the RFB probe runs against a local websocket server.
+"""
+
+import unittest
+import contextlib
+import io
+import json
+import socket
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import provision_users  # noqa: E402
+import warm_pool  # noqa: E402
+
+GREETING = b"RFB 003.008\n"
+
+
+class FakeDocker:
+    """Containers with an address each; a container greets viewers once booted."""
+
+    def __init__(self, volumes=()):
+        self.containers = {}
+        self.volumes = set(volumes)
+        self.calls = []
+        self.lock = threading.Lock()
+        self.booted = True
+
+    def run(self, *args, env=None):
+        with self.lock:
+            self.calls.append(args)
+            command = args[0]
+            if command == "ps":
+                return "".join(name + "\n" for name in sorted(self.containers))
+            if command == "run":
+                name = args[args.index("--name") + 1]
+                if name in self.containers:
+                    raise provision_users.DockerError(f"docker run: name {name} is in use")
+                self.volumes.add(args[args.index("-v") + 1].split(":")[0])
+                self.containers[name] = {"ip": f"10.18.0.{len(self.calls)}", "booted": self.booted}
+                return "0123abcd\n"
+            if command == "rename":
+                old, new = args[1:]
+                if old not in self.containers or new in self.containers:
+                    raise provision_users.DockerError(f"docker rename: cannot rename {old}")
+                self.containers[new] = self.containers.pop(old)
+                return ""
+            if command == "inspect":
+                if args[3] not in self.containers:
+                    raise provision_users.DockerError(f"docker inspect: no such object: {args[3]}")
+                return self.containers[args[3]]["ip"] + " \n"
+            if command == "rm":
+                for name in args[1:]:
+                    self.containers.pop(name, None)
+                return ""
+            if args[:2] == ("volume", "ls"):
+                return "".join(name + "\n" for name in sorted(self.volumes))
+            if args[:2] == ("volume", "rm"):
+                self.volumes.difference_update(args[2:])
+            return ""
+
+    def probe(self, host, port):
+        with self.lock:
+            booted = [c["booted"] for c in self.containers.values() if c["ip"] == host]
+        return GREETING if port == 8080 and booted and booted[0] else None
+
+    def count(self, *prefix):
+        return sum(1 for call in self.calls if call[:len(prefix)] == prefix)
+
+
+class FakeWebsockify:
+    """Accepts one websocket upgrade per connection and sends the RFB greeting."""
+
+    def __init__(self, status=b"101 Switching Protocols", same_packet=False):
+        self.status = status
+        self.same_packet = same_packet
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        with contextlib.suppress(OSError):
+            while True:
+                conn, _ = self.server.accept()
+                with conn:
+                    request = b""
+                    while b"\r\n\r\n" not in request:
+                        request += conn.recv(1024)
+                    frame = bytes([0x82, len(GREETING)]) + GREETING
+                    response = b"HTTP/1.1 " + self.status + b"\r\nUpgrade: websocket\r\n\r\n"
+                    if self.same_packet:
+                        conn.sendall(response + frame)
+                    else:
+                        conn.sendall(response)
+                        conn.sendall(frame)
+
+    def close(self):
+        self.server.close()
+
+
+class TestRfbProbe(unittest.TestCase):
+
+    def probe(self, **kw):
+        server = FakeWebsockify(**kw)
+        try:
+            return warm_pool.rfb_banner("127.0.0.1", server.port, timeout=5)
+        finally:
+            server.close()
+
+    def test_greeting_through_websocket(self):
+        self.assertEqual(self.probe(), GREETING)
+        self.assertEqual(self.probe(same_packet=True), GREETING)
+
+    def test_not_ready(self):
+        self.assertIsNone(self.probe(status=b"404 Not Found"))
+        with socket.create_server(("127.0.0.1", 0)) as closed:
+            port = closed.getsockname()[1]
+        self.assertIsNone(warm_pool.rfb_banner("127.0.0.1", port, timeout=1))
+
+
+class PoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.log = self.dir / "first_frame.jsonl"
+        self.docker = FakeDocker()
+        self.pool = warm_pool.WarmPool(self.docker, "s3cret", size=2, probe=self.docker.probe,
+                                       ready_timeout=1.0, poll_interval=0.01, log=self.log)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def log_entries(self):
+        return [json.loads(line) for line in self.log.read_text().splitlines()]
+
+
+class TestWarmPool(PoolTestCase):
+
+    def test_refill_boots_the_missing_containers(self):
+        self.assertEqual(len(self.pool.refill()), 2)
+        self.assertEqual(self.pool.refill(), [])
+        members = self.pool.members()
+        self.assertEqual(len(members), 2)
+        self.assertTrue(all(n.startswith("tikzit_pool_") for n in members))
+        self.assertEqual(sorted(self.docker.volumes), sorted(warm_pool.slot_volume_name(n) for n in members))
+        run = [call for call in self.docker.calls if call[0] == "run"][0]
+        self.assertFalse(any("s3cret" in arg for arg in run))
+
+    def test_claim_renames_a_ready_container(self):
+        self.docker.booted = False
+        booting = self.pool.boot()
+        self.assertIsNone(self.pool.claim("tikzit_alice"))
+        self.docker.booted = True
+        ready = self.pool.boot()
+        self.assertEqual(self.pool.claim("tikzit_alice"), warm_pool.slot_volume_name(ready))
+        self.assertEqual(self.pool.members(), [booting])
+        self.assertIn("tikzit_alice", self.docker.containers)
+        entry, = self.log_entries()
+        self.assertEqual((entry["mode"], entry["container"], entry["ready"]), ("warm", "tikzit_alice", True))
+
+    def test_a_container_is_claimed_once(self):
+        self.pool.boot()
+        with ThreadPoolExecutor(4) as claimers:
+            volumes = list(claimers.map(self.pool.claim, [f"tikzit_user{i}" for i in range(4)]))
+        self.assertEqual(sum(v is not None for v in volumes), 1)
+        self.assertEqual(self.pool.members(), [])
+
+    def test_measure_cleans_up(self):
+        self.pool.boot()
+        self.assertGreaterEqual(self.pool.measure("cold"), 0)
+        self.assertGreaterEqual(self.pool.measure("warm"), 0)
+        self.assertEqual(len(self.pool.members()), 1)
+        self.assertEqual(len(self.docker.containers), 1)
+        self.assertEqual(len(self.docker.volumes), 1)
+        self.assertEqual([e["mode"] for e in self.log_entries()], ["cold", "warm"])
+
+    def test_drain_and_report(self):
+        self.pool.refill()
+        self.assertEqual(len(self.pool.drain()), 2)
+        self.assertEqual((self.docker.containers, self.docker.volumes), ({}, set()))
+        entries = [{"mode": "cold", "seconds": s, "ready": True} for s in (8.0, 9.0, 10.0)]
+        entries += [{"mode": "warm", "seconds": 0.05, "ready": True}, {"mode": "cold", "seconds": 90, "ready": False}]
+        report = warm_pool.format_report(entries)
+        self.assertIn("cold: 4 starts, 1 failed; first frame p50 9.00s", report)
+        self.assertIn("warm: 1 starts, 0 failed; first frame p50 0.05s", report)
+
+    def test_cli(self):
+        env_file = self.dir / ".env"
+        env_file.write_text("VNC_PASSWORD=s3cret\n")
+        argv = ["--env-file", str(env_file), "--log", str(self.log), "--size", "3"]
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(warm_pool.main(argv + ["fill"], self.docker), 0)
+            self.assertEqual(warm_pool.main(argv + ["status"], self.docker), 0)
+            self.assertEqual(warm_pool.main(argv + ["report"]), 0)
+        self.assertIn("Booted 3; the pool has 3 of 3", out.getvalue())
+        # nothing answers at the fake addresses
+        self.assertEqual(out.getvalue().count(": booting"), 3)
+        self.assertEqual(len(self.pool.members()), 3)
+
+
+
+class TestProvisioning(PoolTestCase):
+
+    def provision(self, users, **kw):
+        registry = provision_users.UserRegistry(self.dir / "user_registry.json")
+        outcomes = provision_users.provision(self.docker, users, "s3cret", self.dir / "user_configs", registry,
+                                             warm_pool=self.pool, **kw)
+        self.pool.refill_in_background().result(5)
+        return outcomes, provision_users.UserRegistry(registry.path)
+
+    def test_new_users_get_pool_containers(self):
+        self.pool.refill()
+        slots = {warm_pool.slot_volume_name(n) for n in self.pool.members()}
+        # carol has a data volume from an earlier session, so she starts cold with it
+        self.docker.volumes.add("tikzit_data_carol")
+        outcomes, registry = self.provision(["alice", "bob", "carol", "dave"], jobs=4)
+        self.assertEqual(outcomes["carol"], "created")
+        self.assertEqual(sorted(outcomes.values()), ["claimed", "claimed", "created", "created"])
+        self.assertEqual({registry.volume(u) for u in outcomes if outcomes[u] == "claimed"}, slots)
+        self.assertEqual(registry.volume("carol"), "tikzit_data_carol")
+        # the claimed containers were replaced in the background
+        self.assertEqual(len(self.pool.members()), 2)
+
+    def test_recreated_user_keeps_the_slot_volume(self):
+        self.pool.refill()
+        _, registry = self.provision(["alice"])
+        volume = registry.volume("alice")
+        self.assertTrue(volume.startswith("tikzit_pool_data_"))
+        outcomes, registry = self.provision(["alice"], recreate=True)
+        self.assertEqual(outcomes, {"alice": "recreated"})
+        run = [call for call in self.docker.calls if call[0] == "run" and "tikzit_alice" in call][-1]
+        self.assertIn(f"{volume}:/home/tikzituser/.local/share/tikzit", run)
+
+
+if __name__ == '__main__':
+    unittest.main()
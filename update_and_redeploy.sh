@@ -3,6 +3,14 @@
 
 REGISTRY_URL="registry.digitalocean.com/mgb-uml/tikzit:latest"
 
+# The VNC gateway (scripts/vnc_gateway.py) refuses to start without the secret that
+# signs the session tokens; check before anything is pulled or restarted
+if [ -z "$GATEWAY_SECRET" ] && ! grep -qE '^GATEWAY_SECRET=.+' .env 2>/dev/null; then
+    echo "❌ GATEWAY_SECRET is not set in the environment or .env. Create one with:"
+    echo "   echo \"GATEWAY_SECRET=\$(openssl rand -hex 32)\" >> .env"
+    exit 1
+fi
+
 echo "⬇️ Force-Pulling latest image from Registry..."
 docker pull $REGISTRY_URL
 
@@ -15,6 +23,10 @@ docker run --rm \
   cp -r /src/docs/html/. /target/
 
 echo "🔄 Restarting Infrastructure (Nginx & Default Container)..."
+# nginx reaches the session controller on the host through the tikzit_net gateway
+TIKZIT_NET_GATEWAY=$(docker network inspect --format '{{range .IPAM.Config}}{{.Gateway}} {{end}}' tikzit_net \
+  | awk '{print $1}')
+export TIKZIT_NET_GATEWAY
 docker compose up -d --force-recreate
 
 echo "✅ Update Complete! Docs and Default App are live."
\ No newline at end of file